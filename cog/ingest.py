@@ -0,0 +1,162 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Read new errors from the website's error log into the database.
+
+The log is read from where the last read finished (kept in a .pos file next
+to the log), the errors are added up in memory by their traceback and then
+saved with one insert for all the new errors and one update for each error
+which was seen before.
+"""
+
+import io
+import os
+import fcntl
+import json
+import hashlib
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest, Least
+
+from .parse_errors import parse_stream
+from .models import Error
+
+# How many urls are kept for each error
+URL_LIMIT = 50
+
+def get_position(filename):
+    """Returns the position we last read to and the hash of the log's start"""
+    try:
+        with open(filename + '.pos', 'r') as fhl:
+            data = json.loads(fhl.read())
+            return (data['pos'], data['hash'])
+    except (IOError, ValueError, KeyError):
+        return (0, None)
+
+def set_position(filename, pos, digest):
+    """Save the position we have finished reading the log at"""
+    with open(filename + '.pos', 'w') as fhl:
+        fhl.write(json.dumps({'pos': pos, 'hash': digest}))
+
+def get_digest(filename):
+    """A hash of the start of the log, so a new log file can be spotted"""
+    with open(filename, 'r') as fhl:
+        content = fhl.read(1024)
+    if len(content) == 1024:
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+    return None
+
+def read_errors(filename, pos):
+    """Parse the complete lines after pos, returns the errors and the new position"""
+    with open(filename, 'rb') as fhl:
+        fhl.seek(pos)
+        content = fhl.read()
+    # A line still being written is left for next time
+    content = content[:content.rfind(b'\n') + 1]
+    stream = io.StringIO(content.decode('utf-8', errors='replace'))
+    items = list(parse_stream(stream))
+    if items and not items[-1]['error']:
+        # The last traceback is still being written, so it's read again next time
+        items.pop()
+        content = content[:content.rfind(b'\n[') + 1]
+    return (items, pos + len(content))
+
+def aggregate(items):
+    """Add up the parsed errors by traceback key"""
+    errors = {}
+    for item in items:
+        if not item['error']:
+            continue
+        key = item['key'][:255]
+        if key not in errors:
+            errors[key] = {
+                'traceback': item['traceback'],
+                'urls': [],
+                'name': item['error'][0][:255],
+                'description': '\n'.join(item['error']),
+                'started': item['datetime'],
+                'ended': item['datetime'],
+                'count': 0,
+            }
+        error = errors[key]
+        error['count'] += 1
+        error['started'] = min(error['started'], item['datetime'])
+        error['ended'] = max(error['ended'], item['datetime'])
+        if item['url'] not in error['urls']:
+            error['urls'].append(item['url'])
+    return errors
+
+def merge_urls(old, new):
+    """Add the new urls to the old json list of urls"""
+    try:
+        urls = json.loads(old)
+    except ValueError:
+        urls = []
+    urls += [url for url in new if url not in urls]
+    return json.dumps(urls[-URL_LIMIT:])
+
+@transaction.atomic
+def save_errors(errors):
+    """Save the added up errors, returns the number of new errors"""
+    existing = Error.objects.filter(traceback_id__in=list(errors))\
+        .values_list('pk', 'traceback_id', 'urls')
+    for (pk, key, urls) in existing:
+        error = errors.pop(key)
+        Error.objects.filter(pk=pk).update(
+            count=F('count') + error['count'],
+            started=Least('started', error['started']),
+            ended=Greatest('ended', error['ended']),
+            urls=merge_urls(urls, error['urls']),
+            fixed=None,
+        )
+    Error.objects.bulk_create([Error(
+        traceback_id=key,
+        traceback=json.dumps(error['traceback']),
+        urls=json.dumps(error['urls'][-URL_LIMIT:]),
+        name=error['name'],
+        description=error['description'],
+        started=error['started'],
+        ended=error['ended'],
+        count=error['count'],
+    ) for (key, error) in errors.items()])
+    return len(errors)
+
+def ingest(filename):
+    """Read any new errors in the log into the database, returns the number of errors read"""
+    if not filename or not os.path.isfile(filename):
+        return 0
+    with open(filename, 'r') as lock:
+        # Only one ingest at a time, so no part of the log is read twice
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        (pos, old_digest) = get_position(filename)
+        digest = get_digest(filename)
+        # A different or shorter log file is read from the start (a log too short
+        # to have a digest last time is only checked for being shorter)
+        if old_digest and digest != old_digest or pos > os.path.getsize(filename):
+            pos = 0
+        (items, pos) = read_errors(filename, pos)
+        errors = aggregate(items)
+        count = sum(error['count'] for error in errors.values())
+        with transaction.atomic():
+            save_errors(errors)
+            # The errors aren't saved unless the position is too
+            set_position(filename, pos, digest)
+    return count
@@ -0,0 +1,73 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Time how fast error logs are parsed, using a made up log.
+"""
+
+import io
+import time
+
+from django.core.management.base import BaseCommand
+from cog.parse_errors import parse_stream
+
+ENTRY = """[{day:02d}/Oct/2019 12:{min:02d}:01] ERROR [django.request:135] Internal Server Error: /{url}/
+Traceback (most recent call last):
+  File "/usr/lib/python3.6/site-packages/django/core/handlers/exception.py", line 41, in inner
+    response = get_response(request)
+  File "/var/www/inkscape/{url}/views.py", line {line}, in get_context_data
+    data = super().get_context_data(**kwargs)
+
+During handling of the above exception, another exception occurred:
+
+Traceback (most recent call last):
+  File "/var/www/inkscape/{url}/models.py", line {line}, in save
+    self.update()
+django.core.exceptions.ValidationError: Invalid value for {url}
+  continued explanation of the error
+"""
+
+def synthetic_log(errors):
+    """Returns a made up error log with this many errors in it"""
+    return ''.join(ENTRY.format(day=1 + num % 28, min=num % 60,
+                                url='app%d' % (num % 7), line=num % 300)
+                   for num in range(errors))
+
+class Command(BaseCommand):
+    """Benchmark the error log parser"""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--errors', '-n', default=20000, type=int,
+            help='Number of errors in the made up log (default 20000).')
+        parser.add_argument('--repeat', '-r', default=3, type=int,
+            help='Best of this many runs (default 3).')
+
+    def handle(self, *args, **options):
+        log = synthetic_log(options['errors'])
+        lines = log.count('\n')
+        best = None
+        for _ in range(max(options['repeat'], 1)):
+            start = time.perf_counter()
+            count = sum(1 for _ in parse_stream(io.StringIO(log)))
+            taken = time.perf_counter() - start
+            best = taken if best is None else min(best, taken)
+        print("Parsed {} errors, {} lines in {:.3f}s: {:,.0f} lines/second".format(
+            count, lines, best, lines / best))
@@ -0,0 +1,48 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Read new errors from the website's error log into the database.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from cog.ingest import ingest
+
+class Command(BaseCommand):
+    """Ingest the error log"""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--loop', '-l', default=False, action='store_true',
+            help='Keep running and read errors as they are logged.')
+        parser.add_argument('--every', '-e', default=60, type=int,
+            help='Seconds to wait between reads when looping (default 60).')
+
+    def handle(self, *args, **options):
+        while True:
+            count = ingest(getattr(settings, 'ERROR_FILE', None))
+            if options['verbosity'] > 1:
+                print("Read {} errors from the log".format(count))
+            if not options['loop']:
+                break
+            time.sleep(max(options['every'], 1))
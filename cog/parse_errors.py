@@ -12,6 +12,7 @@ and sort them by most frequent.
 import re
 import hashlib
 import logging
+from functools import lru_cache
 
 from datetime import datetime
 from django.utils import timezone
@@ -32,6 +33,27 @@ STATES = (
     ('CONT', re.compile(r'(?P<line>.*)')),
 )
 
+# Literal text which lines of these states start with, this is checked
+# before trying the state's regular expression.
+PREFIXES = {
+    'URL': '[',
+    'OTHER': 'During handling',
+    'FIXED': 'Traceback',
+    'FILE': '  File "',
+    'LINE': '    ',
+}
+# The states which are allowed to follow each state
+FOLLOWS = {
+    None: ('URL',),
+    'URL': ('FIXED',),
+    'FIXED': ('FILE',),
+    'OTHER': ('FIXED',),
+    'FILE': ('LINE', 'FILE'),
+    'LINE': ('URL', 'FILE', 'ERR', 'OTHER'),
+    'ERR': ('URL', 'CONT', 'OTHER'),
+    'CONT': ('URL', 'CONT', 'OTHER'),
+}
+
 def get_datetime(day, mon, year, hour, mint, sec, **_): # pylint: disable=too-many-arguments
     """Process the time stamp into a real datetime"""
     month = MONTHS.index(mon) + 1
@@ -39,58 +61,74 @@ def get_datetime(day, mon, year, hour, mint, sec, **_): # pylint: disable=too-ma
                     int(hour), int(mint), int(sec),
                     tzinfo=pytz.timezone(timezone.get_default_timezone_name()))
 
-def get_line_state(line, allowed, x=0):
-    """Return the lines current state (it's type) and the data parsed."""
-    # Ignore empty lines
-    if not line.strip():
-        return (None, None)
-    found = []
-    for sta, rex in STATES:
-        mat = rex.match(line)
-        if mat:
-            if sta not in allowed:
-                found.append(sta)
-                continue
-            return sta, mat.groupdict()
+@lru_cache(maxsize=None)
+def get_matchers(allowed):
+    """Returns the tests for only the allowed states, in the order of STATES"""
+    return tuple((sta, PREFIXES.get(sta, ''), rex.match)
+                 for sta, rex in STATES if sta in allowed)
+
+def classify(line, matchers, allowed, x=0):
+    """Return the first of the matchers to match the line and the data parsed."""
+    for sta, prefix, match in matchers:
+        if line.startswith(prefix):
+            mat = match(line)
+            if mat:
+                return sta, mat.groupdict()
+    # Nothing allowed matched, find out what the line was for the log
+    found = [sta for sta, rex in STATES if rex.match(line)]
     if found:
         logging.warning("Unexpected line type %s (expected %s): line: %d", found, allowed, x)
     else:
         logging.error("Unknown line: %s", line)
     return (None, None)
 
+def get_line_state(line, allowed, x=0):
+    """Return the lines current state (it's type) and the data parsed."""
+    # Ignore empty lines
+    if not line.strip():
+        return (None, None)
+    return classify(line, get_matchers(tuple(allowed)), allowed, x=x)
+
+def finish_item(item):
+    """Add the traceback key to a fully parsed error"""
+    key = tuple(tb['fn'] + ':' + tb['line'] for tb in item['traceback'])
+    key = '|'.join(key).encode('utf-8')
+    item['key'] = hashlib.md5(key).hexdigest()[:255]
+    return item
+
 def parse_stream(stream):
     """Parse the given stream for errors and yield as we find them"""
-    allowed = ('URL',)
+    matchers = dict((sta, get_matchers(allowed)) for sta, allowed in FOLLOWS.items())
+    allowed = FOLLOWS[None]
+    current = matchers[None]
     item = {}
     for x, line in enumerate(stream):
-        (state, data) = get_line_state(line.rstrip(), allowed, x=x)
+        line = line.rstrip()
+        # Ignore empty lines
+        if not line:
+            continue
+        (state, data) = classify(line, current, allowed, x=x)
+        if state is None:
+            continue
+        allowed = FOLLOWS[state]
+        current = matchers[state]
 
         if state == 'URL':
-            allowed = ('FIXED',)
             if item:
-                key = tuple(tb['fn'] + ':' + tb['line'] for tb in item['traceback'])
-                key = '|'.join(key).encode('utf-8')
-                item['key'] = hashlib.md5(key).hexdigest()[:255]
-                yield item
+                yield finish_item(item)
             item = {
                 'url': data['url'],
                 'datetime': get_datetime(**data),
                 'traceback': [],
                 'error': []
             }
-        elif state == 'FIXED':
-            allowed = ('FILE',)
-        elif state == 'OTHER':
-            allowed = ('FIXED',)
         elif state == 'FILE':
-            allowed = ('LINE', 'FILE')
             item['traceback'].append(data)
         elif state == 'LINE':
-            allowed = ('URL', 'FILE', 'ERR', 'OTHER', )
             item['traceback'][-1]['content'] = data['line']
         elif state == 'ERR':
-            allowed = ('URL', 'CONT', 'OTHER')
             item['error'] = [data['err']]
         elif state == 'CONT':
-            allowed = ('URL', 'CONT', 'OTHER')
             item['error'].append(data['line'])
+    if item:
+        yield finish_item(item)
@@ -5,48 +5,78 @@
 Limit the rate emails are sent to admins about errors
 """
 
+import time
 import traceback
 from hashlib import md5
-from datetime import datetime, timedelta
+from threading import Lock
+from collections import OrderedDict
 
 from django.conf import settings
 from django.core.cache import cache
 
+def fingerprint(record):
+    """A key for the place the error happened, without formatting the traceback"""
+    if not record.exc_info:
+        return '%s:%s' % (record.pathname, record.lineno)
+    (cls, _, tbk) = record.exc_info
+    frames = ['%s:%d' % (frame.f_code.co_filename, lineno)
+              for (frame, lineno) in traceback.walk_tb(tbk)]
+    frames.append(getattr(cls, '__name__', str(cls)))
+    return md5('|'.join(frames).encode('utf-8')).hexdigest()
+
 class RateLimitFilter(object): # pylint: disable=too-few-public-methods
     """Limit the number of errors before skipping messages"""
-    _errors = {}
+    def __init__(self):
+        # Tested the first time an error is filtered, not when logging is set up
+        self.use_cache = None
+        self._errors = OrderedDict()
+        self._lock = Lock()
 
     def filter(self, record):
         """Filter the given record"""
-        trace = '\n'.join(traceback.format_exception(*record.exc_info))
-
-        # Track duplicate errors
-        duplicate = False
         rate = getattr(settings, 'ERROR_RATE_LIMIT', 10)  # seconds
-        if rate > 0:
-            key = md5(trace.encode('utf-8')).hexdigest()
-            prefix = getattr(settings, 'ERROR_RATE_CACHE_PREFIX', 'ERROR_RATE')
+        if rate <= 0:
+            return True
+
+        key = fingerprint(record)
+        prefix = getattr(settings, 'ERROR_RATE_CACHE_PREFIX', 'ERROR_RATE')
+        if self.use_cache is None:
+            self.use_cache = self.test_cache(prefix)
 
-            # Test if the cache works
+        if self.use_cache:
             cache_key = '%s_%s' % (prefix, key)
-            try:
-                cache.set(prefix, 1, 1)
-                use_cache = cache.get(prefix) == 1
-            except KeyError:
-                use_cache = False
-
-            if use_cache:
-                duplicate = cache.get(cache_key) == 1
-                cache.set(cache_key, 1, rate)
-            else:
-                min_date = datetime.now() - timedelta(seconds=rate)
-                max_keys = getattr(settings, 'ERROR_RATE_KEY_LIMIT', 100)
-                duplicate = (key in self._errors and self._errors[key] >= min_date)
-                self._errors = dict(list(
-                    filter(lambda x: x[1] >= min_date,
-                           sorted(self._errors.items(), key=lambda x: x[1]))
-                    )[0-max_keys:])
-                if not duplicate:
-                    self._errors[key] = datetime.now()
-
-        return not duplicate
+            # add() only succeeds for the first error in each period
+            if cache.add(cache_key, 1, rate):
+                return True
+            if cache.get(cache_key) is not None:
+                return False
+            # The period may have ended between add() and get(), so try again
+            if cache.add(cache_key, 1, rate):
+                return True
+            # Nothing was stored, the cache has stopped working
+            self.use_cache = False
+        return self.add_local(key, rate)
+
+    @staticmethod
+    def test_cache(prefix):
+        """Test if the cache works"""
+        try:
+            cache.set(prefix, 1, 1)
+            return cache.get(prefix) == 1
+        except KeyError:
+            return False
+
+    def add_local(self, key, rate):
+        """Remember the error in this process, returns False if it's a duplicate"""
+        now = time.monotonic()
+        max_keys = getattr(settings, 'ERROR_RATE_KEY_LIMIT', 100)
+        with self._lock:
+            # Errors are kept in the order they expire, so only the oldest are checked
+            while self._errors and next(iter(self._errors.values())) <= now:
+                self._errors.popitem(last=False)
+            if key in self._errors:
+                return False
+            self._errors[key] = now + rate
+            if len(self._errors) > max_keys:
+                self._errors.popitem(last=False)
+        return True
@@ -0,0 +1,169 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test reading the error log into the database
+"""
+
+import os
+import json
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+from django.utils.timezone import utc
+
+from extratest.base import ExtraTestCase
+
+from cog.ingest import aggregate, merge_urls, save_errors, ingest, URL_LIMIT
+from cog.models import Error
+
+START = datetime(2020, 2, 1, 12, 0, 0, tzinfo=utc)
+
+LOG = """[{day}/Feb/2020 12:{mint}:00] ERROR [django.request:135] Internal Server Error: {url}
+Traceback (most recent call last):
+  File "/site/forums/views.py", line {line}, in get
+    return thing()
+ValueError: {error}
+"""
+
+def item(key='one', url='/a/', minutes=0, error='ValueError: bad'):
+    """A parsed error, as parse_stream gives"""
+    return {
+        'key': key, 'url': url, 'datetime': START + timedelta(minutes=minutes),
+        'traceback': [{'fn': 'views.py', 'line': '10', 'func': 'get', 'content': 'go()'}],
+        'error': [error, 'More detail'] if error else [],
+    }
+
+class AggregateTests(ExtraTestCase):
+    """Errors are added up by their traceback"""
+    def test_aggregate(self):
+        """Counts, times and urls are kept for each traceback"""
+        errors = aggregate([
+            item(minutes=5), item(url='/b/', minutes=1), item(minutes=9),
+            item(key='two', url='/c/'), item(key='three', error=None),
+        ])
+        self.assertEqual(sorted(errors), ['one', 'two'])
+        error = errors['one']
+        self.assertEqual(error['count'], 3)
+        self.assertEqual(error['started'], START + timedelta(minutes=1))
+        self.assertEqual(error['ended'], START + timedelta(minutes=9))
+        self.assertEqual(error['urls'], ['/a/', '/b/'])
+        self.assertEqual(error['name'], 'ValueError: bad')
+        self.assertEqual(error['description'], 'ValueError: bad\nMore detail')
+        self.assertEqual(errors['two']['count'], 1)
+
+    def test_long_keys(self):
+        """Keys and names are cut to fit the database"""
+        errors = aggregate([item(key='k' * 300, error='E' * 300)])
+        self.assertEqual(list(errors), ['k' * 255])
+        self.assertEqual(len(errors['k' * 255]['name']), 255)
+
+    def test_merge_urls(self):
+        """New urls are added to the end, without repeats"""
+        self.assertEqual(json.loads(merge_urls('["/a/", "/b/"]', ['/b/', '/c/'])),
+                         ['/a/', '/b/', '/c/'])
+        self.assertEqual(json.loads(merge_urls('', ['/a/'])), ['/a/'])
+        self.assertEqual(json.loads(merge_urls('not json', ['/a/'])), ['/a/'])
+
+    def test_merge_urls_limit(self):
+        """Only the latest urls are kept"""
+        urls = ['/%d/' % num for num in range(URL_LIMIT + 5)]
+        merged = json.loads(merge_urls(json.dumps(urls[:10]), urls[10:]))
+        self.assertEqual(merged, urls[-URL_LIMIT:])
+
+
+class SaveErrorsTests(ExtraTestCase):
+    """Added up errors are saved together"""
+    def test_new_errors(self):
+        """New errors are created"""
+        self.assertEqual(save_errors(aggregate([item(), item(minutes=2), item(key='two')])), 2)
+        error = Error.objects.get(traceback_id='one')
+        self.assertEqual(error.count, 2)
+        self.assertEqual((error.started, error.ended), (START, START + timedelta(minutes=2)))
+        self.assertEqual(json.loads(error.urls), ['/a/'])
+        self.assertEqual(json.loads(error.traceback)[0]['fn'], 'views.py')
+
+    def test_existing_errors(self):
+        """Errors seen before are added to, and are no longer fixed"""
+        save_errors(aggregate([item(minutes=5)]))
+        Error.objects.update(fixed=START)
+        with self.assertNumQueries(4):
+            # A savepoint, find the existing, update one and insert none
+            created = save_errors(aggregate([item(url='/b/', minutes=1), item(minutes=9)]))
+        self.assertEqual(created, 0)
+        error = Error.objects.get()
+        self.assertEqual(error.count, 3)
+        self.assertEqual((error.started, error.ended),
+                         (START + timedelta(minutes=1), START + timedelta(minutes=9)))
+        self.assertEqual(json.loads(error.urls), ['/a/', '/b/'])
+        self.assertIsNone(error.fixed)
+
+
+class IngestTests(ExtraTestCase):
+    """The log is read from where the last read finished"""
+    def setUp(self):
+        super(IngestTests, self).setUp()
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.log = os.path.join(path, 'django.log')
+
+    def write(self, text, mode='a'):
+        """Add to the log file"""
+        with open(self.log, mode) as fhl:
+            fhl.write(text)
+
+    def error(self, mint=0, url='/a/', error='bad', line=10):
+        """A logged error, the line makes a different traceback"""
+        return LOG.format(day='01', mint='%02d' % mint, url=url, error=error, line=line)
+
+    def test_missing_log(self):
+        """Nothing is read without a log"""
+        self.assertEqual(ingest(self.log), 0)
+        self.assertEqual(ingest(None), 0)
+
+    def test_ingest(self):
+        """Each error is read once"""
+        self.write(self.error(1) + self.error(2, url='/b/') + self.error(3, error='other', line=20))
+        self.assertEqual(ingest(self.log), 3)
+        self.assertEqual(ingest(self.log), 0)
+        self.assertEqual(sorted(Error.objects.values_list('name', 'count')),
+                         [('ValueError: bad', 2), ('ValueError: other', 1)])
+        self.write(self.error(4))
+        self.assertEqual(ingest(self.log), 1)
+        self.assertEqual(Error.objects.get(name='ValueError: bad').count, 3)
+
+    def test_partial_error(self):
+        """An error still being written is left for next time"""
+        text = self.error(2)
+        for cut in (-5, -20, -70):
+            self.write(self.error(1) + text[:cut], mode='w')
+            self.assertEqual(ingest(self.log), 1)
+            self.write(text[cut:])
+            self.assertEqual(ingest(self.log), 1)
+            os.unlink(self.log + '.pos')
+        self.assertEqual(Error.objects.get().count, 6)
+
+    def test_new_log(self):
+        """A rotated log is read from the start"""
+        self.write(self.error(1) * 20)
+        self.assertEqual(ingest(self.log), 20)
+        self.write(self.error(1, error='rotated', line=20) * 20, mode='w')
+        self.assertEqual(ingest(self.log), 20)
+        self.assertEqual(Error.objects.get(name='ValueError: rotated').count, 20)
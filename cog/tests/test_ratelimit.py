@@ -0,0 +1,128 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+"""
+Test the rate limit on error emails
+"""
+
+import sys
+import logging
+from unittest.mock import patch
+
+from django.core.cache import cache
+
+from extratest.base import ExtraTestCase
+
+from cog.ratelimit import RateLimitFilter, fingerprint
+
+def record(exc_info=None, lineno=10):
+    """Returns a log record for an error"""
+    return logging.LogRecord('django.request', logging.ERROR, '/app/views.py',
+                             lineno, 'Internal Server Error', (), exc_info)
+
+def failure(message, cls=ValueError):
+    """Returns the exc_info for an error raised here"""
+    try:
+        raise cls(message)
+    except Exception: # pylint: disable=broad-except
+        return sys.exc_info()
+
+class Clock(object):
+    """A time.time() which only moves when told to"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class RateLimitTests(ExtraTestCase):
+    """Only the first of the same errors in each period is sent"""
+    def setUp(self):
+        super(RateLimitTests, self).setUp()
+        cache.clear()
+        self.limit = RateLimitFilter()
+
+    def test_fingerprint(self):
+        """Errors raised in the same place share a key, whatever their message"""
+        self.assertEqual(fingerprint(record()), '/app/views.py:10')
+        self.assertNotEqual(fingerprint(record(lineno=11)), fingerprint(record()))
+
+        errors = [failure(message) for message in ('one', 'two')]
+        self.assertEqual(fingerprint(record(errors[0])), fingerprint(record(errors[1])))
+        self.assertNotEqual(fingerprint(record(errors[0])),
+                            fingerprint(record(failure('one', cls=KeyError))))
+        try:
+            raise ValueError('one')
+        except ValueError:
+            elsewhere = sys.exc_info()
+        self.assertNotEqual(fingerprint(record(errors[0])), fingerprint(record(elsewhere)))
+
+    def test_fixed_window(self):
+        """Repeated errors don't make the period any longer"""
+        clock = Clock()
+        with self.settings(ERROR_RATE_LIMIT=10):
+            with patch('django.core.cache.backends.locmem.time.time', clock):
+                self.assertTrue(self.limit.filter(record()))
+                clock.now += 5
+                self.assertFalse(self.limit.filter(record()))
+                self.assertTrue(self.limit.filter(record(lineno=11)))
+                clock.now += 6
+                self.assertTrue(self.limit.filter(record()))
+                self.assertFalse(self.limit.filter(record()))
+        self.assertTrue(self.limit.use_cache)
+
+    def test_expired_between(self):
+        """A period ending between add() and get() doesn't turn off the cache"""
+        with patch.object(cache, 'add', side_effect=[False, True]):
+            with patch.object(cache, 'get', return_value=None):
+                self.limit.use_cache = True
+                self.assertTrue(self.limit.filter(record()))
+        self.assertTrue(self.limit.use_cache)
+
+    def test_broken_cache(self):
+        """Errors are limited in the process when the cache stops working"""
+        with patch.object(cache, 'add', return_value=False):
+            with patch.object(cache, 'get', return_value=None):
+                self.limit.use_cache = True
+                self.assertTrue(self.limit.filter(record()))
+                self.assertFalse(self.limit.use_cache)
+                self.assertFalse(self.limit.filter(record()))
+
+    def test_local_expiry(self):
+        """Errors remembered in the process are forgotten after the period"""
+        clock = Clock()
+        with patch('cog.ratelimit.time.monotonic', clock):
+            self.assertTrue(self.limit.add_local('a', 10))
+            clock.now += 5
+            self.assertTrue(self.limit.add_local('b', 10))
+            self.assertFalse(self.limit.add_local('a', 10))
+            clock.now += 5
+            self.assertTrue(self.limit.add_local('a', 10))
+            self.assertFalse(self.limit.add_local('b', 10))
+            self.assertEqual(list(self.limit._errors), ['b', 'a'])
+
+    def test_local_limit(self):
+        """Only so many errors are remembered, the oldest are forgotten first"""
+        with self.settings(ERROR_RATE_KEY_LIMIT=2):
+            for key in ('a', 'b', 'c'):
+                self.assertTrue(self.limit.add_local(key, 60))
+            self.assertEqual(list(self.limit._errors), ['b', 'c'])
+            self.assertFalse(self.limit.add_local('c', 60))
+            self.assertTrue(self.limit.add_local('a', 60))
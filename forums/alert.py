@@ -20,14 +20,30 @@
 """
 Subscriptions and alerts for forums
 """
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Model
+from django.utils import translation
+from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 from django import forms
 
 from alerts.base import BaseAlert
-from alerts.models import AlertSubscription, UserAlert
+from alerts.models import (
+    AlertSubscription, UserAlert, UserAlertSetting, UserAlertObject, UserAlertValue,
+)
+
+from inkscape.utils import bulk_insert
 
 from .models import Forum, ForumTopic
 
+# How many alert emails are sent over each mail connection
+EMAIL_BATCH = 100
+
 class ForumAlert(BaseAlert):
     """
     Allow users to subscribe to a whole forum (lots of messages!)
@@ -73,20 +89,92 @@ class ForumTopicAlert(BaseAlert):
 
     def post_send(self, *alerts, **kwargs):
         """Over-ride to add forum subscribers and remove own user from list."""
-        alerts = list(alerts)
+        alerts = [alert for alert in alerts if alert]
         forum = getattr(kwargs['instance'], 'forum', None)
         if forum is None:
             return super().post_send(*alerts, **kwargs)
-        users = [alert.user for alert in alerts]
-        for sub in ForumAlert.get_alert_type().subscriptions.filter(target=forum.pk):
-            if sub.user in users:
-                continue
-            if self._filter_subscriber(sub.user, kwargs, 'any'):
-                ret = self.alert_type.send_to(sub.user, **kwargs)
-                if ret and isinstance(ret, list):
-                    alerts += ret
+        subs = ForumAlert.get_alert_type().subscriptions.filter(target=forum.pk)
+        users = get_user_model().objects.filter(pk__in=subs.values('user_id'))\
+            .exclude(pk__in=[alert.user_id for alert in alerts])
+        alerts += self.send_to_many(users, kwargs)
         return super().post_send(*alerts, **kwargs)
 
+    def send_to_many(self, users, kwargs):
+        """
+        Like alert_type.send_to for a lot of users at once (including the
+        'once' check). Their settings are loaded together, the alerts are made
+        with bulk_create and the emails are sent over one connection for each
+        batch. Returns the new alerts.
+        """
+        alert_type = self.alert_type
+        if not alert_type.enabled:
+            return []
+        if alert_type.group_id:
+            users = users.filter(groups=alert_type.group_id)
+        if 'instance' in kwargs and 'once' in kwargs:
+            # Skip users who haven't seen their last alert about the instance
+            users = users.exclude(pk__in=UserAlert.objects.filter(
+                alert=alert_type, objs__o_id=kwargs['instance'].pk, objs__name='instance',
+                deleted__isnull=True, viewed__isnull=True).values('user_id'))
+        users = list(users)
+        config = dict((setting.user_id, setting) for setting in
+                      UserAlertSetting.objects.filter(alert=alert_type, user__in=users))
+        for user in users:
+            if user.pk not in config:
+                # The same defaults as alert settings which were never saved
+                config[user.pk] = UserAlertSetting(
+                    user_id=user.pk, alert_id=alert_type.pk,
+                    owner=alert_type.subscribe_own, email=alert_type.default_email,
+                    irc=alert_type.default_irc, batch=alert_type.default_batch)
+        users = [user for user in users if self.get_filter_subscriber(
+            user, config[user.pk].get_custom_settings(), kwargs, 'any')]
+        if not users:
+            return []
+
+        alerts = bulk_insert(UserAlert, [UserAlert(user=user, alert=alert_type) for user in users])
+
+        self.bulk_values(alerts, kwargs)
+        self.send_emails([(alert, config[alert.user_id]) for alert in alerts], kwargs)
+        return alerts
+
+    @staticmethod
+    def bulk_values(alerts, kwargs):
+        """Save the kwargs for every alert, as alert.add_value would"""
+        objs, values = [], []
+        for (name, value) in kwargs.items():
+            items = [(name, value)]
+            if isinstance(value, (tuple, list)) and name[0] != '@':
+                items = [('@' + name, item) for item in value]
+            for (key, item) in items:
+                for alert in alerts:
+                    if isinstance(item, Model):
+                        objs.append(UserAlertObject(alert_id=alert.pk, name=key, o_id=item.pk,
+                                                    table=ContentType.objects.get_for_model(item)))
+                    else:
+                        values.append(UserAlertValue(alert_id=alert.pk, name=key, target=str(item)))
+        UserAlertObject.objects.bulk_create(objs)
+        UserAlertValue.objects.bulk_create(values)
+
+    def send_emails(self, alerts, kwargs):
+        """Send the emails (and irc) for the new alerts in batches"""
+        emails = [(alert, setting) for (alert, setting) in alerts
+                  if setting.email and setting.batch is None]
+        viewed = []
+        for start in range(0, len(emails), EMAIL_BATCH):
+            with get_connection() as connection:
+                for (alert, _) in emails[start:start + EMAIL_BATCH]:
+                    data = defaultdict(list, alert=alert, site=settings.SITE_ROOT)
+                    data.update(kwargs)
+                    with translation.override(alert.user.language or 'en'):
+                        if self.send_email(alert.user.email, data, connection=connection):
+                            viewed.append(alert.pk)
+        UserAlert.objects.filter(pk__in=viewed).update(viewed=now())
+
+        for (alert, setting) in alerts:
+            if setting.irc:
+                # The new alert is passed, as UserAlert.send_irc_msg does
+                self.send_irc_msg(alert)
+
     @classmethod
     def auto_subscribe(cls, user, topic):
         """Add the user to the topic"""
@@ -26,7 +26,8 @@ from importlib import import_module
 from django.utils.functional import cached_property
 from django.conf import settings
 from django.apps import AppConfig
-from django.db.models.signals import post_save
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import pre_save, post_save, post_delete
 
 def post_create(model, func):
     """Signal wrapper around post_save that calls on create only"""
@@ -54,12 +55,31 @@ class ForumsConfig(AppConfig):
         return ContentType.objects.get_for_model(ForumTopic).pk
 
     def ready(self):
-        from .models import Forum, ForumTopic
-        from django_comments.models import Comment
+        from .models import Forum, ForumTopic, BannedWords, CommentAttachment, UserFlag
+        from .fragments import comment_changed, user_changed
+        from .mixins import purgitory_changed
+        from django_comments.models import Comment, CommentFlag
+        from django.contrib.auth import get_user_model
 
+        pre_save.connect(self.presave_comment, sender=Comment, weak=False)
         post_save.connect(self.save_comment, sender=Comment, weak=False)
+        post_delete.connect(self.delete_comment, sender=Comment, weak=False)
+        post_save.connect(self.save_attachment, sender=CommentAttachment, weak=False)
+        post_delete.connect(self.save_attachment, sender=CommentAttachment, weak=False)
         post_create(Forum, self.new_forum)
 
+        # Rendered comments are cached until these change
+        for model in (Comment, CommentFlag, CommentAttachment):
+            post_save.connect(comment_changed, sender=model, weak=False)
+            post_delete.connect(comment_changed, sender=model, weak=False)
+        post_save.connect(purgitory_changed, sender=Comment, weak=False)
+        post_delete.connect(purgitory_changed, sender=Comment, weak=False)
+        for model in (get_user_model(), UserFlag):
+            post_save.connect(user_changed, sender=model, weak=False)
+            post_delete.connect(user_changed, sender=model, weak=False)
+        post_save.connect(BannedWords.objects.changed, sender=BannedWords, weak=False)
+        post_delete.connect(BannedWords.objects.changed, sender=BannedWords, weak=False)
+
         topic_qset = ForumTopic.objects.select_related('forum')
         app = self
 
@@ -104,27 +124,62 @@ class ForumsConfig(AppConfig):
             comments = Comment.objects.filter(content_type=instance.content_type)
             for comment in comments.order_by('-submit_date'):
                 if comment.object_pk not in done:
-                    self.create_comment(comment)
+                    topic = self.create_comment(comment)
+                    if topic is not None:
+                        topic.refresh_meta_data()
                     done.append(comment.object_pk)
+            instance.refresh_meta_data()
+
+    @staticmethod
+    def presave_comment(sender, instance, **kw):
+        """Remember if the comment was removed, so moderation can be counted"""
+        if not instance._state.adding:
+            instance._was_removed = sender.objects.filter(pk=instance.pk)\
+                .values_list('is_removed', flat=True).first()
 
     def save_comment(self, instance, created=False, **kw):
         """Called when any comment is saved"""
+        from .models import QueuedAlert
         if created:
-            self.create_comment(instance, **kw)
+            topic = self.create_comment(instance, **kw)
+            if topic is not None:
+                topic.add_posts(0 if instance.is_removed else 1, instance)
+        else:
+            topic = instance.get_topic()
+            was_removed = instance.__dict__.pop('_was_removed', instance.is_removed)
+            if topic is not None and was_removed is not None \
+                  and instance.is_removed != was_removed:
+                topic.add_posts(-1 if instance.is_removed else 1)
 
-        if instance.user:
+        # The alert is focused on topics, not comments, it's sent by send_forum_alerts
+        if topic is not None:
+            QueuedAlert.objects.create(topic=topic, comment=instance,
+                                       action='new' if created else 'edit')
+
+    @staticmethod
+    def delete_comment(instance, **kw):
+        """Called when any comment is deleted"""
+        if not instance.is_removed:
             topic = instance.get_topic()
             if topic is not None:
-                topic.refresh_meta_data()
-
-        # The alert is focused on topics, not comments
-        from .alert import ForumTopicAlert
-        alert = ForumTopicAlert.get_alert_type()
-        action = 'new' if created else 'edit'
-        alert.call(instance=instance.get_topic(), comment=instance, action=action)
+                topic.add_posts(-1)
+
+    @staticmethod
+    def save_attachment(instance, created=None, **kw):
+        """Called when an attachment is added or deleted"""
+        try:
+            topic = instance.comment.get_topic()
+        except ObjectDoesNotExist:
+            return
+        if topic is None:
+            return
+        if created:
+            type(topic).objects.filter(pk=topic.pk).update(has_attachments=True)
+        elif created is None:
+            topic.refresh_attachments()
 
     def create_comment(self, instance, **kw):
-        """Called when a new comment has been saved"""
+        """Called when a new comment has been saved, returns the topic"""
         from .models import Forum, ForumTopic
         defaults = {
             'subject': str(instance.content_object),
@@ -138,7 +193,4 @@ class ForumsConfig(AppConfig):
             except ForumTopic.MultipleObjectsReturned:
                 continue
 
-        topic = instance.get_topic()
-        if topic is not None:
-            topic.refresh_meta_data(instance)
-            topic.forum.refresh_meta_data(instance)
+        return instance.get_topic()
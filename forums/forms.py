@@ -122,18 +122,12 @@ class AttachmentMixin(object):
         """Check if the comment has been banned"""
         # Append a cleaned version of the title to itself (to capture symbol mad items)
         title = title + ' ' + ascii_whitewash(title)
-        censor = False
-        for bwd in BannedWords.objects.all():
-            if (new_user or not bwd.new_user) and (
-                    (bwd.in_title and bwd.phrase in title)
-                 or (bwd.in_body and bwd.phrase in body)):
-                bwd.found_count += 1
-                bwd.save()
-                if bwd.ban_user:
-                    self.user.forum_flags.instant_ban(self.user)
-                    raise ValidationError("Instant ban! Please contact the moderators for help.")
-                censor = True
-        if censor:
+        found = BannedWords.objects.phrases().find(title, body, new_user=new_user)
+        if found:
+            BannedWords.objects.found(found)
+            if any(bwd.ban_user for bwd in found):
+                self.user.forum_flags.instant_ban(self.user)
+                raise ValidationError("Instant ban! Please contact the moderators for help.")
             raise ValidationError(_("Post has been blocked."))
 
 
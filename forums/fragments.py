@@ -0,0 +1,99 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Rendered comment fragments for forum threads.
+
+Each comment and each user has a version in the cache which is changed
+whenever anything shown in the comment changes (edits, emotes, attachments,
+user flags). The version is part of the key of the rendered comment, so
+changed comments are simply rendered again.
+"""
+
+import time
+import hashlib
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.utils import translation, timezone
+
+CACHE = caches['default']
+# Comments newer than a day show a relative time, so are kept only briefly
+FRAGMENT_TIMEOUT = 24 * 3600
+FRAGMENT_RECENT = 60
+# Users are saved with these on every visit, but they aren't shown in comments
+USER_ACTIVITY = frozenset(['last_seen', 'visits', 'last_login'])
+
+def _version_key(kind, pk):
+    return 'forums:%s-version:%s' % (kind, pk)
+
+def touch(kind, *pks):
+    """Give new versions to these comments or users, e.g. touch('comment', 4)"""
+    version = str(time.time())
+    CACHE.set_many(dict((_version_key(kind, pk), version) for pk in pks), None)
+
+def get_versions(comments):
+    """Return the versions for each comment and its user, by cache key"""
+    keys = set(_version_key('comment', comment.pk) for comment in comments)
+    keys |= set(_version_key('user', comment.user_id) for comment in comments)
+    versions = CACHE.get_many(keys)
+    missing = dict((key, str(time.time())) for key in keys if key not in versions)
+    if missing:
+        # A lost version must never be taken as the one a fragment was made with
+        CACHE.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+def viewer_role(user, comment):
+    """The comment is rendered differently for each of these roles"""
+    if not user.is_authenticated():
+        return 'anon'
+    role = 'mod' if user.is_moderator() else 'user'
+    if comment.user_id == user.pk:
+        role += '-own'
+    return role
+
+def fragment_key(comment, versions, role, path):
+    """Return the cache key for this rendered comment"""
+    parts = (
+        comment.pk, comment.position, role, path,
+        versions[_version_key('comment', comment.pk)],
+        versions[_version_key('user', comment.user_id)],
+        translation.get_language(), timezone.get_current_timezone_name(),
+    )
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode('utf8'))
+    return 'forums:comment:%d:%s' % (comment.pk, digest.hexdigest())
+
+def fragment_timeout(comment):
+    """How long this comment's rendering can be kept for"""
+    if timezone.now() - comment.submit_date < timedelta(days=1):
+        return FRAGMENT_RECENT
+    return FRAGMENT_TIMEOUT
+
+def comment_changed(instance, **_):
+    """Signal receiver for comments and anything attached to them"""
+    comment_id = getattr(instance, 'comment_id', instance.pk)
+    if comment_id:
+        touch('comment', comment_id)
+
+def user_changed(instance, update_fields=None, **_):
+    """Signal receiver for users and their forum flags"""
+    if update_fields and set(update_fields) <= USER_ACTIVITY:
+        return
+    touch('user', getattr(instance, 'user_id', instance.pk))
@@ -0,0 +1,47 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Send the queued forum topic alerts to the topic and forum subscribers.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from forums.models import QueuedAlert
+
+class Command(BaseCommand):
+    """Send queued forum alerts"""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--loop', '-l', default=False, action='store_true',
+            help='Keep running and send alerts as they are queued.')
+        parser.add_argument('--every', '-e', default=10, type=int,
+            help='Seconds to wait between sends when looping (default 10).')
+
+    def handle(self, *args, **options):
+        while True:
+            count = QueuedAlert.objects.send()
+            if options['verbosity'] > 1:
+                print("Sent {} forum alerts".format(count))
+            if not options['loop']:
+                break
+            time.sleep(max(options['every'], 1))
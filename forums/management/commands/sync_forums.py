@@ -24,13 +24,15 @@ Sync all configured mailing lists and insert into forums.
 import os
 import sys
 import logging
+from contextlib import ExitStack
 
 from django.apps import apps
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from forums.models import Forum
-from forums.plugins.mailinglist import MailingList
+from forums.sync import MessageImport, BATCH_SIZE
+from forums.plugins.base import AuthorResolver
 
 #
 # Note: There's not support for attachments yet.
@@ -45,9 +47,22 @@ class Command(BaseCommand):
             dest='name',
             default=None,
             help='Name of the configured sync to perform (default is All).')
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            dest='bulk',
+            default=False,
+            help='Import messages in batches, for large archives.')
+        parser.add_argument(
+            '--batch-size',
+            action='store',
+            dest='batch_size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of messages saved together in bulk mode.')
         return parser
 
-    def handle(self, name=None, **kw):
+    def handle(self, name=None, bulk=False, batch_size=BATCH_SIZE, **kw):
         app = apps.get_app_config('forums')
         # Select all plugins if not supplied on command line
         try:
@@ -63,16 +78,22 @@ class Command(BaseCommand):
                 logging.error(" X Not syncing %s, (no forum targets)" % plugin.key)
                 continue
 
+            authors = AuthorResolver()
+
             def save_messages(message):
                 """Save messages callback run by plugin.'sync'"""
                 sys.stdout.write(".")
                 sys.stdout.flush()
                 for forum in forums:
-                    forum.sync_message(message)
+                    forum.sync_message(message, authors=authors)
 
             try:
-                # Call plugin sync and save the messages.
-                plugin.sync(save_messages)
+                if bulk:
+                    self.bulk_sync(plugin, forums, batch_size, authors)
+                else:
+                    # Call plugin sync and save the messages.
+                    plugin.sync(save_messages)
+                    plugin.save_position()
             except (NotImplementedError, KeyError) as err:
                 if name:
                     # Only error, if we asked for this plugin on the command line
@@ -82,3 +103,25 @@ class Command(BaseCommand):
                 raise
                 logging.error("Exception in %s: %s" % (name, str(err)))
 
+    @staticmethod
+    def bulk_sync(plugin, forums, batch_size, authors):
+        """Sync the plugin, saving messages to each forum in batches"""
+        importers = []
+
+        def add_message(message):
+            """Queue message callback run by plugin.'sync'"""
+            for importer in importers:
+                importer.add(message)
+
+        try:
+            # Each import flushes and alerts on exit, unless the sync failed
+            with ExitStack() as stack:
+                for forum in forums:
+                    importers.append(stack.enter_context(
+                        MessageImport(forum, batch_size, authors)))
+                plugin.sync(add_message)
+            # Only skip the synced messages once they are all saved
+            plugin.save_position()
+        finally:
+            for importer in importers:
+                sys.stdout.write(" %s: %d comments added\n" % (importer.forum, importer.added))
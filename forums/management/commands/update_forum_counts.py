@@ -19,11 +19,14 @@
 #
 """
 Update all forum counts (in case they get out of sync and init)
-"""
 
-import logging
+Comments are added up once per forum and only topics which are out of
+step with their comments are saved.
+"""
 
 from django.core.management.base import BaseCommand
+from django.db.models import Case, When, Sum, Min, Max, IntegerField
+
 from forums.models import ForumTopic, Forum
 
 class Command(BaseCommand):
@@ -31,6 +34,48 @@ class Command(BaseCommand):
 
     def handle(self, **_):
         for forum in Forum.objects.all():
-            forum.refresh_meta_data()
-        for topic in ForumTopic.objects.all():
-            topic.refresh_meta_data()
+            changed = self.update_forum(forum)
+            if changed:
+                self.stdout.write("{}: {} topics updated".format(forum, changed))
+
+    @staticmethod
+    def update_forum(forum):
+        """Set the counts for one forum and its topics, returns topics changed"""
+        comments = forum.comments.order_by()
+        stats = dict(
+            (item.pop('object_pk'), item) for item in comments.values('object_pk').annotate(
+                count=Sum(Case(When(is_removed=False, then=1), default=0,
+                               output_field=IntegerField())),
+                first=Min('submit_date'), last=Max('submit_date')))
+        attached = set(comments.filter(attachments__isnull=False)\
+                               .values_list('object_pk', flat=True).distinct())
+
+        changed = 0
+        for topic in forum.topics.all():
+            key = str(topic.object_pk if forum.content_type else topic.pk)
+            stat = stats.get(key, {})
+            values = {
+                'post_count': stat.get('count') or 0,
+                'first_posted': stat.get('first', topic.first_posted),
+                'last_posted': stat.get('last', topic.last_posted),
+                'has_attachments': key in attached,
+            }
+            if not values['post_count']:
+                values['removed'] = True
+            if all(getattr(topic, name) == value for (name, value) in values.items()):
+                continue
+            for (name, when) in (('first', values['first_posted']),
+                                 ('last', values['last_posted'])):
+                if when != getattr(topic, name + '_posted'):
+                    comment = comments.filter(object_pk=key, submit_date=when)\
+                                      .select_related('user').first()
+                    if comment is not None and comment.user:
+                        values[name + '_username'] = comment.user.username
+            ForumTopic.objects.filter(pk=topic.pk).update(**values)
+            changed += 1
+
+        public = [stat['count'] for stat in stats.values()]
+        last = [stat['last'] for stat in stats.values()]
+        Forum.objects.filter(pk=forum.pk).update(
+            post_count=sum(public), last_posted=max(last) if last else forum.last_posted)
+        return changed
@@ -19,19 +19,75 @@
 #
 """
 Track the visiting people in the forum.
+
+Visits are appended to per-minute buckets in the cache, each bucket has a
+counter which is incremented to get a free slot, so there is no read and
+write back of a shared list. Each user is recorded at most once a minute
+and the list of visitors is only looked up if the template uses it.
 """
 
 from collections import OrderedDict
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.core.cache import caches
-from django.utils.timezone import now
+from django.utils.functional import cached_property
+from django.utils.timezone import now, utc
 
 from person.models import User
 
 # Age to count visits if users are really still here in minutes
 VISITOR_AGE = timedelta(seconds=getattr(settings, 'FORUM_VISITOR_AGE', 20) * 60)
+# Size of each bucket of visits, and how often a user is recorded, in seconds
+VISITOR_BUCKET = 60
+# How many visitors are shown
+VISITOR_COUNT = 20
+
+def _bucket(at_time):
+    return int(at_time.timestamp()) // VISITOR_BUCKET
+
+class RecentVisitors(object):
+    """
+    The users who have visited recently, oldest first as {pk: user}, each user
+    has a visited datetime. Nothing is looked up until it is used.
+    """
+    def __init__(self, cache, at_time=None):
+        self.cache = cache
+        self.at_time = at_time or now()
+
+    @cached_property
+    def visitors(self):
+        """Collect the visitors from the buckets"""
+        last = _bucket(self.at_time)
+        buckets = ['visitors:%d' % bucket for bucket in
+                   range(last - int(VISITOR_AGE.total_seconds()) // VISITOR_BUCKET, last + 1)]
+        sizes = self.cache.get_many(buckets)
+        slots = self.cache.get_many(['%s:%d' % (bucket, index)
+                                     for (bucket, size) in sizes.items()
+                                     for index in range(1, size + 1)])
+        seen = {}
+        for (slot, pk) in slots.items():
+            bucket = int(slot.split(':')[1])
+            seen[pk] = max(seen.get(pk, bucket), bucket)
+
+        latest = sorted(seen, key=seen.get)[-VISITOR_COUNT:]
+        users = User.objects.in_bulk(latest)
+        visitors = OrderedDict()
+        for pk in latest:
+            if pk in users:
+                visitors[pk] = users[pk]
+                visitors[pk].visited = datetime.fromtimestamp(seen[pk] * VISITOR_BUCKET, utc)
+        return visitors
+
+    def items(self):
+        return self.visitors.items()
+
+    def __iter__(self):
+        return iter(self.visitors)
+
+    def __len__(self):
+        return len(self.visitors)
+
 
 class RecentUsersMiddleware(object):
     """
@@ -46,24 +102,23 @@ class RecentUsersMiddleware(object):
 #        return self.get_response(request)
 
     def set_visitor(self, user, at_time):
-        """Record a user as visiting at this time"""
-        visitors = self.get_visitors()
-        visitors.pop(user.pk, None)
-        visitors[user.pk] = {
-            'username': user.username,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'photo_url': user.photo_url(),
-            'last_seen': at_time,
-        }
-        self.cache.set('visitors', list(visitors.items()))
-        return visitors
+        """Record a user as visiting at this time, at most once a bucket"""
+        timeout = int(VISITOR_AGE.total_seconds()) + VISITOR_BUCKET
+        if not self.cache.add('visitor:%d' % user.pk, 1, VISITOR_BUCKET):
+            return False
+        key = 'visitors:%d' % _bucket(at_time)
+        self.cache.add(key, 0, timeout)
+        try:
+            index = self.cache.incr(key)
+        except ValueError:
+            # The bucket expired between add and incr
+            return False
+        self.cache.set('%s:%d' % (key, index), user.pk, timeout)
+        return True
 
     def get_visitors(self):
-        """Return a sorteded list of visitors"""
-        return OrderedDict((pk, visitor)
-                           for pk, visitor in self.cache.get('visitors', [])[-20:]
-                           if now() - visitor['last_seen'] < VISITOR_AGE)
+        """Return the recent visitors, looked up when first used"""
+        return RecentVisitors(self.cache)
 
     def process_template_response(self, request, response):
         """Add visiting user data into context"""
@@ -74,8 +129,9 @@ class RecentUsersMiddleware(object):
                 for user in user_qset.order_by('?')[:3]:
                     self.set_visitor(user, now())
 
-            response.context_data['visitors'] = self.set_visitor(request.user, now())
-        elif hasattr(response, 'context_data'):
+            self.set_visitor(request.user, now())
+
+        if hasattr(response, 'context_data'):
             response.context_data['visitors'] = self.get_visitors()
 
         return response
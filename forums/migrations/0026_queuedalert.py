@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_comments', '0003_add_submit_date_index'),
+        ('forums', '0025_auto_20200125_0631'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedAlert',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(default='new', max_length=8)),
+                ('queued', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='django_comments.Comment')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queued_alerts', to='forums.ForumTopic')),
+            ],
+        ),
+    ]
@@ -24,7 +24,9 @@ Basic mixin classes for forums
 import json
 
 from django.db.models import Q, Count
+from django.core.cache import caches
 from django.utils import translation
+from django.utils.functional import SimpleLazyObject
 from django.contrib.auth import get_user_model
 
 from django.core.exceptions import PermissionDenied
@@ -37,6 +39,15 @@ from .middleware import RecentUsersMiddleware
 from .models import Forum, ForumTopic, Comment
 from .alert import ForumTopicAlert
 
+# How long the new alert counts are cached for each user, in seconds
+BADGE_TIMEOUT = 60
+# The moderation queue count is shared by all moderators until a comment changes
+PURGITORY_KEY = 'forums:badges:purgitory'
+
+def purgitory_changed(**_):
+    """Signal receiver for comments, the moderation queue may have changed"""
+    caches['default'].delete(PURGITORY_KEY)
+
 class ProgressiveContext(object):
     """
     Allow ways of adding data to the template context data
@@ -178,10 +189,28 @@ class ForumMixin(ProgressiveContext):
         """Add standard context data elements"""
         data = super().get_context_data(**kwargs)
         data['forums'] = self.get_forum_list()
-        data['purgitory'] = Comment.objects.filter(is_public=False, is_removed=False)
-        data['newsub'] = ForumTopicAlert.messages_for(self.request.user)
+        data['badges'] = SimpleLazyObject(self.get_badges)
         return data
 
+    def get_badges(self):
+        """The moderation queue and new alert counts, cached for each user"""
+        user = self.request.user
+        if not user.is_authenticated():
+            return {}
+        cache = caches['default']
+        key = 'forums:badges:%d' % user.pk
+        badges = cache.get(key)
+        if badges is None:
+            badges = {'newsub': ForumTopicAlert.messages_for(user).count()}
+            cache.set(key, badges, BADGE_TIMEOUT)
+        if user.is_moderator():
+            badges['purgitory'] = cache.get(PURGITORY_KEY)
+            if badges['purgitory'] is None:
+                badges['purgitory'] = Comment.objects\
+                    .filter(is_public=False, is_removed=False).count()
+                cache.set(PURGITORY_KEY, badges['purgitory'], None)
+        return badges
+
 class CsrfExempt(object):
     """Exempt a form from cross-scripting protections"""
     @method_decorator(csrf_exempt)
@@ -22,15 +22,17 @@ Forums are a simple extension of django_comments and there really
 shouldn't be much functionality contained within this app.
 """
 
+import re
 import json
+import time
 from datetime import datetime, timedelta
 
 from unidecode import unidecode
 
 from django.apps import apps
-from django.db.models.functions import Cast
+from django.db.models.functions import Cast, Greatest
 from django.db.models import (
-    Model, Manager, CASCADE, SET_NULL,
+    Model, Manager, CASCADE, SET_NULL, F, Q,
     ForeignKey, OneToOneField, IntegerField, DateTimeField, BooleanField,
     CharField, SlugField, TextField, PositiveIntegerField,
 )
@@ -40,18 +42,19 @@ from django.template import TemplateDoesNotExist
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
 from django.core.validators import MaxLengthValidator
+from django.core.cache import caches
 from django.conf import settings
 
-from django.utils.crypto import get_random_string
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import make_aware
 from django.utils.encoding import force_text
 from django.utils.text import slugify
 from django_comments.models import Comment
 from resources.models import Resource
+from resources.slugify import next_slug, save_with_slug
 from person.models import Team
 
-from .querysets import ForumQuerySet, TopicQuerySet, UserFlagQuerySet
+from .querysets import ForumQuerySet, TopicQuerySet, UserFlagQuerySet, QueuedAlertQuerySet
 from .fields import IconField
 
 APP = apps.get_app_config('forums')
@@ -157,7 +160,7 @@ class Forum(Model):
         """Return a configuration for forum sync plugins"""
         return settings.FORUM_SYNCS.get(self.sync, {})
 
-    def sync_message(self, message):
+    def sync_message(self, message, authors=None):
         """Add a new message xor forum topic based on an import"""
         if not message:
             return
@@ -184,7 +187,7 @@ class Forum(Model):
         if created in (None, True):
             comment = Comment.objects.create(
                 site_id=1,
-                user=message.get_user(),
+                user=message.get_user(authors),
                 user_name=str(message.get_username()),
                 user_email=message.get_email(),
                 user_url=message.get_userurl(),
@@ -205,7 +208,7 @@ class Forum(Model):
             for reply in message.get_replies():
                 comment = Comment.objects.create(
                     site_id=1,
-                    user=message.get_user(),
+                    user=message.get_user(authors),
                     user_name=str(message.get_username()),
                     user_email=message.get_email(),
                     user_url='',
@@ -351,21 +354,54 @@ class ForumTopic(Model):
         if not self.post_count:
             self.removed = True
 
-        self.has_attachments = self.comments.filter(attachments__isnull=False).count()
+        self.has_attachments = self.comments.filter(attachments__isnull=False).exists()
         self.save(update_fields=['post_count', 'first_posted', 'last_posted',
-                                 'first_username', 'last_username', 'removed'])
+                                 'first_username', 'last_username', 'removed',
+                                 'has_attachments'])
+
+    def add_posts(self, delta, comment=None):
+        """
+        Add (or take away) posts from the counts of this topic and its forum
+        without counting all the comments again, the comment is the new post.
+        """
+        topic = {'post_count': Greatest(F('post_count') + delta, 0)}
+        if comment is not None:
+            date = comment.submit_date
+            username = comment.user.username if comment.user_id else None
+            if not self.last_posted or date >= self.last_posted:
+                topic['last_posted'] = date
+                if username:
+                    topic['last_username'] = username
+            if not self.post_count or (self.first_posted and date < self.first_posted):
+                topic['first_posted'] = date
+                if username:
+                    topic['first_username'] = username
+
+        ForumTopic.objects.filter(pk=self.pk).update(**topic)
+        forums = Forum.objects.filter(pk=self.forum_id)
+        if delta:
+            forums.update(post_count=Greatest(F('post_count') + delta, 0))
+        if comment is not None:
+            forums.filter(Q(last_posted__isnull=True) | Q(last_posted__lt=comment.submit_date))\
+                  .update(last_posted=comment.submit_date)
+        if delta < 0:
+            ForumTopic.objects.filter(pk=self.pk, post_count=0).update(removed=True)
+
+    def refresh_attachments(self):
+        """Set has_attachments from the comments in this topic"""
+        has_attachments = self.comments.filter(attachments__isnull=False).exists()
+        ForumTopic.objects.filter(pk=self.pk).update(has_attachments=has_attachments)
 
     def save(self, **kw):
         """Save this topic and generate a slug if needed"""
         self.subject = self.subject[:120]
 
-        if not self.slug:
-            original = slugify(unidecode(self.subject))
-            self.slug = original
-            while ForumTopic.objects.filter(slug=self.slug).count():
-                self.slug = original + '_' + get_random_string(length=5)
+        def allocate():
+            if not self.slug:
+                self.slug = next_slug(self, slugify(unidecode(self.subject)), sep='_')
 
-        return super(ForumTopic, self).save(**kw)
+        allocate()
+        return save_with_slug(self, super(ForumTopic, self).save, allocate, **kw)
 
 class AttachmentManager(Manager):
     """Add some management functions for templates to show presentations"""
@@ -480,6 +516,63 @@ class UserFlag(Model):
         )
 
 
+class BannedPhrases(object):
+    """
+    All the banned phrases compiled into one regular expression for titles
+    and one for bodies, so checking a post doesn't depend on how many
+    phrases there are. Only posts which match are checked phrase by phrase.
+    """
+    def __init__(self, words):
+        self.words = list(words)
+        self.built = time.time()
+        self.title = self.compile(bwd.phrase for bwd in self.words if bwd.in_title)
+        self.body = self.compile(bwd.phrase for bwd in self.words if bwd.in_body)
+
+    @staticmethod
+    def compile(phrases):
+        """Returns a regular expression matching any of the phrases, or None"""
+        phrases = sorted(set(phrases), key=len, reverse=True)
+        if not phrases:
+            return None
+        return re.compile("|".join(re.escape(phrase) for phrase in phrases))
+
+    def find(self, title, body, new_user=True):
+        """Returns the banned words found in the title or body"""
+        if not ((self.title and self.title.search(title))
+                or (self.body and self.body.search(body))):
+            return []
+        return [bwd for bwd in self.words if (new_user or not bwd.new_user) and (
+            (bwd.in_title and bwd.phrase in title) or (bwd.in_body and bwd.phrase in body))]
+
+
+class BannedWordsManager(Manager):
+    """Keep a compiled copy of the banned words in each process"""
+    cache = caches['default']
+    cache_key = 'forums:banned-words'
+    timeout = 300
+    _phrases = None
+
+    def phrases(self):
+        """Returns the BannedPhrases, rebuilt when the words have changed"""
+        phrases = BannedWordsManager._phrases
+        changed = self.cache.get(self.cache_key, 0)
+        if phrases is None or phrases.built < changed \
+              or phrases.built + self.timeout < time.time():
+            phrases = BannedPhrases(self.get_queryset())
+            BannedWordsManager._phrases = phrases
+        return phrases
+
+    def changed(self, **_):
+        """Tell every process to rebuild the banned phrases"""
+        BannedWordsManager._phrases = None
+        self.cache.set(self.cache_key, time.time(), None)
+
+    def found(self, words):
+        """Count the found banned words in the database"""
+        return self.filter(pk__in=[bwd.pk for bwd in words])\
+                   .update(found_count=F('found_count') + 1)
+
+
 class BannedWords(Model):
     """
     If these words/phrases are used, then the poster can be instantly banned.
@@ -497,6 +590,8 @@ class BannedWords(Model):
         help_text='Ban user if they use this phrase')
     found_count = IntegerField(default=0)
 
+    objects = BannedWordsManager()
+
     def __str__(self):
         return self.phrase
 
@@ -520,3 +615,20 @@ class CommentLink(Model):
 
     def __str__(self):
         return self.message_id
+
+
+class QueuedAlert(Model):
+    """A new or edited comment whose subscribers are still to be alerted"""
+    topic = ForeignKey(ForumTopic, related_name='queued_alerts', on_delete=CASCADE)
+    comment = ForeignKey(Comment, related_name='+', on_delete=CASCADE)
+    action = CharField(max_length=8, default='new')
+    queued = DateTimeField(auto_now_add=True)
+    attempts = PositiveIntegerField(default=0)
+
+    # Alerts which fail this many times are dropped from the queue
+    MAX_ATTEMPTS = 5
+
+    objects = QueuedAlertQuerySet.as_manager()
+
+    def __str__(self):
+        return "%s alert for %s" % (self.action, self.topic)
@@ -45,6 +45,44 @@ def _parse_address(email):
     return (name.strip(), email.strip())
 
 
+class AuthorResolver(object):
+    """
+    Find the local users for message authors, used for a whole sync. Users are
+    loaded for a batch of messages with one query for the emails and one for
+    the usernames, and every answer is remembered.
+    """
+    def __init__(self):
+        self.emails = {}
+        self.usernames = {}
+
+    def load(self, addresses):
+        """Load the users for these (name, email) pairs"""
+        addresses = list(addresses)
+        self._load(self.emails, 'email', set(email for _, email in addresses if email))
+        self._load(self.usernames, 'username', set(name for name, email in addresses
+                                                   if name and not self.emails.get(email)))
+
+    @staticmethod
+    def _load(found, field, values):
+        values -= set(found)
+        if not values:
+            return
+        from django.contrib.auth import get_user_model
+        users = defaultdict(list)
+        for user in get_user_model().objects.filter(**{field + '__in': values}):
+            users[getattr(user, field)].append(user)
+        for value in values:
+            # Only an address which matches exactly one user is used
+            matches = users.get(value, [])
+            found[value] = matches[0] if len(matches) == 1 else None
+
+    def get_user(self, name, email):
+        """Returns the local user for this author, or None"""
+        if (email and email not in self.emails) or (name and name not in self.usernames):
+            self.load([(name, email)])
+        return self.emails.get(email) or self.usernames.get(name)
+
+
 class BasePlugin(object):
     test_conf = {}
 
@@ -68,6 +106,10 @@ class BasePlugin(object):
     def sync(self, **kw):
         raise NotImplementedError("Forum plugin '%s' has no sync" % self.name)
 
+    def save_position(self):
+        """Called once every synced message is saved, so the next sync can
+        start after them. Implement this if your plugin keeps its place."""
+
     @classmethod
     def kind(cls):
         """Returns the kind of plugin this is (module name)"""
@@ -91,8 +133,8 @@ class MessageBase(dict):
            finally return the default value"""
         def _dict_get():
             map_key = self.maps.get(key, key.lower())
-	    return super(MessageBase, self).get(key,
-		     super(MessageBase, self).get(map_key, default))
+            return super(MessageBase, self).get(key,
+                     super(MessageBase, self).get(map_key, default))
         return getattr(self, 'get_' + key, _dict_get)()
 
     def update(self, d):
@@ -125,6 +167,11 @@ class MessageBase(dict):
 
     def get_from(self):
         """Returns a tuple of name and email in from address"""
+        if not hasattr(self, '_from'):
+            self._from = self._get_from()
+        return self._from
+
+    def _get_from(self):
         global EMAIL_ADDRESSES
 
         for items in ('To', 'CC', 'From'):
@@ -145,8 +192,11 @@ class MessageBase(dict):
     def get_username(self):
         return self.get_from()[0]
 
-    def get_user(self):
+    def get_user(self, authors=None):
         """Returns link to a local user based on email address"""
+        if authors is not None:
+            return authors.get_user(self.get_username(), self.get_email())
+
         from django.contrib.auth import get_user_model
         User = get_user_model()
         objects = User.objects.filter(email=self.get_email())
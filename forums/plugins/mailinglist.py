@@ -23,7 +23,6 @@ and it's messages.
 """
 import os
 import re
-import atexit
 import logging
 import subprocess
 
@@ -51,8 +50,6 @@ class MailingList(object):
         self.dest = os.path.dirname(self.path)
         if not os.path.isdir(self.dest):
             raise IOError("Directory missing: %s" % self.dest)
-        if not test:
-            atexit.register(self.set_position)
 
     def sync(self, url, user, password):
         """Sync the mailbox with the online source"""
@@ -82,12 +79,10 @@ class MailingList(object):
             yield message
 
     def new_messages(self):
-        """Only returns the messages since last run"""
+        """Only returns the messages since last run, see set_position"""
         mailbox = self.get_mailbox(self.get_position())
         for message in mailbox:
             yield message
-        if not self.test:
-            self.set_position()
 
     @property
     def position_file(self):
@@ -338,3 +333,8 @@ class Plugin(BasePlugin):
             # Add every NEW message to the forum via the callback function
             callback(message)
 
+    def save_position(self):
+        """The next sync starts after the messages read by this one"""
+        if not self.test:
+            self.ml.set_position()
+
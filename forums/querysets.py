@@ -21,9 +21,11 @@
 Specialised querysets
 """
 import json
+import logging
 from collections import OrderedDict
 
-from django.db.models import QuerySet, Model, Q
+from django.db import transaction
+from django.db.models import QuerySet, Q, Exists, OuterRef
 
 class ForumQuerySet(QuerySet):
     """Query to help forums be grouped together"""
@@ -54,13 +56,17 @@ class TopicQuerySet(QuerySet):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.viewer = None
-        self.subs = None
-        self._subs_done = False
 
     def set_user(self, user):
-        """Set the user looking at this this of topics"""
-        self.viewer = user
-        self.subs = None
+        """
+        Set the user looking at this list of topics, each topic is annotated
+        with is_subscribed in the same query.
+        """
+        clone = self.annotate(
+            is_subscribed=Exists(self._subscriptions(user).filter(target=OuterRef('pk'))),
+        )
+        clone.viewer = user
+        return clone
 
     def for_user(self, user):
         """Set the user and filter out un-needed topics"""
@@ -74,31 +80,18 @@ class TopicQuerySet(QuerySet):
         clone.viewer = self.viewer
         return clone
 
-    def _subscriptions(self):
+    def _subscriptions(self, user=None):
         # Late import becaue alert imports models
         from .alert import ForumTopicAlert
-        return ForumTopicAlert.subscriptions_for(self.viewer)
+        return ForumTopicAlert.subscriptions_for(user or self.viewer)
 
     def subscriptions(self):
         """Return a list of subscriptions based on this queryset"""
-        if self.subs is None:
-            all_subs = self._subscriptions()
-            self.subs = all_subs.filter(target__in=self.values_list('pk'))
-        return self.subs
+        return self._subscriptions().filter(target__in=self.values_list('pk'))
 
     def subscribed_only(self):
         """Filter the queryset to only include the subcriptions"""
-        return self.filter(pk__in=self._subscriptions().values_list('target'))
-
-    def _fetch_all(self):
-        """Populate the subscriptions information as if it were a refetch_related"""
-        super()._fetch_all()
-        if not self._subs_done:
-            subs = list(self.subscriptions().values_list('target', flat=True))
-            for obj in self._result_cache:
-                if isinstance(obj, Model):
-                    obj.is_subscribed = obj.pk in subs
-            self._subs_done = True
+        return self.filter(is_subscribed=True)
 
 class UserFlagQuerySet(QuerySet):
     """
@@ -133,3 +126,38 @@ class UserFlagQuerySet(QuerySet):
         return self.exclude(flag__in=[\
             UserFlag.FLAG_MODERATOR,
             UserFlag.FLAG_BANNED])
+
+class QueuedAlertQuerySet(QuerySet):
+    """Alerts are sent from the queue, outside of the request"""
+    def send(self):
+        """
+        Send all the queued alerts in the order they were queued, returns the
+        number sent. Each alert is locked while it's sent, so runs at the same
+        time skip it, and removed in the same transaction as the user alerts
+        it made. Any that fail are tried again next time, up to MAX_ATTEMPTS.
+        """
+        from .alert import ForumTopicAlert
+        alert = ForumTopicAlert.get_alert_type()
+        sent = 0
+        tried = []
+        while True:
+            with transaction.atomic():
+                item = self.select_for_update(skip_locked=True)\
+                           .exclude(pk__in=tried).order_by('pk').first()
+                if item is None:
+                    return sent
+                tried.append(item.pk)
+                try:
+                    with transaction.atomic():
+                        alert.call(instance=item.topic, comment=item.comment, action=item.action)
+                        item.delete()
+                except Exception: # pylint: disable=broad-except
+                    logging.exception("Failed to send forum alert: %s", str(item))
+                    item.attempts += 1
+                    if item.attempts >= self.model.MAX_ATTEMPTS:
+                        logging.error("Giving up on forum alert: %s", str(item))
+                        item.delete()
+                    else:
+                        item.save(update_fields=['attempts'])
+                    continue
+                sent += 1
@@ -0,0 +1,164 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Bulk import of synced messages into a forum.
+
+Messages are collected from a plugin's sync and added in batches, the
+message and reply ids of a whole batch are looked up together and the
+comments and links are inserted in bulk. Comment signals are
+not sent, so the topics are refreshed and alerted once at the end.
+"""
+
+import json
+
+from django.db import transaction
+from django.utils.encoding import force_text
+from django.utils.timezone import now
+
+from inkscape.utils import bulk_insert
+
+from .models import ForumTopic, CommentLink, Comment
+from .plugins.base import AuthorResolver
+
+BATCH_SIZE = 500
+
+class MessageImport(object):
+    """
+    Add messages to a forum in batches, use as the callback for a plugin sync:
+
+      with MessageImport(forum) as importer:
+          plugin.sync(importer.add)
+    """
+    def __init__(self, forum, batch_size=BATCH_SIZE, authors=None):
+        self.forum = forum
+        self.authors = AuthorResolver() if authors is None else authors
+        self.batch_size = batch_size
+        self.pending = []
+        # The latest new comment for each topic, by topic pk
+        self.topics = {}
+        self.added = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        # Batches saved before a failure are refreshed, but never alerted
+        self.finish(alert=exc_type is None)
+
+    def add(self, message):
+        """Add one message, the batch is saved once it's full"""
+        if message:
+            self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Save all the pending messages in one transaction"""
+        (messages, self.pending) = (self.pending, [])
+        if messages:
+            with transaction.atomic():
+                self.added += self.insert(messages)
+
+    def finish(self, alert=True):
+        """Refresh (and alert) each topic which got new comments"""
+        from .alert import ForumTopicAlert
+        alert_type = ForumTopicAlert.get_alert_type()
+        for topic in ForumTopic.objects.filter(pk__in=self.topics):
+            topic.refresh_meta_data()
+            if alert:
+                alert_type.call(instance=topic, comment=self.topics[topic.pk], action='new')
+        if self.topics:
+            self.forum.refresh_meta_data()
+        self.topics = {}
+
+    def insert(self, messages):
+        """Insert the comments and links for these messages, returns the number added"""
+        ids = [(msg.get_message_id(), msg.get_reply_id()) for msg in messages]
+        wanted = set(mid for mid, _ in ids) | set(rid for _, rid in ids if rid)
+
+        # The topic pk for every message already imported
+        links = dict(CommentLink.objects.filter(message_id__in=wanted)\
+            .values_list('message_id', 'comment__object_pk'))
+        topics = dict(self.forum.topics.filter(message_id__in=wanted)\
+            .values_list('message_id', 'pk'))
+
+        self.authors.load(msg.get_from() for msg in messages)
+
+        comments = []
+        for (message, (message_id, reply_id)) in zip(messages, ids):
+            if message_id in links:
+                continue
+            if reply_id in links:
+                topic_pk = int(links[reply_id])
+            elif message_id in topics:
+                # Topic exists without a comment, the same as sync_message
+                continue
+            else:
+                topic_pk = ForumTopic.objects.create(
+                    forum=self.forum,
+                    message_id=message_id,
+                    subject=str(message.get_subject()),
+                ).pk
+                for reply in getattr(message, 'get_replies', list)():
+                    comments.append((self.comment(
+                        message, topic_pk, body=reply.get_body(), user_url=''), None))
+
+            links[message_id] = str(topic_pk)
+            comments.append((self.comment(message, topic_pk), CommentLink(
+                message_id=message_id,
+                reply_id=reply_id,
+                subject=message.get_subject(),
+                extra_data=json.dumps(message.get_data()),
+            )))
+
+        if not comments:
+            return 0
+
+        bulk_insert(Comment, [comment for comment, _ in comments])
+
+        for (comment, link) in comments:
+            if link is not None:
+                link.comment_id = comment.pk
+            topic_pk = int(comment.object_pk)
+            latest = self.topics.get(topic_pk)
+            if latest is None or comment.submit_date >= latest.submit_date:
+                self.topics[topic_pk] = comment
+
+        CommentLink.objects.bulk_create([link for _, link in comments if link is not None])
+        return len(comments)
+
+    def comment(self, message, topic_pk, body=None, **kwargs):
+        """Returns an unsaved comment for this message"""
+        if body is None:
+            body = message.get_body()
+        kwargs.setdefault('user_url', message.get_userurl())
+        return Comment(
+            site_id=1,
+            content_type=ForumTopic.content_type(),
+            object_pk=str(topic_pk),
+            user=message.get_user(self.authors),
+            user_name=str(message.get_username()),
+            user_email=message.get_email(),
+            comment=force_text(body, errors='replace'),
+            submit_date=message.get_created() or now(),
+            **kwargs
+        )
@@ -18,12 +18,16 @@
 Try to make forum comment requests faster.
 """
 
+from django.conf import settings
+from django.core.paginator import Paginator, InvalidPage
 from django.template import Library
+from django.utils.safestring import mark_safe
 from django_comments.templatetags.comments import CommentListNode, CommentFormNode
 
 from alerts.models import AlertSubscription
 
 from ..forms import AddCommentForm
+from .. import fragments
 
 register = Library() # pylint: disable=invalid-name
 
@@ -40,6 +44,9 @@ FORUM_DEFER = ['user_email', 'user_name', 'user_url', 'ip_address'] + \
     list(defer('user', 'password', 'email', 'bio', 'ircnick', 'ircpass', 'dauser', 'ocuser',
                'tbruser', 'gpg_key', 'last_seen', 'visits', 'website'))
 FORUM_PREFETCH = ['flags', 'attachments', 'attachments__resource', 'user', 'user__forum_flags']
+# Only what's needed to find each comment's cached rendering
+FORUM_ONLY = ['user', 'submit_date', 'is_public']
+COMMENTS_PER_PAGE = getattr(settings, 'FORUM_COMMENTS_PER_PAGE', 100)
 
 #
 # === Comment List === #
@@ -54,8 +61,33 @@ class ForumCommentListNode(CommentListNode):
 
         # We show all is_public=False so moderators can see them
         qset = self.comment_model.objects.filter(object_pk=object_pk, content_type=ctype)
-        qset = qset.filter(is_removed=False)
-        return qset.prefetch_related(*FORUM_PREFETCH).defer(*FORUM_DEFER)
+        return qset.filter(is_removed=False).only(*FORUM_ONLY)
+
+    def render(self, context):
+        """Set a page of comments, each with its position in the thread"""
+        qset = self.get_queryset(context)
+        paginator = Paginator(qset, COMMENTS_PER_PAGE)
+        page = self.get_page(paginator, qset, context['request'].GET)
+        for position, comment in enumerate(page.object_list, page.start_index()):
+            comment.position = position
+        context[self.as_varname] = page.object_list
+        context['page_obj'] = page
+        context['is_paginated'] = page.has_other_pages()
+        return ''
+
+    @staticmethod
+    def get_page(paginator, qset, query):
+        """Get the requested page, or the page with the requested comment (?c=pk)"""
+        number = query.get('page', None)
+        if number is None and query.get('c', '').isdigit():
+            comment = qset.filter(pk=query['c']).first()
+            if comment is not None:
+                before = qset.filter(submit_date__lt=comment.submit_date).count()
+                number = before // paginator.per_page + 1
+        try:
+            return paginator.page(paginator.num_pages if number == 'last' else number or 1)
+        except (InvalidPage, ValueError):
+            return paginator.page(1)
 
 @register.tag
 def get_forum_comment_list(parser, token):
@@ -64,6 +96,33 @@ def get_forum_comment_list(parser, token):
     """
     return ForumCommentListNode.handle_token(parser, token)
 
+@register.simple_tag(takes_context=True)
+def render_forum_comments(context, comments):
+    """
+    Render each comment with forums/comment_item.html, only comments which
+    have changed (or are not cached for this sort of viewer) are rendered.
+    """
+    request = context['request']
+    comments = list(comments)
+    versions = fragments.get_versions(comments)
+    keys = dict((comment.pk, fragments.fragment_key(
+        comment, versions, fragments.viewer_role(request.user, comment), request.path))
+                for comment in comments)
+    html = fragments.CACHE.get_many(keys.values())
+
+    missing = dict((comment.pk, comment) for comment in comments if keys[comment.pk] not in html)
+    if missing:
+        template = context.template.engine.get_template('forums/comment_item.html')
+        qset = type(comments[0]).objects.filter(pk__in=missing)
+        for comment in qset.prefetch_related(*FORUM_PREFETCH).defer(*FORUM_DEFER):
+            comment.position = missing[comment.pk].position
+            with context.push(comment=comment):
+                html[keys[comment.pk]] = template.render(context)
+            fragments.CACHE.set(keys[comment.pk], html[keys[comment.pk]],
+                                fragments.fragment_timeout(comment))
+
+    return mark_safe(''.join(html.get(keys[comment.pk], '') for comment in comments))
+
 @register.filter("subscription")
 def sub(topic, user):
     """Return if the user is subscribed to the topic"""
@@ -0,0 +1,154 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the queued forum alerts
+"""
+
+from unittest.mock import patch
+
+from django.core import mail
+
+from extratest.base import ExtraTestCase
+from alerts.models import AlertType, UserAlert, UserAlertSetting
+
+from forums.alert import ForumAlert, ForumTopicAlert
+from forums.models import Forum, ForumTopic, Comment, QueuedAlert
+from person.models import User
+
+class QueuedAlertTests(ExtraTestCase):
+    """Alerts for new comments are queued and sent to every subscriber"""
+    fixtures = ['test-auth', 'test-contenttype', 'test-forum', 'forum-alert']
+
+    def setUp(self):
+        super(QueuedAlertTests, self).setUp()
+        for cls in (ForumAlert, ForumTopicAlert):
+            # Load the alert types from this test's database
+            cls(cls.slug).__dict__.pop('_alert_type', None)
+        self.forum = Forum.objects.get()
+        self.topic = ForumTopic.objects.create(forum=self.forum, subject='Alerting')
+        self.poster = User.objects.get(username='admin')
+        self.topic_sub = User.objects.get(username='tester')
+        self.forum_sub = User.objects.get(username='staff')
+        AlertType.objects.get(slug=ForumTopicAlert.slug).subscriptions.create(
+            user=self.topic_sub, target=self.topic.pk)
+        AlertType.objects.get(slug=ForumAlert.slug).subscriptions.create(
+            user=self.forum_sub, target=self.forum.pk)
+
+    def reply(self, text='A reply'):
+        """Post a comment to the topic"""
+        return Comment.objects.create(
+            site_id=1, user=self.poster, content_type=ForumTopic.content_type(),
+            object_pk=str(self.topic.pk), comment=text)
+
+    def alerts(self):
+        """The users alerted about the topic"""
+        return sorted(UserAlert.objects.filter(
+            alert__slug=ForumTopicAlert.slug).values_list('user__username', flat=True))
+
+    def test_queued(self):
+        """Replies are queued and not sent straight away"""
+        comment = self.reply()
+        queued = QueuedAlert.objects.get()
+        self.assertEqual((queued.topic, queued.comment, queued.action),
+                         (self.topic, comment, 'new'))
+        comment.comment = 'Edited'
+        comment.save()
+        self.assertEqual(QueuedAlert.objects.latest('pk').action, 'edit')
+        self.assertEqual(self.alerts(), [])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_send(self):
+        """Topic and forum subscribers are alerted and emailed"""
+        self.reply()
+        self.assertEqual(QueuedAlert.objects.send(), 1)
+        self.assertEqual(QueuedAlert.objects.count(), 0)
+        self.assertEqual(self.alerts(), ['staff', 'tester'])
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox),
+                         ['staff@testers.com', 'user@testers.com'])
+
+        alert = UserAlert.objects.get(user=self.forum_sub)
+        self.assertEqual(alert.objs.get(name='instance').target, self.topic)
+        self.assertTrue(alert.viewed)
+        self.assertEqual(QueuedAlert.objects.send(), 0)
+
+    def test_subscribed_to_both(self):
+        """Users subscribed to the topic and the forum get one alert"""
+        AlertType.objects.get(slug=ForumAlert.slug).subscriptions.create(
+            user=self.topic_sub, target=self.forum.pk)
+        self.reply()
+        QueuedAlert.objects.send()
+        self.assertEqual(self.alerts(), ['staff', 'tester'])
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed(self):
+        """Alerts which fail to send are kept in the queue"""
+        self.reply('First')
+        self.reply('Second')
+        with patch.object(ForumTopicAlert, 'call', side_effect=[IOError('No mail'), True]):
+            with self.assertLogs(level='ERROR'):
+                self.assertEqual(QueuedAlert.objects.send(), 1)
+        self.assertEqual(QueuedAlert.objects.get().comment.comment, 'First')
+        self.assertEqual(QueuedAlert.objects.send(), 1)
+        self.assertEqual(QueuedAlert.objects.count(), 0)
+
+    def test_given_up(self):
+        """Alerts which keep failing are dropped from the queue"""
+        self.reply()
+        with patch.object(ForumTopicAlert, 'call', side_effect=IOError('No mail')):
+            for attempt in range(1, QueuedAlert.MAX_ATTEMPTS):
+                with self.assertLogs(level='ERROR'):
+                    self.assertEqual(QueuedAlert.objects.send(), 0)
+                self.assertEqual(QueuedAlert.objects.get().attempts, attempt)
+            with self.assertLogs(level='ERROR') as logs:
+                QueuedAlert.objects.send()
+        self.assertIn('Giving up', logs.output[-1])
+        self.assertFalse(QueuedAlert.objects.exists())
+
+    def test_failed_part_way(self):
+        """Alerts made before a failure are removed with it"""
+        self.reply()
+        with patch.object(ForumTopicAlert, 'send_emails', side_effect=IOError('No mail')):
+            with self.assertLogs(level='ERROR'):
+                self.assertEqual(QueuedAlert.objects.send(), 0)
+        self.assertEqual(self.alerts(), [])
+        self.assertEqual(QueuedAlert.objects.get().attempts, 1)
+        self.assertEqual(QueuedAlert.objects.send(), 1)
+        self.assertEqual(self.alerts(), ['staff', 'tester'])
+
+    def test_once(self):
+        """Forum subscribers only get one unseen alert for 'once' alerts"""
+        alert_type = AlertType.objects.get(slug=ForumTopicAlert.slug)
+        UserAlertSetting.objects.create(user=self.forum_sub, alert=alert_type, email=False)
+        comment = self.reply()
+        for _ in range(2):
+            alert_type.call(instance=self.topic, comment=comment, action='new', once=True)
+        self.assertEqual(UserAlert.objects.filter(user=self.forum_sub).count(), 1)
+
+    def test_irc(self):
+        """The irc bot is told about each new alert, as the library does"""
+        alert_type = AlertType.objects.get(slug=ForumTopicAlert.slug)
+        for user in (self.topic_sub, self.forum_sub):
+            UserAlertSetting.objects.create(user=user, alert=alert_type, irc=True)
+        self.reply()
+        with patch.object(ForumTopicAlert, 'send_irc_msg') as irc:
+            QueuedAlert.objects.send()
+        alerts = [args[0] for (args, _) in irc.call_args_list]
+        self.assertTrue(all(isinstance(alert, UserAlert) for alert in alerts))
+        self.assertEqual(sorted(alert.user.username for alert in alerts), ['staff', 'tester'])
@@ -0,0 +1,90 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the forum visitor tracking
+"""
+
+from datetime import timedelta
+
+from django.utils.timezone import now
+
+from extratest.base import ExtraTestCase
+
+from forums.middleware import RecentUsersMiddleware, RecentVisitors, \
+    VISITOR_AGE, VISITOR_BUCKET, VISITOR_COUNT
+from person.models import User
+
+class VisitorTests(ExtraTestCase):
+    """Visitors are recorded in per-minute buckets"""
+    fixtures = ['test-auth']
+
+    def setUp(self):
+        super(VisitorTests, self).setUp()
+        self.middleware = RecentUsersMiddleware()
+        self.cache = self.middleware.cache
+        self.cache.clear()
+        self.users = list(User.objects.order_by('pk'))
+
+    def visit(self, user, at_time):
+        """Record a visit, as if the user's throttle had run out"""
+        self.cache.delete('visitor:%d' % user.pk)
+        return self.middleware.set_visitor(user, at_time)
+
+    def test_throttled(self):
+        """Each user is recorded at most once a minute"""
+        (user, other) = self.users[:2]
+        self.assertTrue(self.middleware.set_visitor(user, now()))
+        self.assertFalse(self.middleware.set_visitor(user, now()))
+        self.assertTrue(self.middleware.set_visitor(other, now()))
+        self.assertEqual(list(RecentVisitors(self.cache)), [user.pk, other.pk])
+
+    def test_buckets(self):
+        """Visitors are ordered by their latest visit, old visits are forgotten"""
+        (first, second, third) = self.users[:3]
+        start = now() - VISITOR_AGE * 2
+        self.visit(third, start)
+        self.visit(first, now() - timedelta(seconds=VISITOR_BUCKET * 3))
+        self.visit(second, now() - timedelta(seconds=VISITOR_BUCKET * 2))
+        self.visit(first, now())
+
+        visitors = RecentVisitors(self.cache)
+        self.assertEqual(list(visitors), [second.pk, first.pk])
+        seen = dict((pk, user.visited) for (pk, user) in visitors.items())
+        self.assertLess(seen[second.pk], seen[first.pk])
+        self.assertLessEqual(now() - seen[first.pk], timedelta(seconds=VISITOR_BUCKET))
+        self.assertEqual(len(RecentVisitors(self.cache, at_time=start)), 1)
+
+    def test_lazy(self):
+        """Nothing is looked up until the visitors are used"""
+        self.middleware.set_visitor(self.users[0], now())
+        with self.assertNumQueries(0):
+            visitors = self.middleware.get_visitors()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(visitors), 1)
+            self.assertEqual(len(visitors), 1)
+
+    def test_count(self):
+        """Only the latest visitors are shown"""
+        users = [User.objects.create(username='visitor%d' % index)
+                 for index in range(VISITOR_COUNT + 1)]
+        for (index, user) in enumerate(users):
+            self.visit(user, now() - timedelta(seconds=VISITOR_BUCKET * (len(users) - 1 - index)))
+        visitors = list(RecentVisitors(self.cache))
+        self.assertEqual(visitors, [user.pk for user in users[1:]])
@@ -0,0 +1,244 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the forum models and querysets
+"""
+
+import time
+from io import StringIO
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import RequestFactory
+from django.utils.timezone import now
+
+from extratest.base import ExtraTestCase
+from alerts.models import AlertType
+
+from forums.alert import ForumTopicAlert
+from forums.mixins import ForumMixin
+from forums.models import BannedWords, Forum, ForumTopic, Comment, CommentAttachment
+from person.models import User
+from resources.models import Resource
+
+class BannedWordsTests(ExtraTestCase):
+    """Banned phrases are checked with one regular expression"""
+    fixtures = ['test-auth']
+
+    def setUp(self):
+        super(BannedWordsTests, self).setUp()
+        BannedWords.objects.changed()
+
+    def find(self, title, body, new_user=True):
+        """Returns the banned phrases found in the title and body"""
+        found = BannedWords.objects.phrases().find(title, body, new_user=new_user)
+        return sorted(str(word) for word in found)
+
+    def test_combined_regex(self):
+        """Phrases are matched only where they apply"""
+        BannedWords.objects.create(phrase='Spam', in_body=False)
+        BannedWords.objects.create(phrase='spammer')
+        BannedWords.objects.create(phrase='cheap pills', in_title=False, new_user=True)
+        self.assertEqual(BannedWords.objects.phrases().title.pattern, 'spammer|spam')
+        self.assertEqual(self.find('buy spam', 'hello'), ['spam'])
+        self.assertEqual(self.find('hello', 'spam here'), [])
+        self.assertEqual(self.find('hello', 'a spammer'), ['spammer'])
+        self.assertEqual(self.find('hello', 'some cheap pills'), ['cheap pills'])
+        self.assertEqual(self.find('hello', 'some cheap pills', new_user=False), [])
+        self.assertEqual(self.find('cheap pills', 'hello'), [])
+
+    def test_no_phrases(self):
+        """Nothing is found when there are no banned phrases"""
+        self.assertEqual(self.find('spam', 'spam'), [])
+
+    def test_rebuilt_on_change(self):
+        """Adding or removing a phrase rebuilds the expressions"""
+        word = BannedWords.objects.create(phrase='spam')
+        phrases = BannedWords.objects.phrases()
+        self.assertIs(BannedWords.objects.phrases(), phrases)
+
+        BannedWords.objects.create(phrase='eggs')
+        self.assertEqual(self.find('eggs and spam', ''), ['eggs', 'spam'])
+        word.delete()
+        self.assertEqual(self.find('eggs and spam', ''), ['eggs'])
+
+    def test_rebuilt_in_other_process(self):
+        """A change made in another process is seen through the cache"""
+        phrases = BannedWords.objects.phrases()
+        # Added without signals, then announced by the other process
+        BannedWords.objects.bulk_create([BannedWords(phrase='eggs')])
+        self.assertIs(BannedWords.objects.phrases(), phrases)
+        BannedWords.objects.cache.set(BannedWords.objects.cache_key, time.time() + 1, None)
+        self.assertEqual(self.find('eggs', ''), ['eggs'])
+
+
+class ForumCountTests(ExtraTestCase):
+    """Topic and forum counts follow the comments"""
+    fixtures = ['test-auth', 'test-contenttype', 'test-forum']
+
+    def setUp(self):
+        super(ForumCountTests, self).setUp()
+        self.forum = Forum.objects.get()
+        self.topic = ForumTopic.objects.create(forum=self.forum, subject='Counting')
+        self.user = User.objects.get(username='tester')
+
+    def comment(self, text='Hello', **kw):
+        """Post a comment to the topic"""
+        kw.setdefault('user', self.user)
+        return Comment.objects.create(site_id=1, content_type=ForumTopic.content_type(),
+                                      object_pk=str(self.topic.pk), comment=text, **kw)
+
+    def assertCounts(self, count):
+        """Assert the topic and forum post counts"""
+        self.assertEqual(ForumTopic.objects.get(pk=self.topic.pk).post_count, count)
+        self.assertEqual(Forum.objects.get(pk=self.forum.pk).post_count, count)
+
+    def test_add_posts(self):
+        """New comments are added to the counts and dates"""
+        first = self.comment('One', submit_date=now() - timedelta(hours=1))
+        last = self.comment('Two')
+        self.assertCounts(2)
+        topic = ForumTopic.objects.get(pk=self.topic.pk)
+        self.assertEqual(topic.first_posted, first.submit_date)
+        self.assertEqual(topic.last_posted, last.submit_date)
+        self.assertEqual(topic.last_username, 'tester')
+        self.assertEqual(Forum.objects.get(pk=self.forum.pk).last_posted, last.submit_date)
+
+    def test_removed_comments(self):
+        """Removing, restoring and deleting comments change the counts once"""
+        comment = self.comment()
+        self.comment()
+        comment.is_removed = True
+        comment.save()
+        self.assertCounts(1)
+        comment.save()
+        self.assertCounts(1)
+        comment.is_removed = False
+        comment.save()
+        self.assertCounts(2)
+        comment.delete()
+        self.assertCounts(1)
+
+        removed = self.comment(is_removed=True)
+        self.assertCounts(1)
+        removed.delete()
+        self.assertCounts(1)
+
+    def test_loading_comments(self):
+        """Loading comments doesn't look anything up"""
+        self.comment()
+        with self.assertNumQueries(1):
+            list(Comment.objects.all())
+
+    def test_refresh_attachments(self):
+        """Adding and removing attachments sets has_attachments"""
+        comment = self.comment()
+        resource = Resource.objects.create(user=self.user, name='Attached')
+        attachment = CommentAttachment.objects.create(comment=comment, resource=resource)
+        self.assertTrue(ForumTopic.objects.get(pk=self.topic.pk).has_attachments)
+        attachment.delete()
+        self.assertFalse(ForumTopic.objects.get(pk=self.topic.pk).has_attachments)
+
+    def test_update_forum_counts(self):
+        """The counts command puts right counts which are out of step"""
+        first = self.comment('One', submit_date=now() - timedelta(hours=1))
+        self.comment('Two')
+        empty = ForumTopic.objects.create(forum=self.forum, subject='Empty')
+        ForumTopic.objects.filter(pk=self.topic.pk).update(
+            post_count=40, first_posted=None, has_attachments=True)
+        Forum.objects.filter(pk=self.forum.pk).update(post_count=0)
+
+        call_command('update_forum_counts', stdout=StringIO())
+        self.assertCounts(2)
+        topic = ForumTopic.objects.get(pk=self.topic.pk)
+        self.assertEqual(topic.first_posted, first.submit_date)
+        self.assertFalse(topic.has_attachments)
+        self.assertTrue(ForumTopic.objects.get(pk=empty.pk).removed)
+
+
+class SubscriptionTests(ExtraTestCase):
+    """Topic listings know which topics the viewer is subscribed to"""
+    fixtures = ['test-auth', 'test-contenttype', 'test-forum', 'forum-alert']
+
+    def setUp(self):
+        super(SubscriptionTests, self).setUp()
+        forum = Forum.objects.get()
+        self.topics = [ForumTopic.objects.create(forum=forum, subject='Topic %d' % num)
+                       for num in range(3)]
+        self.user = User.objects.get(username='tester')
+        alert_type = AlertType.objects.get(slug=ForumTopicAlert.slug)
+        alert_type.subscriptions.create(user=self.user, target=self.topics[1].pk)
+
+    def test_is_subscribed(self):
+        """Each topic is annotated in the same query"""
+        with self.assertNumQueries(1):
+            topics = dict((topic.pk, topic.is_subscribed)
+                          for topic in ForumTopic.objects.set_user(self.user))
+        self.assertEqual(topics, {
+            self.topics[0].pk: False, self.topics[1].pk: True, self.topics[2].pk: False})
+
+    def test_other_user(self):
+        """Subscriptions are only for the viewing user"""
+        other = User.objects.get(username='staff')
+        qset = ForumTopic.objects.set_user(other)
+        self.assertFalse(any(topic.is_subscribed for topic in qset))
+        self.assertEqual(list(qset.subscribed_only()), [])
+
+    def test_subscribed_only(self):
+        """The listing can be filtered to just subscribed topics"""
+        qset = ForumTopic.objects.set_user(self.user)
+        self.assertEqual(list(qset.subscribed_only()), [self.topics[1]])
+        self.assertEqual(list(qset.subscriptions().values_list('target', flat=True)),
+                         [self.topics[1].pk])
+
+
+class BadgeTests(ExtraTestCase):
+    """The moderation queue count is cached until a comment changes"""
+    fixtures = ['test-auth', 'test-contenttype', 'test-forum']
+
+    def setUp(self):
+        super(BadgeTests, self).setUp()
+        caches['default'].clear()
+        self.topic = ForumTopic.objects.create(forum=Forum.objects.get(), subject='Queue')
+        self.user = User.objects.get(username='tester')
+        self.user.set_moderator(True)
+
+    def get_badges(self):
+        """Returns the badges as the moderator sees them"""
+        view = ForumMixin()
+        view.request = RequestFactory().get('/')
+        view.request.user = User.objects.get(pk=self.user.pk)
+        return view.get_badges()
+
+    def test_purgitory_changed(self):
+        """Hiding or removing a comment is counted straight away"""
+        comment = Comment.objects.create(
+            site_id=1, user=self.user, content_type=ForumTopic.content_type(),
+            object_pk=str(self.topic.pk), comment='Waiting', is_public=False)
+        self.assertEqual(self.get_badges()['purgitory'], 1)
+        comment.is_removed = True
+        comment.save()
+        self.assertEqual(self.get_badges()['purgitory'], 0)
+
+    def test_not_moderator(self):
+        """Only moderators are given the moderation count"""
+        self.user.set_moderator(False)
+        self.assertNotIn('purgitory', self.get_badges())
@@ -21,13 +21,19 @@
 Test the plugin syncing
 """
 
+from unittest.mock import patch, Mock
+
 from django.apps import apps
 from django.conf import settings
+from django.contrib.auth import get_user_model
 
 from extratest.base import ExtraTestCase
 
-from forums.models import Forum, Comment
-from forums.plugins.base import MessageBase
+from forums.alert import ForumTopicAlert
+from forums.models import Forum, Comment, CommentLink
+from forums.plugins.base import MessageBase, AuthorResolver
+from forums.sync import MessageImport
+from forums.management.commands.sync_forums import Command
 
 class PluginTests(ExtraTestCase):
     fixtures = ['test-auth', 'test-contenttype', 'test-forum']
@@ -75,6 +81,17 @@ for plugin_cls in FORUM_APP.plugins:
 
     setattr(PluginTests, 'test_' + plugin_cls.kind(), _test(plugin_cls))
 
+    def _test_bulk(cls):
+        plugin = cls('test', cls.test_conf, test=True)
+        def _inner(self):
+            """Test plugin bulk sync for """ + plugin.name
+            with MessageImport(self.forum, batch_size=2) as importer:
+                plugin.sync(importer.add)
+            self.assertMessages()
+        return _inner
+
+    setattr(PluginTests, 'test_bulk_' + plugin_cls.kind(), _test_bulk(plugin_cls))
+
 
 class MessageTests(ExtraTestCase):
     def test_message(self):
@@ -85,3 +102,97 @@ class MessageTests(ExtraTestCase):
                 'map_b': ['a', 'b', 'c'],
                 'map_c': ('a', 'b', 'c'),
             }
+
+    def test_author_resolver(self):
+        """Authors are found with one query per batch"""
+        User = get_user_model()
+        finn = User.objects.create(username='finn', email='finn@example.com')
+        jake = User.objects.create(username='jake', email='shared@example.com')
+        User.objects.create(username='jake2', email='shared@example.com')
+
+        authors = AuthorResolver()
+        addresses = [('Finn', 'finn@example.com'), ('jake', 'shared@example.com'),
+                     ('finn', None), ('nobody', 'nobody@example.com')] * 100
+        with self.assertNumQueries(2):
+            authors.load(addresses)
+        with self.assertNumQueries(0):
+            users = [authors.get_user(*address) for address in addresses[:4]]
+        # An email shared by two users falls back to the username
+        self.assertEqual(users, [finn, jake, finn, None])
+
+
+class Message(MessageBase):
+    """A simple message for importing"""
+    def get_message_id(self):
+        return self['id']
+
+    def get_from(self):
+        return (self['name'], self['name'] + '@example.com')
+
+    def get_reply_id(self):
+        return dict.get(self, 'reply_id')
+
+    def get_subject(self):
+        return dict.get(self, 'subject', 'Re')
+
+
+class ImportTests(ExtraTestCase):
+    fixtures = ['test-auth', 'test-contenttype', 'test-forum']
+
+    def setUp(self):
+        super(ImportTests, self).setUp()
+        self.forum = Forum.objects.get()
+        self.messages = [
+            Message(dict(id='a', name='finn', subject='Topic', body='First')),
+            Message(dict(id='b', reply_id='a', name='jake', body='Second')),
+            Message(dict(id='c', reply_id='b', name='finn', body='Third')),
+        ]
+        self.alert = patch.object(type(ForumTopicAlert.get_alert_type()), 'call', create=True)
+
+    def test_bulk_import(self):
+        """Each message is linked to its own comment"""
+        with self.alert as call:
+            with MessageImport(self.forum, batch_size=2) as importer:
+                for message in self.messages:
+                    importer.add(message)
+        links = dict(CommentLink.objects.values_list('message_id', 'comment__comment'))
+        self.assertEqual(links, {'a': 'First', 'b': 'Second', 'c': 'Third'})
+        self.assertEqual(self.forum.topics.get().post_count, 3)
+        self.assertEqual(call.call_count, 1)
+
+    def test_failed_import(self):
+        """Saved batches are counted, but not alerted when the import fails"""
+        with self.alert as call:
+            with self.assertRaises(ValueError):
+                with MessageImport(self.forum, batch_size=1) as importer:
+                    importer.add(self.messages[0])
+                    raise ValueError("Lost connection")
+        self.assertEqual(self.forum.topics.get().post_count, 1)
+        self.assertFalse(call.called)
+
+
+    def test_bulk_sync(self):
+        """The plugin only saves its position once every batch is saved"""
+        plugin = Mock()
+        plugin.sync.side_effect = lambda callback: [callback(msg) for msg in self.messages]
+        with self.alert as call:
+            Command.bulk_sync(plugin, [self.forum], 2, AuthorResolver())
+        self.assertEqual(CommentLink.objects.count(), 3)
+        self.assertEqual(call.call_count, 1)
+        self.assertTrue(plugin.save_position.called)
+
+    def test_bulk_sync_failed(self):
+        """A failed sync isn't alerted and the plugin keeps its position"""
+        def sync(callback):
+            for msg in self.messages:
+                callback(msg)
+            raise ValueError("Lost connection")
+        plugin = Mock()
+        plugin.sync.side_effect = sync
+        with self.alert as call:
+            with self.assertRaises(ValueError):
+                Command.bulk_sync(plugin, [self.forum], 2, AuthorResolver())
+        # The first batch is saved, the next sync will skip its messages
+        self.assertEqual(CommentLink.objects.count(), 2)
+        self.assertFalse(call.called)
+        self.assertFalse(plugin.save_position.called)
@@ -0,0 +1,186 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test the forum comment listing and its cached fragments
+"""
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.contrib.auth.models import AnonymousUser
+from django.template import Template, Context
+from django.test import RequestFactory
+from django.utils.timezone import now
+from django_comments.models import CommentFlag
+
+from extratest.base import ExtraTestCase
+
+from forums.models import Forum, ForumTopic, Comment, UserFlag
+from person.models import User
+
+LIST = Template('{% load forum_comments %}{% get_forum_comment_list for topic as comments %}'
+                '{% for comment in comments %}{{ comment.pk }}:{{ comment.position }} '
+                '{% endfor %}{{ page_obj.number }}')
+RENDER = Template('{% load forum_comments %}{% get_forum_comment_list for topic as comments %}'
+                  '{% render_forum_comments comments %}')
+
+class CommentListTests(ExtraTestCase):
+    """Comments are listed a page at a time"""
+    fixtures = ['test-auth', 'test-contenttype', 'test-forum']
+
+    def setUp(self):
+        super(CommentListTests, self).setUp()
+        self.topic = ForumTopic.objects.create(forum=Forum.objects.get(), subject='Pages')
+        user = User.objects.get(username='tester')
+        start = now() - timedelta(hours=1)
+        self.comments = [Comment.objects.create(
+            site_id=1, user=user, content_type=ForumTopic.content_type(),
+            object_pk=str(self.topic.pk), comment='Post %d' % num,
+            submit_date=start + timedelta(minutes=num)) for num in range(5)]
+
+    def render(self, **query):
+        """Returns the page of comments and the page number"""
+        request = RequestFactory().get('/', query)
+        with patch('forums.templatetags.forum_comments.COMMENTS_PER_PAGE', 2):
+            return LIST.render(Context({'topic': self.topic, 'request': request}))
+
+    def expected(self, page, *nums):
+        """The output for these comment indexes on this page"""
+        return ''.join('%d:%d ' % (self.comments[num].pk, num + 1) for num in nums) + str(page)
+
+    def test_pages(self):
+        """Pages are selected by number, with positions in the whole thread"""
+        self.assertEqual(self.render(), self.expected(1, 0, 1))
+        self.assertEqual(self.render(page=2), self.expected(2, 2, 3))
+        self.assertEqual(self.render(page='last'), self.expected(3, 4))
+        self.assertEqual(self.render(page=9), self.expected(1, 0, 1))
+        self.assertEqual(self.render(page='x'), self.expected(1, 0, 1))
+
+    def test_comment_page(self):
+        """The page with a linked comment is shown"""
+        self.assertEqual(self.render(c=self.comments[3].pk), self.expected(2, 2, 3))
+        self.assertEqual(self.render(c=self.comments[4].pk), self.expected(3, 4))
+        self.assertEqual(self.render(c=self.comments[3].pk, page=1), self.expected(1, 0, 1))
+
+    def test_missing_comment(self):
+        """Unknown or removed comments fall back to the first page"""
+        self.comments[0].is_removed = True
+        self.comments[0].save()
+        self.assertEqual(self.render(c=self.comments[0].pk), '%d:1 %d:2 1' % (
+            self.comments[1].pk, self.comments[2].pk))
+        self.assertEqual(self.render(c=999), self.render())
+        self.assertEqual(self.render(c='x'), self.render())
+
+
+class CommentFragmentTests(ExtraTestCase):
+    """Each comment is rendered once until it changes"""
+    fixtures = ['test-auth', 'test-contenttype', 'test-forum']
+
+    def setUp(self):
+        super(CommentFragmentTests, self).setUp()
+        caches['default'].clear()
+        self.topic = ForumTopic.objects.create(forum=Forum.objects.get(), subject='Cached')
+        self.user = User.objects.get(username='tester')
+        self.other = User.objects.get(username='staff')
+        self.moderator = User.objects.get(username='admin')
+        self.comment = Comment.objects.create(
+            site_id=1, user=self.user, content_type=ForumTopic.content_type(),
+            object_pk=str(self.topic.pk), comment='Original text',
+            submit_date=now() - timedelta(days=2))
+
+    def render(self, user=None):
+        """Render the comments as this user would see them"""
+        request = RequestFactory().get('/topic/')
+        # A fresh user object, so permissions are looked up again
+        request.user = AnonymousUser() if user is None else User.objects.get(pk=user.pk)
+        return RENDER.render(Context({'topic': self.topic, 'request': request}))
+
+    def change_quietly(self, text):
+        """Change the comment without telling the cache"""
+        Comment.objects.filter(pk=self.comment.pk).update(comment=text)
+
+    def test_cached(self):
+        """The cached rendering is used until the comment changes"""
+        self.assertIn('Original text', self.render())
+        self.change_quietly('Quiet text')
+        self.assertIn('Original text', self.render())
+
+    def test_edited(self):
+        """Editing the comment renders it again"""
+        self.assertIn('Original text', self.render())
+        self.comment.comment = 'Edited text'
+        self.comment.save()
+        self.assertIn('Edited text', self.render())
+
+    def test_flagged(self):
+        """Flags and emotes on the comment render it again"""
+        self.assertIn('Original text', self.render())
+        self.change_quietly('Quiet text')
+        CommentFlag.objects.create(comment=self.comment, user=self.other, flag='X')
+        self.assertIn('Quiet text', self.render())
+
+    def test_removed(self):
+        """Removed comments are not shown, and are rendered again if restored"""
+        self.assertIn('Original text', self.render())
+        self.comment.is_removed = True
+        self.comment.save()
+        self.assertNotIn('Original text', self.render())
+        self.change_quietly('Quiet text')
+        self.comment.refresh_from_db()
+        self.comment.is_removed = False
+        self.comment.save()
+        self.assertIn('Quiet text', self.render())
+
+    def test_user_changed(self):
+        """Changes to the comment's user, like a new flag, render it again"""
+        self.assertIn('Original text', self.render())
+        self.change_quietly('Quiet text')
+        UserFlag.objects.create(user=self.user, flag='*', title='Star')
+        html = self.render()
+        self.assertIn('Quiet text', html)
+        self.assertIn('title="Star"', html)
+
+    def test_user_visited(self):
+        """Saving the user's last visit doesn't render their comments again"""
+        self.assertIn('Original text', self.render())
+        self.change_quietly('Quiet text')
+        self.user.visits += 1
+        self.user.save(update_fields=['last_seen', 'visits'])
+        self.assertIn('Original text', self.render())
+        self.user.save(update_fields=['last_seen', 'first_name'])
+        self.assertIn('Quiet text', self.render())
+
+    def test_roles(self):
+        """Each sort of viewer has their own rendering"""
+        self.assertIn('Original text', self.render())
+        self.change_quietly('User text')
+        self.assertIn('User text', self.render(self.other))
+        self.change_quietly('Own text')
+        own = self.render(self.user)
+        self.assertIn('Own text', own)
+        # Links find the comment's page, and the editor returns to it
+        self.assertIn('?c={0}#c{0}'.format(self.comment.pk), own)
+        self.assertIn('%3Fc={0}%23c{0}'.format(self.comment.pk), own)
+        self.change_quietly('Moderator text')
+        moderated = self.render(self.moderator)
+        self.assertIn('Moderator text', moderated)
+        self.assertIn('comment-remove', moderated)
+        self.assertIn('Original text', self.render())
@@ -99,7 +99,7 @@ class TopicList(UserVisit, ForumMixin, ListView):
             qset = qset.filter(first_username=self.kwargs['username'])
             self.set_context_datum('forum_user', user)
         if self.request.user.is_authenticated():
-            qset.set_user(self.request.user)
+            qset = qset.set_user(self.request.user)
         if self.kwargs:
             self.set_context_datum('rss', reverse("forums:topic_feed", kwargs=self.kwargs))
         return qset
@@ -122,7 +122,6 @@ class Subscriptions(UserRequired, TopicList):
     template_name = 'forums/forumtopic_list_user.html'
     def get_queryset(self):
         qset = super().get_queryset()
-        qset.set_user(self.request.user)
         self.set_context_datum('forum_user', self.request.user)
         return qset.subscribed_only()
 
@@ -154,7 +153,7 @@ class TopicDetail(UserVisit, DetailView):
                 comment = topic.comments.filter(submit_date__gt=dtime).first()
                 if comment:
                     url = topic.get_absolute_url()
-                    return HttpResponseRedirect('{}#c{}'.format(url, comment.pk))
+                    return HttpResponseRedirect('{0}?c={1}#c{1}'.format(url, comment.pk))
             except ValueError as err:
                 print("ERROR: {}".format(err))
         return ret
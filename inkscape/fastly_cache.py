@@ -24,12 +24,16 @@ Dealing with fastly caches.
 import os
 import sys
 import ssl
+import json
 import time
+import hashlib
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
 from django.templatetags.static import static
+from django.utils.module_loading import import_string
 
 try:
     import fastly
@@ -41,13 +45,27 @@ except ImportError:
 if hasattr(ssl, '_create_unverified_context'):
     ssl._create_default_https_context = ssl._create_unverified_context
 
-def touch(fname, times=None):
-    """Unix like touching of files"""
-    with open(fname, 'a'):
-        os.utime(fname, times)
+MANIFEST = '.fastly_manifest'
+
+def file_hash(path):
+    """Returns the sha1 hex digest of the file's contents"""
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as fhl:
+        for chunk in iter(lambda: fhl.read(65536), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
 KEY = 'FASTLY_CACHE_API_KEY'
 SERVICE = 'FASTLY_CACHE_SERVICE'
+BACKEND = 'FASTLY_CACHE_BACKEND'
+
+# Fastly accepts up to this many surrogate keys in one purge request
+BULK_KEYS = 256
+
+def get_backend(**kwargs):
+    """Returns the configured fastly cache (the stub cache when testing)"""
+    name = getattr(settings, BACKEND, 'inkscape.fastly_cache.FastlyCache')
+    return import_string(name)(**kwargs)
 
 class FastlyCache(object):
     """Control a fastly cache, uses default settings if available"""
@@ -60,6 +78,11 @@ class FastlyCache(object):
             self.api = fastly.API()
             self.api.authenticate_by_key(self.key)
 
+    @property
+    def enabled(self):
+        """Returns True if purges can be sent to a fastly service"""
+        return self.api is not None
+
     def clean_static(self, old=False):
         """
           Purge all new static files from cache,
@@ -70,10 +93,9 @@ class FastlyCache(object):
             return sys.stderr.write("\nStatic directory doesn't exist or is "
                 "empty. Have you run collectstatic yet?\n\n")
 
-        for path in self.clean_dir(settings.STATIC_ROOT, old=old, label='Static'):
-            # We don't want to just use get static url, because that just points
-            # back to fastly cache which is not what we need for this api
-            self.purge(static(path))
+        # We don't want to just use get static url, because that just points
+        # back to fastly cache which is not what we need for this api
+        self.clean_root(settings.STATIC_ROOT, static, old=old, label='Static')
 
     def clean_media(self, old=False):
         """Like clean_static but for media files"""
@@ -81,41 +103,102 @@ class FastlyCache(object):
             return sys.stderr.write("\nMedia directory doesn't exist or is "
                 "empty. Do you have any media files yet?\n\n")
 
-        for path in self.clean_dir(settings.MEDIA_ROOT, old=old, label='Media'):
-            self.purge(os.path.join(settings.MEDIA_URL, path))
+        self.clean_root(settings.MEDIA_ROOT, lambda path: os.path.join(settings.MEDIA_URL, path),
+                        old=old, label='Media')
+
+    def clean_root(self, root, to_url, old=False, label=''):
+        """
+        Purge the changed files in root, using to_url to turn their paths
+        into urls. Files which couldn't be purged are left out of the new
+        manifest, so they are purged again next time.
+        """
+        (changed, manifest) = self.clean_dir(root, old=old, label=label)
+        results = self.purge_urls([to_url(path) for path in changed])
+        failed = [path for (path, result) in zip(changed, results) if not result]
+        if failed:
+            print("  * {:d} {} files couldn't be purged\n\n".format(len(failed), label))
+        self.save_manifest(root, manifest, failed)
 
-    def clean_dir(self, root, old=False, label=''):
+    @staticmethod
+    def clean_dir(root, old=False, label=''):
         """
-        Returns all files that have changed since the last .fastly_cache was created
+        Returns all files whose contents have changed (or have been added or
+        removed) since the last clean, according to the .fastly_manifest of
+        file sizes, modified times and hashes, and the new manifest to save
+        once they are purged. Only files with a new size or modified time are
+        hashed again, using a pool of processes.
         """
         last_clear = 0
+        manifest = {}
         last_file = os.path.join(root, '.fastly_cleared')
-        if os.path.isfile(last_file):
+        manifest_file = os.path.join(root, MANIFEST)
+        if os.path.isfile(manifest_file):
+            with open(manifest_file, 'r') as fhl:
+                manifest = json.load(fhl)
+            print("\nLast cache clear: {}\n".format(time.ctime(os.path.getmtime(manifest_file))))
+        elif os.path.isfile(last_file):
+            # Cleared before the manifest, so fall back to modified times once
             last_clear = os.path.getmtime(last_file)
-            print("\nLast cache clear: {}\n".format(time.ctime(last_clear)))
+            print("\nLast cache clear: {} (no manifest)\n".format(time.ctime(last_clear)))
         else:
             print("\nNever cleared before (first run)\n")
 
-        count = 0
-        cleared = 0
-
-        for name, _, files in os.walk(root, topdown=False):
+        found = {}
+        for name, _, files in os.walk(root):
             for fname in files:
                 path = os.path.join(name, fname)
-                if path == last_file:
+                if path in (last_file, manifest_file):
                     continue
-                count += 1
+                stat = os.stat(path)
+                found[os.path.relpath(path, root)] = [stat.st_size, stat.st_mtime]
+
+        rehash = [path for (path, info) in found.items()
+                  if manifest.get(path, [None, None])[:2] != info]
+        new_manifest = dict((path, manifest[path]) for path in found if path not in rehash)
+        if rehash:
+            with ProcessPoolExecutor() as pool:
+                hashes = pool.map(file_hash, [os.path.join(root, path) for path in rehash],
+                                  chunksize=64)
+                for path, digest in zip(rehash, hashes):
+                    new_manifest[path] = found[path] + [digest]
 
-                if old or os.path.getmtime(path) > last_clear:
-                    cleared += 1
-                    yield path.replace(root, '').lstrip('/')
+        changed_paths = []
+        for path in sorted(set(found) | set(manifest)):
+            if path not in new_manifest:
+                changed = True # Removed
+            elif path not in manifest:
+                changed = bool(manifest) or found[path][1] > last_clear
+            else:
+                changed = manifest[path][2] != new_manifest[path][2]
+            if old or changed:
+                changed_paths.append(path)
 
-        print("\n  * {:d} of {:d} {} files cleared\n\n".format(cleared, count, label))
-        if not count:
+        print("\n  * {:d} of {:d} {} files cleared\n\n".format(
+            len(changed_paths), len(found), label))
+        if not found:
             print("There weren't any {} files, run collectstatic.".format(label))
+        return (changed_paths, new_manifest)
 
-        if cleared:
-            touch(last_file)
+    @staticmethod
+    def save_manifest(root, manifest, failed=()):
+        """
+        Write the new manifest from clean_dir, the files in failed keep their
+        entry from the last manifest (or none) so they are cleared again.
+        """
+        manifest_file = os.path.join(root, MANIFEST)
+        last = {}
+        if os.path.isfile(manifest_file):
+            with open(manifest_file, 'r') as fhl:
+                last = json.load(fhl)
+        manifest = dict(manifest)
+        for path in failed:
+            if path in last:
+                manifest[path] = last[path]
+            else:
+                manifest.pop(path, None)
+        with open(manifest_file + '.tmp', 'w') as fhl:
+            json.dump(manifest, fhl)
+        os.rename(manifest_file + '.tmp', manifest_file)
 
     def purge_key(self, key):
         """Take an object key and ask the content to be refreshed"""
@@ -128,6 +211,32 @@ class FastlyCache(object):
             logging.error("Couldn't purge key, %s" % str(err))
             return False
 
+    def purge_keys(self, keys):
+        """Ask for the content of many object keys to be refreshed at once,
+        returns the keys which were purged."""
+        if self.api is None:
+            return []
+        keys = list(keys)
+        purged = []
+        for start in range(0, len(keys), BULK_KEYS):
+            batch = keys[start:start + BULK_KEYS]
+            try:
+                self.api.conn.request('POST', '/service/%s/purge' % self.service,
+                    headers={'Surrogate-Key': " ".join(batch)})
+                purged += batch
+            except Exception as err:
+                logging.error("Couldn't purge keys, %s" % str(err))
+        return purged
+
+    def purge_urls(self, urls, workers=8):
+        """Purge many urls, a few requests are sent at the same time"""
+        if not urls:
+            return []
+        # Look up the site once, before the threads need it
+        get_current_site(None)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(self.purge, urls))
+
     def purge_media(self, field):
         """Takes a file field and purges the media url"""
         if not hasattr(field, 'url'):
@@ -152,3 +261,26 @@ class FastlyCache(object):
             return self.api.purge_url(domain, '/' + location)
         except Exception:
             sys.stderr.write("Error: purging %s -> %s/%s (ignored)\n" % var)
+            return False
+
+
+class StubFastlyCache(FastlyCache):
+    """Records purges instead of sending them, for tests and offline use"""
+    purged = []
+    enabled = True
+
+    def __init__(self, *args, **kwargs):
+        self.key = kwargs.get('key', None)
+        self.service = kwargs.get('service', 'stub')
+        self.api = None
+
+    def purge_key(self, key):
+        self.purged.append(('key', key))
+        return True
+
+    def purge_keys(self, keys):
+        return [key for key in keys if self.purge_key(key)]
+
+    def purge(self, url):
+        self.purged.append(('url', url))
+        return True
@@ -0,0 +1,49 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Send the queued fastly cache purges in batches.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from inkscape.models import FastlyPurge
+
+class Command(BaseCommand):
+    """Send queued fastly purges"""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--loop', '-l', default=False, action='store_true',
+            help='Keep running and send purges every FASTLY_PURGE_WINDOW seconds.')
+        parser.add_argument('--all', '-a', default=False, action='store_true',
+            help='Send every purge now, even those queued within the window.')
+
+    def handle(self, *args, **options):
+        window = 0 if options['all'] else settings.FASTLY_PURGE_WINDOW
+        while True:
+            count = FastlyPurge.objects.send(window)
+            if options['verbosity'] > 1:
+                print("Sent {} fastly purges".format(count))
+            if not options['loop']:
+                break
+            time.sleep(max(settings.FASTLY_PURGE_WINDOW, 1))
@@ -21,7 +21,9 @@
 Core middleware for the inkscape website.
 """
 
+import re
 import logging
+import hashlib
 from inspect import isclass
 
 from django.core.cache import caches
@@ -35,7 +37,8 @@ from django.db.models import signals, Model, Manager, QuerySet
 from django.utils.cache import get_cache_key
 
 from .utils import BaseMiddleware, QuerySetWrapper, to, context_items
-from .fastly_cache import FastlyCache
+from .fastly_cache import get_backend
+from .models import CacheTrack, FastlyPurge
 
 #
 # Models which are suppressed do not invalidate their caches when they
@@ -46,7 +49,16 @@ SUPPRESSED_MODELS = ['User']
 #
 # Ignored models never invalidate caches.
 #
-IGNORED_MODELS = ['Session']
+IGNORED_MODELS = ['Session', 'CacheTrack', 'FastlyPurge']
+#
+# Surrogate-Key headers list object keys as short hashes, when a page shows
+# more than SURROGATE_COLLAPSE objects of one model, the model's key is used
+# instead (it's purged whenever any of them change). Headers are kept under
+# SURROGATE_MAX_SIZE so nginx will pass them on.
+#
+SURROGATE_COLLAPSE = getattr(settings, 'SURROGATE_COLLAPSE', 20)
+SURROGATE_MAX_SIZE = getattr(settings, 'SURROGATE_MAX_SIZE', 2048)
+OBJECT_KEY = re.compile(r'^cache:(\w+)-.+$')
 
 
 class TrackCacheMiddleware(BaseMiddleware):
@@ -65,7 +77,7 @@ class TrackCacheMiddleware(BaseMiddleware):
     @classmethod
     def fastly_cache(cls):
         if not hasattr(cls, '_fastly'):
-            cls._fastly = FastlyCache()
+            cls._fastly = get_backend()
         return cls._fastly
 
     @classmethod
@@ -90,23 +102,49 @@ class TrackCacheMiddleware(BaseMiddleware):
             logging.warning("!ERR DEL cache, '%s' is not a model." % str(obj))
         #print "Invalidating Keys: %s > %s" % (str(keys), str(caches))
         cls.cache.delete_many(list(caches))
+        CacheTrack.objects.forget(caches)
+
+        # Purges are sent in batches by the send_fastly_purges command
+        FastlyPurge.objects.queue(keys=[cls.surrogate_key(key) for key in fastly_keys])
 
-        for key in set(fastly_keys):
-            FastlyCache().purge_key(key)
+    @staticmethod
+    def surrogate_key(key):
+        """Returns a short, header safe version of the object key"""
+        return hashlib.md5(key.encode('utf8')).hexdigest()[:12]
+
+    @classmethod
+    def surrogate_header(cls, keys):
+        """
+        Returns the Surrogate-Key header for these object keys, or None if
+        it's too big even after collapsing objects down to their models.
+        """
+        models = {}
+        for key in keys:
+            match = OBJECT_KEY.match(key)
+            if match:
+                models.setdefault(match.group(1), set()).add(key)
+
+        for collapse in (SURROGATE_COLLAPSE, 0):
+            surrogates = set(keys)
+            for (model, objs) in models.items():
+                if len(objs) > collapse:
+                    surrogates -= objs
+                    surrogates.add("cache:%s" % model)
+            header = " ".join(sorted(cls.surrogate_key(key) for key in surrogates))
+            if len(header) <= SURROGATE_MAX_SIZE:
+                return header
+        return None
 
     @classmethod
     def invalidate_all(cls):
         """Invalidate the ENTIRE cache (normally used for debugging)"""
         cls.cache.clear()
+        CacheTrack.objects.all().delete()
 
     @classmethod
     def get_caches(cls, obj, created=False):
-        caches = set()
-        for key in cls.get_keys(obj, created):
-            cache = cls.cache.get(key)
-            if cache is not None:
-                caches |= cache
-        return caches
+        """Returns all the cached pages which show this object"""
+        return CacheTrack.objects.cache_keys(cls.get_keys(obj, created))
 
     @classmethod
     def get_create_key(cls, model, fields):
@@ -172,14 +210,11 @@ class TrackCacheMiddleware(BaseMiddleware):
     @classmethod
     def track_cache(cls, obj, cache_key):
         """Associate this cache_key (url pointer) with this model object"""
-        for key in cls.get_keys(obj):
+        keys = list(cls.get_keys(obj))
+        # Keep a record of urls causing caches for longer
+        CacheTrack.objects.add(keys, cache_key, int(cls.cache_timeout * 1.5))
+        for key in keys:
             yield key
-            caches = cls.cache.get(key)
-            if not caches:
-                caches = set()
-            caches.add(cache_key)
-            # Keep a record of urls causing caches for longer
-            cls.cache.set(key, caches, int(cls.cache_timeout * 1.5))
 
     def process_template_response(self, request, response):
         if settings.DEBUG:
@@ -234,10 +269,9 @@ class TrackCacheMiddleware(BaseMiddleware):
         # many-to-many way, allowing for pages to be invalidated smartly.
         obj_surrogates = set([key for obj in tracks for key in self.get_keys(obj)])
         if obj_surrogates:
-            # This will currently make the header WAY too big for nginx. So a new method
-            # is needed to keep track of cached items and their changes in fastly.
-            #response['Surrogate-Key'] = " ".join(obj_surrogates)
-            pass
+            header = self.surrogate_header(obj_surrogates)
+            if header:
+                response['Surrogate-Key'] = header
 
         if not getattr(request, '_cache_update_cache', False):
             return response
@@ -247,8 +281,8 @@ class TrackCacheMiddleware(BaseMiddleware):
             return response
 
         response.cache_key = cache_key
-        for obj in tracks:
-            response.cache_keys |= set(self.track_cache(obj, cache_key))
+        CacheTrack.objects.add(obj_surrogates, cache_key, int(self.cache_timeout * 1.5))
+        response.cache_keys |= obj_surrogates
 
         return response
 
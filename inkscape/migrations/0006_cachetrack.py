@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 14:06
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inkscape', '0005_auto_20181016_1557'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheTrack',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=255)),
+                ('cache_key', models.CharField(db_index=True, max_length=512)),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='cachetrack',
+            unique_together=set([('key', 'cache_key')]),
+        ),
+    ]
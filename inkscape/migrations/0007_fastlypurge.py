@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 14:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inkscape', '0006_cachetrack'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FastlyPurge',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('k', 'Surrogate Key'), ('u', 'Url')], max_length=1)),
+                ('target', models.CharField(max_length=1024)),
+                ('queued', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='fastlypurge',
+            unique_together=set([('kind', 'target')]),
+        ),
+    ]
@@ -22,8 +22,13 @@ Utility models which store data for the whole website's use.
 """
 import urllib
 import hashlib
+from datetime import timedelta
 
-from django.db.models import Model, CharField, FileField, URLField
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Model, QuerySet, CharField, DateTimeField, FileField, URLField,
+)
+from django.utils.timezone import now
 
 from .utils import ReplaceStore, URLFile
 
@@ -55,3 +60,128 @@ class RemoteImage(Model):
                 # Set the local_file to an 'image not found'
                 self.local_file.name = RemoteImage.objects.get(pk=1).local_file.name
         return super(RemoteImage, self).save(**kw)
+
+
+def track_key(key):
+    """Long keys are hashed so they fit in the CacheTrack table"""
+    if len(key) > 255:
+        return hashlib.md5(key.encode('utf8')).hexdigest()
+    return key
+
+class CacheTrackQuerySet(QuerySet):
+    """Add, look up and expire cached page associations in bulk"""
+    def add(self, keys, cache_key, timeout):
+        """Associate the cached page with all the object keys for timeout seconds"""
+        keys = set(track_key(key) for key in keys)
+        expires = now() + timedelta(seconds=timeout)
+        qset = self.filter(cache_key=cache_key, key__in=keys)
+        found = set(qset.values_list('key', flat=True))
+        qset.update(expires=expires)
+        try:
+            with transaction.atomic():
+                self.bulk_create([
+                    self.model(key=key, cache_key=cache_key, expires=expires)
+                    for key in keys - found])
+        except IntegrityError:
+            # Another worker added the same page at the same time
+            for key in keys - found:
+                self.update_or_create(key=key, cache_key=cache_key,
+                                      defaults={'expires': expires})
+
+    def cache_keys(self, keys):
+        """Returns the set of cached pages showing any of these object keys"""
+        keys = [track_key(key) for key in keys]
+        return set(self.filter(key__in=keys, expires__gt=now())\
+                       .values_list('cache_key', flat=True))
+
+    def forget(self, cache_keys):
+        """Remove all the associations for these cached pages"""
+        return self.filter(cache_key__in=cache_keys).delete()
+
+    def expired(self):
+        """Returns associations who's cached page has timed out"""
+        return self.filter(expires__lte=now())
+
+
+class CacheTrack(Model):
+    """
+    Records which cached pages (cache_key) show which objects (key), so the
+    pages can be invalidated when the object changes, see TrackCacheMiddleware.
+    """
+    key = CharField(max_length=255, db_index=True)
+    cache_key = CharField(max_length=512, db_index=True)
+    expires = DateTimeField(db_index=True)
+
+    objects = CacheTrackQuerySet.as_manager()
+
+    class Meta:
+        unique_together = (('key', 'cache_key'),)
+
+    def __str__(self):
+        return "%s > %s" % (self.key, self.cache_key)
+
+
+class FastlyPurgeQuerySet(QuerySet):
+    """Queue up purges and send them in batches"""
+    def queue(self, keys=(), urls=()):
+        """Add object keys and urls to the queue, skips any already waiting"""
+        items = set([(FastlyPurge.KIND_KEY, key) for key in keys]
+                    + [(FastlyPurge.KIND_URL, url) for url in urls])
+        if not items:
+            return
+        waiting = set(self.filter(target__in=[target for (_, target) in items])\
+                          .values_list('kind', 'target'))
+        try:
+            with transaction.atomic():
+                self.bulk_create([self.model(kind=kind, target=target)
+                                  for (kind, target) in items - waiting])
+        except IntegrityError:
+            # Another worker queued the same purge at the same time
+            for (kind, target) in items - waiting:
+                self.get_or_create(kind=kind, target=target)
+
+    def send(self, window=0, cache=None):
+        """
+        Send all purges queued for longer than window seconds, the queue is
+        emptied before sending so anything queued while sending is kept for
+        next time, and any purge which fails is queued again. Returns the
+        number of purges sent.
+        """
+        from .fastly_cache import get_backend
+        qset = self.filter(queued__lte=now() - timedelta(seconds=window))
+        items = list(qset.values_list('pk', 'kind', 'target'))
+        if not items:
+            return 0
+        self.filter(pk__in=[pk for (pk, _, _) in items]).delete()
+
+        cache = cache or get_backend()
+        if not cache.enabled:
+            # Without a fastly service there is nothing to ever purge
+            return 0
+        keys = [target for (_, kind, target) in items if kind == FastlyPurge.KIND_KEY]
+        failed_keys = set(keys) - set(cache.purge_keys(keys))
+        failed_urls = [target for (_, kind, target) in items
+                       if kind == FastlyPurge.KIND_URL and not cache.purge(target)]
+        self.queue(keys=failed_keys, urls=failed_urls)
+        return len(items) - len(failed_keys) - len(failed_urls)
+
+
+class FastlyPurge(Model):
+    """A url or object key waiting to be purged from the fastly cache"""
+    KIND_KEY = 'k'
+    KIND_URL = 'u'
+    KINDS = (
+        (KIND_KEY, 'Surrogate Key'),
+        (KIND_URL, 'Url'),
+    )
+    kind = CharField(max_length=1, choices=KINDS)
+    target = CharField(max_length=1024)
+    queued = DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = FastlyPurgeQuerySet.as_manager()
+
+    class Meta:
+        unique_together = (('kind', 'target'),)
+
+    def __str__(self):
+        return "%s:%s" % (self.kind, self.target)
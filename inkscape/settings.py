@@ -63,11 +63,23 @@ ENABLE_PROFILER_TOOLBAR = False
 ENABLE_PYMPLER_TOOLBAR = False
 CACHE_PAGE_SETTING = 3600
 
+# Resource views and downloads are spooled and added to the database at most
+# this many seconds apart (see flush_counters), zero adds each hit straight away.
+RESOURCE_COUNTER_WINDOW = 0 if IS_TEST else 300
+
+# Fastly purges are queued and sent in batches by send_fastly_purges, a purge
+# waits this many seconds so repeated changes to the same page are sent once.
+FASTLY_PURGE_WINDOW = 30
+FASTLY_CACHE_BACKEND = 'inkscape.fastly_cache.FastlyCache'
+if IS_TEST:
+    FASTLY_CACHE_BACKEND = 'inkscape.fastly_cache.StubFastlyCache'
+
 DEBUG = False
 SITE_ADDRESS = None
 
 CODE_PATH = os.path.dirname(os.path.abspath(__file__))
 PROJECT_PATH = os.path.abspath(os.path.join(CODE_PATH, ".."))
+RESOURCE_COUNTER_SPOOL = os.path.join(PROJECT_PATH, 'data', 'counters.spool')
 
 #
 # --- Above this line, settings can be over-ridden for deployment
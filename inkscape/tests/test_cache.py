@@ -0,0 +1,119 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+"""
+Test the page cache tracking and the fastly purges.
+"""
+
+import os
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.utils.timezone import now
+
+from extratest.base import ExtraTestCase
+
+from inkscape.middleware import TrackCacheMiddleware
+from inkscape.models import CacheTrack
+from inkscape.fastly_cache import FastlyCache, StubFastlyCache
+
+class CacheTrackTests(ExtraTestCase):
+    """Cached pages are recorded against the objects they show"""
+    def setUp(self):
+        self.obj = Group.objects.create(name='Tracked')
+        self.alt = Group.objects.create(name='Untracked')
+        self.track = lambda o: list(TrackCacheMiddleware.track_cache(o, 'key'))
+
+    def test_tracking_store(self):
+        """Tracked pages are found once and forgotten when invalidated"""
+        self.track(self.obj)
+        self.track(self.obj)
+        self.track(Group)
+        self.assertEqual(CacheTrack.objects.filter(cache_key='key').count(), 2)
+        self.assertEqual(TrackCacheMiddleware.get_caches(self.obj), {'key'})
+        self.assertEqual(TrackCacheMiddleware.get_caches(self.alt), set())
+        TrackCacheMiddleware.invalidate(self.obj)
+        self.assertFalse(CacheTrack.objects.filter(cache_key='key').exists())
+
+    def test_clear_expired(self):
+        """Only the tracks for expired pages are cleared"""
+        self.track(self.obj)
+        CacheTrack.objects.create(key='cache:Group', cache_key='old',
+                                  expires=now() - timedelta(seconds=1))
+        call_command('clear_cache_tracks')
+        self.assertEqual(set(CacheTrack.objects.values_list('cache_key', flat=True)), {'key'})
+
+    def test_surrogate_header(self):
+        """Surrogate keys are short and long lists collapse to the model"""
+        key = TrackCacheMiddleware.surrogate_key
+        keys = set(['cache:ErrorLog-%d' % pk for pk in range(50)] + ['cache:Group-1'])
+        header = TrackCacheMiddleware.surrogate_header(keys).split()
+        self.assertEqual(sorted(header), sorted([key('cache:ErrorLog'), key('cache:Group-1')]))
+
+        keys = set(['cache:ErrorLog-%d' % pk for pk in range(5)])
+        header = TrackCacheMiddleware.surrogate_header(keys).split()
+        self.assertEqual(len(header), 5)
+        self.assertIn(key('cache:ErrorLog-3'), header)
+
+
+class FastlyCacheTests(ExtraTestCase):
+    """Test the fastly static and media purging"""
+    def clean_dir(self, root, **kwargs):
+        """Returns the changed files and saves the manifest as if all were purged"""
+        (changed, manifest) = FastlyCache.clean_dir(root, **kwargs)
+        FastlyCache.save_manifest(root, manifest)
+        return changed
+
+    def test_clean_dir(self):
+        """Only files with changed contents are purged"""
+        root = tempfile.mkdtemp()
+        for name in ('a', 'b', 'c'):
+            with open(os.path.join(root, name), 'w') as fhl:
+                fhl.write(name)
+        self.assertEqual(self.clean_dir(root), ['a', 'b', 'c'])
+        self.assertEqual(self.clean_dir(root), [])
+
+        os.utime(os.path.join(root, 'a'))
+        with open(os.path.join(root, 'b'), 'w') as fhl:
+            fhl.write('changed')
+        os.unlink(os.path.join(root, 'c'))
+        self.assertEqual(FastlyCache.clean_dir(root)[0], ['b', 'c'])
+        # Nothing is saved until the purges are sent
+        self.assertEqual(self.clean_dir(root), ['b', 'c'])
+        self.assertEqual(self.clean_dir(root, old=True), ['a', 'b'])
+
+    def test_clean_failed(self):
+        """Files whose purge failed are purged again next time"""
+        root = tempfile.mkdtemp()
+        for name in ('a', 'b'):
+            with open(os.path.join(root, name), 'w') as fhl:
+                fhl.write(name)
+        self.clean_dir(root)
+        for name in ('a', 'b', 'c'):
+            with open(os.path.join(root, name), 'w') as fhl:
+                fhl.write('changed')
+
+        cache = StubFastlyCache()
+        with patch.object(cache, 'purge', lambda url: url.endswith('b')):
+            cache.clean_root(root, lambda path: '/media/' + path)
+        self.assertEqual(self.clean_dir(root), ['a', 'c'])
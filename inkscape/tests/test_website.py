@@ -280,7 +280,6 @@ class CacheTests(ExtraTestCase):
         lst = Permission.objects.filter(group__name="Doesn't Exist")
         self.assertEqual(self.track(lst), ['cache:create:Permission'])
 
-
     def test_errors_do_not(self):
         """Lookup errors and other items should never die in the cahce middleware"""
         pass # XXX todo
@@ -360,6 +359,3 @@ class CacheTests(ExtraTestCase):
         """Test create does not invalidate other create's (one matching field)"""
         with self.assertCacheKept(self.ast):
             ErrorLog.objects.create(uri='a', status=501)
-
-
-
@@ -25,6 +25,8 @@ from io import StringIO
 
 from django.conf import settings
 from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, router
+from django.db.models import AutoField
 from django.core.files.storage import FileSystemStorage, File
 
 from django.db.models.lookups import Exact
@@ -41,6 +43,26 @@ def to(t=list):
     return _outer
 
 
+def bulk_insert(model, objs):
+    """
+    Insert the objects without sending signals and set their ids, as
+    bulk_create does on databases which return the ids of inserted rows.
+    Elsewhere each row is inserted on its own so its id is known.
+    """
+    objs = list(objs)
+    using = router.db_for_write(model)
+    if connections[using].features.can_return_ids_from_bulk_insert:
+        return model._base_manager.using(using).bulk_create(objs)
+    fields = [field for field in model._meta.concrete_fields
+              if not isinstance(field, AutoField)]
+    for obj in objs:
+        obj.pk = model._base_manager.using(using)._insert(
+            [obj], fields=fields, return_id=True)
+        obj._state.adding = False
+        obj._state.db = using
+    return objs
+
+
 def context_items(context):
     """Unpack a django context, equiv of dict.items()"""
     if not isinstance(context, Context):
@@ -36,4 +36,8 @@ class FlagAdmin(ModelAdmin):
     list_display = ('pk', 'obj', 'object_owner', 'flag_votes', 'censure_votes', 'approve_votes')
     inlines = (VoteInline,)
 
+    def save_related(self, request, form, formsets, change):
+        super(FlagAdmin, self).save_related(request, form, formsets, change)
+        FlagObject.objects.filter(pk=form.instance.pk).refresh_votes()
+
 site.register(FlagObject, FlagAdmin)
@@ -0,0 +1,44 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Watch flaggable objects for deletion.
+"""
+
+from django.apps import AppConfig, apps
+from django.core.signals import request_started
+from django.contrib.auth import get_user_model
+
+class ModerationConfig(AppConfig):
+    """
+    Only models which can be flagged are watched for deletions
+    """
+    name = 'moderation'
+
+    def ready(self):
+        from forums.models import Comment
+        from .models import moderate, moderate_flagged
+        # Users and comments can always be flagged, as can anything with an owner
+        moderate(get_user_model())
+        moderate(Comment)
+        for model in apps.get_models():
+            if hasattr(model, 'owner_field'):
+                moderate(model)
+        # Any other model with pending flags is looked up on the first request
+        request_started.connect(moderate_flagged, dispatch_uid='moderate-flagged')
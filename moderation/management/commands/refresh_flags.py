@@ -0,0 +1,31 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Recount flag weights and votes from the moderator votes (in case they get out of sync)
+"""
+
+from django.core.management.base import BaseCommand
+from moderation.models import FlagObject
+
+class Command(BaseCommand):
+    help = "Run periodically to sync up the flag weights with the votes"
+
+    def handle(self, **_):
+        FlagObject.objects.all().refresh_votes()
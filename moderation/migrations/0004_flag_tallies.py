@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 16:02
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from django.db import migrations, models
+
+COUNTERS = {1: 'flag_votes', 7: 'censure_votes', -8: 'approve_votes'}
+
+def _forwards(apps, schema_editor):
+    FlagObject = apps.get_model("moderation", "FlagObject")
+    for item in FlagObject.objects.all():
+        weights = list(item.votes.values_list('weight', flat=True))
+        values = dict((COUNTERS[weight], count)
+            for (weight, count) in Counter(weights).items() if weight in COUNTERS)
+        # Update so the moderation dates are left alone
+        FlagObject.objects.filter(pk=item.pk).update(weight=sum(weights), **values)
+
+def _backwards(*args):
+    pass
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation', '0003_auto_20180324_1620'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flagobject',
+            name='approve_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='flagobject',
+            name='censure_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='flagobject',
+            name='flag_votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='flagobject',
+            name='weight',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(_forwards, _backwards),
+    ]
@@ -24,13 +24,18 @@ Moderation is achieved using a generic flagging model and some further
 """
 
 null = dict(blank=True, null=True)
+from threading import local
+from collections import defaultdict
+
 from django.db.models import *
+from django.db.models.functions import Coalesce
 from django.apps import apps
 
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.staticfiles import storage
 from django.core.validators import MaxLengthValidator
+from django.db import transaction
 from django.dispatch import Signal
 
 from django.conf import settings
@@ -39,6 +44,11 @@ from django.utils.timezone import now
 
 flag_created = Signal(providing_args=["instance", "flag", "mod"])
 
+# Models which can have flags, only these are watched for deletions
+MODERATED = set()
+# Objects deleted in the current transaction, by model
+_DELETED = local()
+
 class ObjectQuery(QuerySet):
     """Manage how flagged objects are dealt with."""
     @staticmethod
@@ -66,7 +76,39 @@ class ObjectQuery(QuerySet):
               'objects': self.filter(content_type=ct),
               'template': self.get_template(ct),
             }
-            
+
+    def for_listing(self):
+        """Load the owners, objects and votes needed to list these flags"""
+        return self.select_related('object_owner')\
+            .prefetch_related('obj', 'votes__moderator')
+
+    def refresh_votes(self):
+        """Recount the stored weights and vote counts from the votes"""
+        def tally(value, **kw):
+            votes = FlagVote.objects.filter(target=OuterRef('pk'), **kw).order_by()\
+                .values('target').annotate(value=value).values('value')
+            return Coalesce(Subquery(votes, output_field=IntegerField()), 0)
+        return self.update(
+            weight=tally(Sum('weight')),
+            flag_votes=tally(Count('pk'), weight=FlagObject.USER_FLAG),
+            censure_votes=tally(Count('pk'), weight=FlagObject.MODERATOR_CENSURE),
+            approve_votes=tally(Count('pk'), weight=FlagObject.MODERATOR_APPROVAL),
+        )
+
+    def sweep(self):
+        """Resolve pending flags whose objects no longer exist, returns the number resolved"""
+        count = 0
+        pending = self.filter(resolution__isnull=True)
+        for ct in ContentType.objects.filter(pk__in=pending.values('content_type')):
+            flags = pending.filter(content_type=ct)
+            model = ct.model_class()
+            if model is not None:
+                if not isinstance(model._meta.pk, (AutoField, IntegerField)):
+                    continue
+                flags = flags.exclude(object_id__in=model._default_manager.values('pk'))
+            count += flags.update(resolution=False)
+        return count
+
 
 class FlagObject(Model):
     """
@@ -100,16 +142,18 @@ class FlagObject(Model):
         (False, _('Object is Deleted')),
     ))
 
+    # Kept up to date by FlagVote.objects.flag()
+    weight = IntegerField(default=0)
+    flag_votes = PositiveIntegerField(default=0)
+    censure_votes = PositiveIntegerField(default=0)
+    approve_votes = PositiveIntegerField(default=0)
+
     obj = GenericForeignKey('content_type', 'object_id')
     objects = ObjectQuery.as_manager()
 
     def __str__(self):
         return "Flagged object: %d (%s)" % (self.pk, str(self.resolution))
 
-    @property
-    def weight(self):
-        return self.votes.all().aggregate(w=Sum('weight'))['w'] or 0
-
     is_retained = property(lambda self: self.weight < self.RETAIN_THRESHOLD)
     is_deleted = property(lambda self: self.weight > self.DELETE_THRESHOLD)
 
@@ -127,24 +171,27 @@ class FlagObject(Model):
         """Returns true if the object was hidden at some point"""
         return hasattr(self.obj, 'is_removed') and self.obj.is_removed
 
-    @property
-    def censure_votes(self):
-        return len([1 for flag in self.flags if flag.weight == self.MODERATOR_CENSURE])
-
-    @property
-    def approve_votes(self):
-        return len([1 for flag in self.flags if flag.weight == self.MODERATOR_APPROVAL])
-
-    @property
-    def flag_votes(self):
-        return len([1 for flag in self.flags if flag.weight == self.USER_FLAG])
-
     @property
     def flags(self):
         if not hasattr(self, '_flags'):
             self._flags = self.votes.all()
         return self._flags
 
+    def add_vote(self, weight, old_weight=None):
+        """Count a new or changed vote in the stored weight and tallies"""
+        changes = {'weight': F('weight') + weight - (old_weight or 0)}
+        counters = {
+            self.USER_FLAG: 'flag_votes',
+            self.MODERATOR_CENSURE: 'censure_votes',
+            self.MODERATOR_APPROVAL: 'approve_votes',
+        }
+        if old_weight in counters:
+            changes[counters[old_weight]] = F(counters[old_weight]) - 1
+        if weight in counters:
+            changes[counters[weight]] = F(counters[weight]) + 1
+        type(self).objects.filter(pk=self.pk).update(**changes)
+        self.refresh_from_db(fields=list(changes))
+
     def status_label(self):
         if self.is_retained:
             return _("retained")
@@ -167,6 +214,7 @@ class FlagManager(Manager):
           defaults={'object_owner': self.get_owner(obj)},
         )
         obj_flag, new_flag = FlagObject.objects.get_or_create(**kw)
+        moderate(type(obj))
 
         kw = dict(
           moderator=user,
@@ -175,14 +223,19 @@ class FlagManager(Manager):
         )
         flag, created = self.get_or_create(**kw)
 
-        if new_flag:
-            flag_created.send(FlagObject, instance=obj_flag, flag=flag, mod=user)
-
-        if not created and flag.weight != weight or not flag.notes and notes:
-            if weight is not None:
+        if created:
+            obj_flag.add_vote(flag.weight)
+        elif flag.weight != weight or not flag.notes and notes:
+            if weight is not None and flag.weight != weight:
+                obj_flag.add_vote(weight, flag.weight)
                 flag.weight = weight
             flag.notes = notes
             flag.save()
+        flag.target = obj_flag
+
+        if new_flag:
+            # Sent once the vote is counted, so receivers see the new weight
+            flag_created.send(FlagObject, instance=obj_flag, flag=flag, mod=user)
         return flag, created
 
     @staticmethod
@@ -249,16 +302,43 @@ class FlagVote(Model):
         return FlagObject.FLAGS.get(self.weight, '_unknown').split('_')[-1].title()
 
 
-from django.dispatch import receiver
-@receiver(signals.post_delete)
-def object_deleted(sender, instance, **kwargs):
-    """Clean up any flag objects left dangling."""
+def moderate(model):
+    """Watch this model for deletions, so its flags are resolved"""
+    if model not in MODERATED:
+        MODERATED.add(model)
+        signals.post_delete.connect(object_deleted, sender=model,
+                                    dispatch_uid='moderation-' + model._meta.label)
+
+def moderate_flagged(**_):
+    """Watch every model which has pending flags (run once per process)"""
+    from django.core.signals import request_started
+    request_started.disconnect(dispatch_uid='moderate-flagged')
+    pending = FlagObject.objects.filter(resolution__isnull=True)
+    for ct in ContentType.objects.filter(pk__in=pending.values('content_type')):
+        if ct.model_class() is not None:
+            moderate(ct.model_class())
+
+def object_deleted(sender, instance, using=None, **kwargs):
+    """Clean up any flag objects left dangling, once the delete is done."""
     if not isinstance(instance.pk, int):
         return
-    FlagObject.objects.filter(
-        resolution__isnull=True,
-        object_id=instance.pk,
-        content_type=ContentType.objects.get_for_model(sender),
-    ).update(resolution=False)
-
-
+    if not getattr(_DELETED, 'items', None):
+        _DELETED.items = defaultdict(set)
+    _DELETED.items[sender].add(instance.pk)
+    # One callback takes every pending pk, a rolled back one is forgotten by the connection
+    connection = transaction.get_connection(using)
+    if not any(func is resolve_deleted for (_, func) in connection.run_on_commit):
+        transaction.on_commit(resolve_deleted, using=using)
+
+def resolve_deleted():
+    """Resolve the flags of objects deleted together, with one update per model"""
+    items, _DELETED.items = getattr(_DELETED, 'items', None) or {}, None
+    for (model, pks) in items.items():
+        # A rolled back delete may have left objects which still exist
+        pks -= set(model._default_manager.filter(pk__in=pks).values_list('pk', flat=True))
+        if pks:
+            FlagObject.objects.filter(
+                resolution__isnull=True,
+                object_id__in=pks,
+                content_type=ContentType.objects.get_for_model(model),
+            ).update(resolution=False)
@@ -0,0 +1,188 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Test that flags are resolved when their objects are deleted
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction, connection
+from django.db.models import signals
+
+from extratest.base import ExtraTestCase
+
+from forums.models import Forum, ForumTopic, Comment, BannedWords
+from person.models import User
+from resources.models import Resource
+from moderation.models import (
+    FlagObject, FlagVote, MODERATED, moderate_flagged, resolve_deleted, flag_created,
+)
+
+class DeletedObjectTests(ExtraTestCase):
+    """Flags are resolved for deleted objects"""
+    fixtures = ['test-auth', 'test-contenttype', 'test-forum']
+
+    def setUp(self):
+        super(DeletedObjectTests, self).setUp()
+        self.user = User.objects.get(username='tester')
+        self.moderator = User.objects.get(username='admin')
+        topic = ForumTopic.objects.create(forum=Forum.objects.get(), subject='Flagged')
+        self.comments = [Comment.objects.create(
+            site_id=1, user=self.user, content_type=ForumTopic.content_type(),
+            object_pk=str(topic.pk), comment='Comment %d' % num) for num in range(3)]
+        for comment in self.comments:
+            FlagVote.objects.flag(self.moderator, comment)
+
+    def pending(self):
+        """The comments whose flags are not resolved"""
+        return sorted(FlagObject.objects.filter(resolution__isnull=True)\
+            .values_list('object_id', flat=True))
+
+    def callbacks(self):
+        """The number of callbacks waiting for the transaction to commit"""
+        return len([func for (_, func) in connection.run_on_commit if func is resolve_deleted])
+
+    def unmoderated(self, model):
+        """Stop watching the model for this test"""
+        MODERATED.discard(model)
+        uid = 'moderation-' + model._meta.label
+        signals.post_delete.disconnect(dispatch_uid=uid, sender=model)
+        self.addCleanup(MODERATED.discard, model)
+        self.addCleanup(signals.post_delete.disconnect, dispatch_uid=uid, sender=model)
+
+    def test_registry(self):
+        """Flaggable models are watched from the start"""
+        for model in (User, Comment, Resource):
+            self.assertIn(model, MODERATED)
+
+    def test_registered_on_flag(self):
+        """Other models are watched as soon as they are flagged"""
+        self.unmoderated(BannedWords)
+        FlagVote.objects.flag(self.moderator, BannedWords.objects.create(phrase='spam'))
+        self.assertIn(BannedWords, MODERATED)
+
+    def test_registered_when_pending(self):
+        """Models with flags from before the process started are watched"""
+        self.unmoderated(BannedWords)
+        FlagObject.objects.create(object_id=1,
+                                  content_type=ContentType.objects.get_for_model(BannedWords))
+        moderate_flagged()
+        self.assertIn(BannedWords, MODERATED)
+
+    def test_batched(self):
+        """Objects deleted together are resolved with one callback"""
+        Comment.objects.filter(pk__in=[c.pk for c in self.comments[:2]]).delete()
+        self.assertEqual(self.callbacks(), 1)
+        self.assertEqual(len(self.pending()), 3)
+        # One query to find the objects that still exist, and one update
+        with self.assertNumQueries(2):
+            resolve_deleted()
+        self.assertEqual(self.pending(), [self.comments[2].pk])
+
+    def test_rolled_back(self):
+        """A rolled back delete leaves its flags, later deletes are still resolved"""
+        pks = [comment.pk for comment in self.comments]
+        try:
+            with transaction.atomic():
+                self.comments[0].delete()
+                self.assertEqual(self.callbacks(), 1)
+                raise IOError("Roll back")
+        except IOError:
+            pass
+        self.assertEqual(self.callbacks(), 0)
+        self.comments[1].delete()
+        self.assertEqual(self.callbacks(), 1)
+        resolve_deleted()
+        self.assertEqual(self.pending(), [pks[0], pks[2]])
+
+    def test_sweep(self):
+        """Objects deleted without signals are resolved by sweep()"""
+        Comment.objects.filter(pk=self.comments[0].pk)._raw_delete(using='default')
+        gone = ContentType.objects.create(app_label='gone', model='gone')
+        FlagObject.objects.create(object_id=1, content_type=gone)
+        self.assertEqual(FlagObject.objects.sweep(), 2)
+        self.assertEqual(self.pending(), [self.comments[1].pk, self.comments[2].pk])
+        self.assertEqual(FlagObject.objects.sweep(), 0)
+
+
+class VoteTests(ExtraTestCase):
+    """The weight and vote counts are kept with each flag"""
+    fixtures = ['test-auth']
+
+    def setUp(self):
+        super(VoteTests, self).setUp()
+        self.flagged = User.objects.get(username='tester')
+        self.admin = User.objects.get(username='admin')
+        self.staff = User.objects.get(username='staff')
+
+    def assertTallies(self, weight, flags=0, censures=0, approvals=0):
+        """Check the stored weight and vote counts"""
+        obj_flag = FlagObject.objects.get(object_id=self.flagged.pk)
+        self.assertEqual(
+            (obj_flag.weight, obj_flag.flag_votes, obj_flag.censure_votes, obj_flag.approve_votes),
+            (weight, flags, censures, approvals))
+
+    def test_new_votes(self):
+        """Each new vote is added to the weight and its count"""
+        (vote, _) = FlagVote.objects.flag(self.staff, self.flagged)
+        self.assertEqual(vote.target.weight, 1)
+        self.assertTallies(1, flags=1)
+        FlagVote.objects.flag(self.admin, self.flagged, weight=FlagObject.MODERATOR_CENSURE)
+        self.assertTallies(8, flags=1, censures=1)
+
+    def test_changed_vote(self):
+        """A changed vote moves from one count to the other"""
+        FlagVote.objects.flag(self.admin, self.flagged, weight=FlagObject.MODERATOR_CENSURE)
+        FlagVote.objects.flag(self.admin, self.flagged, weight=FlagObject.MODERATOR_APPROVAL)
+        self.assertTallies(-8, approvals=1)
+        FlagVote.objects.flag(self.admin, self.flagged, weight=FlagObject.MODERATOR_UNDECIDED)
+        self.assertTallies(0)
+        self.assertEqual(FlagVote.objects.get().weight, FlagObject.MODERATOR_UNDECIDED)
+
+    def test_same_vote(self):
+        """Voting the same way again isn't counted twice"""
+        FlagVote.objects.flag(self.staff, self.flagged)
+        (_, created) = FlagVote.objects.flag(self.staff, self.flagged, notes='Again')
+        self.assertFalse(created)
+        self.assertTallies(1, flags=1)
+        self.assertEqual(FlagVote.objects.get().notes, 'Again')
+
+    def test_signal_after_vote(self):
+        """The new flag signal is sent with the first vote counted"""
+        weights = []
+        def receiver(instance, **_):
+            weights.append(FlagObject.objects.get(pk=instance.pk).weight)
+        flag_created.connect(receiver, weak=False)
+        self.addCleanup(flag_created.disconnect, receiver)
+        FlagVote.objects.flag(self.staff, self.flagged)
+        FlagVote.objects.flag(self.admin, self.flagged)
+        self.assertEqual(weights, [1])
+
+    def test_refresh_votes(self):
+        """The stored counts can be put right from the votes"""
+        FlagVote.objects.flag(self.staff, self.flagged)
+        FlagVote.objects.flag(self.admin, self.flagged, weight=FlagObject.MODERATOR_APPROVAL)
+        FlagObject.objects.update(weight=40, flag_votes=3, censure_votes=2, approve_votes=0)
+        empty = FlagObject.objects.create(
+            object_id=self.admin.pk, content_type=ContentType.objects.get_for_model(User),
+            weight=5, flag_votes=5)
+        self.assertEqual(FlagObject.objects.refresh_votes(), 2)
+        self.assertTallies(-7, flags=1, approvals=1)
+        empty.refresh_from_db()
+        self.assertEqual((empty.weight, empty.flag_votes), (0, 0))
@@ -49,7 +49,7 @@ class Moderation(ModeratorRequired, ModerationMixin, ListView):
     def get_queryset(self):
         new = Q(resolution__isnull=True)
         recent = Q(updated__gt=now() - timedelta(days=self.display_days))
-        return FlagObject.objects.filter(new | recent)
+        return FlagObject.objects.filter(new | recent).for_listing()
       
     def get_context_data(self, **kwargs):
         data = super(Moderation, self).get_context_data(**kwargs)
@@ -70,7 +70,7 @@ class ModerateType(ModeratorRequired, ModerationMixin, ListView):
         new = Q(resolution__isnull=True)
         recent = Q(updated__gt=now() - timedelta(days=14))
         return FlagObject.objects.filter(new | recent)\
-            .filter(content_type=self.contenttype)
+            .filter(content_type=self.contenttype).for_listing()
 
     def get_context_data(self, **kwargs):
         data = super(ModerateType, self).get_context_data(**kwargs)
@@ -91,13 +91,14 @@ class CensureObject(ModeratorRequired, FlagView):
     def function(self, flag, vote, created):
         if flag.is_deleted:
             flag.resolution = False
+            # The weight and tallies are kept by add_vote, so aren't saved here
             try:
-                flag.save()
+                flag.save(update_fields=['resolution', 'updated'])
             except utils.IntegrityError:
                 # Correct for when users are deleted but the object_owner
                 # still points to the old user. Sometimes a transaction issue.
                 flag.object_owner = None
-                flag.save()
+                flag.save(update_fields=['resolution', 'object_owner', 'updated'])
 
             return ('error', 'deleted')
         elif flag.is_hidden:
@@ -148,7 +149,7 @@ class ApproveObject(ModeratorRequired, FlagView):
             return ('success', 'unhide')
         if flag.is_retained:
             flag.resolution = True
-            flag.save()
+            flag.save(update_fields=['resolution', 'updated'])
             return ('success', 'retained')
         return ('info', 'counted')
 
@@ -25,7 +25,9 @@ from django.contrib.admin import ModelAdmin, TabularInline, site
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Permission
 
-from .models import User, Team, TeamChatRoom, TeamMembership, MembershipRole
+from .models import (
+    User, UserSession, Team, TeamChatRoom, TeamMembership, MembershipRole,
+)
 from .team_forms import TeamForm
 
 class PermissionAdmin(ModelAdmin):
@@ -78,6 +80,14 @@ class UserAdmin(BaseUserAdmin):
             'last_login', 'date_joined', 'last_seen', 'visits'),
                                 'classes': ('collapse', 'close')}),
     )
+    actions = ['deactivate']
+
+    def deactivate(self, request, queryset):
+        """Deactivate many users at once and log them all out"""
+        count = queryset.update(is_active=False)
+        UserSession.objects.revoke(queryset.values_list('pk', flat=True))
+        self.message_user(request, _("%d users deactivated and logged out.") % count)
+    deactivate.short_description = _("Deactivate and log out selected users")
 
 site.register(User, UserAdmin)
 
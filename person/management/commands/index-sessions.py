@@ -0,0 +1,35 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Add all the existing logged in sessions to the user session index, this only
+needs to be run once, new sessions are added as they are saved.
+"""
+
+from django.core.management import BaseCommand
+
+from person.models import UserSession
+
+class Command(BaseCommand):
+    """Index user sessions"""
+    help = __doc__
+
+    def handle(self, *args, **options):
+        UserSession.objects.index_all()
+        print(" [INDEXED] %d sessions" % UserSession.objects.count())
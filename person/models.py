@@ -30,7 +30,7 @@ from django.db.models.signals import post_save
 from django.db.models import (
     F, Q, Max, Model, Manager, TextField, CharField, URLField,
     DateTimeField, BooleanField, IntegerField, ForeignKey, SlugField,
-    ImageField,
+    ImageField, OneToOneField, CASCADE,
 )
 from django.utils.timezone import now
 from django.dispatch import receiver
@@ -42,6 +42,7 @@ from django.core.urlresolvers import reverse
 from django.core.validators import MaxLengthValidator
 from django.contrib.sessions.models import Session
 from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.contrib.staticfiles.templatetags.staticfiles import static
 
 from django.contrib.auth.models import Group, AbstractUser, UserManager, Permission
@@ -246,17 +247,65 @@ class User(AbstractUser):
         return False
 
 
+class UserSessionManager(Manager):
+    """Look up sessions by their user"""
+    def revoke(self, users):
+        """Delete every session for these users (a list or queryset of users or ids)"""
+        return Session.objects.filter(user_index__user__in=users).delete()
+
+    def index_all(self):
+        """Decode every session and add the logged in ones to the index (slow)"""
+        users = set(User.objects.values_list('pk', flat=True))
+        for session in Session.objects.filter(user_index__isnull=True).iterator():
+            try:
+                user_id = int(session.get_decoded().get(SESSION_KEY, 0))
+            except (TypeError, ValueError):
+                continue
+            if user_id in users:
+                self.update_or_create(session=session, defaults={'user_id': user_id})
+
+
+class UserSession(Model):
+    """
+    Which user is logged into which session, so a user's sessions can be
+    found without decoding every session in the database.
+    """
+    session = OneToOneField(Session, primary_key=True, related_name='user_index',
+                            on_delete=CASCADE)
+    user = ForeignKey(User, related_name='sessions', on_delete=CASCADE)
+
+    objects = UserSessionManager()
+
+    def __str__(self):
+        return "%s (%s)" % (str(self.user_id), self.session_id)
+
+
+@receiver(user_logged_in)
+def session_logged_in(sender, request, user, **_):
+    """Record the user each time they log into a session"""
+    session = getattr(request, 'session', None)
+    if session is None:
+        return
+    if session.session_key is None:
+        # Logging in as another user flushes the session, so it needs a new key
+        session.save()
+    if Session.objects.filter(pk=session.session_key).exists():
+        UserSession.objects.update_or_create(
+            session_id=session.session_key, defaults={'user': user})
+
+@receiver(user_logged_out)
+def session_logged_out(sender, request, **_):
+    """Forget the session's user when they log out"""
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key is not None:
+        UserSession.objects.filter(session_id=session.session_key).delete()
+
 @receiver(post_save, sender=User)
 def is_active_check(sender, instance, **_):
     """Delete every session when active is False"""
     if not instance.is_active:
-        for session in Session.objects.all():
-            # There is google-oauth sessions which aren't cleared here
-            try:
-                if int(session.get_decoded().get(SESSION_KEY, -1)) == instance.pk:
-                    session.delete()
-            except sender.DoesNotExist:
-                pass
+        # There is google-oauth sessions which aren't cleared here
+        UserSession.objects.revoke([instance.pk])
 
 def group_breadcrumb_name(self):
     """Return the name of the group for breadcrumbs"""
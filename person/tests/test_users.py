@@ -24,7 +24,7 @@ from extratest.base import ExtraTestCase
 
 from django.contrib.auth.models import Permission
 
-from ..models import User
+from ..models import User, UserSession
 from django.contrib.sessions.models import Session
 
 class UserTests(ExtraTestCase):
@@ -49,6 +49,33 @@ class UserTests(ExtraTestCase):
         self.assertEqual(Session.objects.all().count(), 0)
         response = self.assertGet('admin:index', status=302, follow=False)
 
+    def test_14_user_sessions_revoked(self):
+        """Sessions for many users can be removed at once"""
+        admin = User.objects.get(username='admin')
+        self.assertEqual(UserSession.objects.filter(user=admin).count(), 1)
+        response = self.assertGet('admin:index', status=200, follow=False)
+
+        UserSession.objects.revoke(User.objects.filter(username__in=['admin', 'tester']))
+        self.assertEqual(Session.objects.all().count(), 0)
+        self.assertEqual(UserSession.objects.all().count(), 0)
+        response = self.assertGet('admin:index', status=302, follow=False)
+
+    def test_15_user_sessions_indexed(self):
+        """Sessions are indexed when users log in and forgotten when they log out"""
+        self.assertEqual(UserSession.objects.get().user.username, 'admin')
+        self.client.logout()
+        self.assertFalse(UserSession.objects.exists())
+
+        self.assertTrue(self.client.login(username='tester', password='123456'))
+        session = UserSession.objects.get()
+        self.assertEqual(session.user.username, 'tester')
+        self.assertEqual(session.session_id, self.client.session.session_key)
+
+        # Sessions from before the index are added by index-sessions
+        session.delete()
+        UserSession.objects.index_all()
+        self.assertEqual(UserSession.objects.get().user.username, 'tester')
+
     def test_23_staff_permission(self):
         """Having the staff permission grants staff access"""
         user = User.objects.get(username='staff')
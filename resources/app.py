@@ -26,10 +26,6 @@ from django.db.models import signals
 from django.apps import AppConfig
 from django.conf import settings
 
-# For clearing the cache in a file
-if not settings.DEBUG:
-    from inkscape.fastly_cache import FastlyCache
-
 class ResourceConfig(AppConfig):
     name = 'resources'
 
@@ -41,17 +37,54 @@ class ResourceConfig(AppConfig):
 
     @staticmethod
     def remove_file(instance, **kw):
+        from inkscape.models import FastlyPurge
         for field in ('download', 'signature', 'checked_sig', 'thumbnail', 'rendering'):
             fn = getattr(instance, field)
             if fn and fn.url and not settings.DEBUG:
-                FastlyCache().purge_media(fn)
+                FastlyPurge.objects.queue(urls=[fn.url])
             try:
                 getattr(instance, field).delete(save=False)
             except Exception as err:
                 logging.error("IOError: %s\n" % str(err))
 
+    @staticmethod
+    def remove_disk_usage(instance, **kw):
+        """Take the deleted download away from the user and group disk usage"""
+        from .models import DiskUsage
+        if instance.download_size:
+            DiskUsage.objects.adjust(instance, -instance.download_size)
+
+    @staticmethod
+    def reset_group_usage(instance, reverse=False, pk_set=None, **kw):
+        """Group gallery items changed, so the group's disk usage is counted again"""
+        from .models import DiskUsage
+        action = kw.get('action', 'pre_delete')
+        if action not in ('post_add', 'post_remove', 'pre_clear', 'pre_delete'):
+            return
+        if not reverse:
+            galleries = [instance.pk]
+        elif pk_set is None:
+            galleries = instance.galleries.all()
+        else:
+            galleries = pk_set
+        DiskUsage.objects.reset(galleries)
+
+    @staticmethod
+    def move_group_usage(sender, instance, **kw):
+        """A gallery moved to another group, both groups are counted again"""
+        from .models import DiskUsage
+        if instance.pk is None:
+            return
+        old = sender.objects.filter(pk=instance.pk).values_list('group_id', flat=True).first()
+        if old != instance.group_id:
+            DiskUsage.objects.filter(group_id__in=[old, instance.group_id]).delete()
+
     def ready(self):
-        from .models import Resource
+        from .models import Resource, Gallery
         signals.post_delete.connect(self.clean_tags, sender=Resource)
         signals.pre_delete.connect(self.remove_file, sender=Resource)
+        signals.pre_delete.connect(self.remove_disk_usage, sender=Resource)
+        signals.pre_save.connect(self.move_group_usage, sender=Gallery)
+        signals.pre_delete.connect(self.reset_group_usage, sender=Gallery)
+        signals.m2m_changed.connect(self.reset_group_usage, sender=Gallery.items.through)
 
@@ -81,9 +81,9 @@ from django.views.generic.base import TemplateView as View
 from django.utils.translation import ugettext_lazy as _
 from django.utils.http import urlquote
 from django.shortcuts import redirect
-from django.db.models import Model
+from django.db.models import Model, Count
 
-from django.core.exceptions import FieldError
+from django.core.exceptions import FieldError, FieldDoesNotExist
 
 from .search_base import get_haystack_query, MR_OD, RMR_OD, SearchIter
 
@@ -135,12 +135,13 @@ class Category(list):
 
     def conclude(self, view):
         """Items to finish at the last minute"""
-        for item in self:
+        counts = view.get_counts(self.cid, self)
+        for item, count in zip(self, counts):
             try:
                 item.url = view.get_url(self.cid, item.value)
             except NoReverseMatch:
                 item.url = 'None'
-            item.count = view.get_count(self.cid, item)
+            item.count = count
 
     def active_items(self):
         """Returns a list of active items (items with >0 results)"""
@@ -254,6 +255,35 @@ class CategoryListView(View, MultipleObjectMixin):
             item = None
         return self.get_queryset(**{cid: item}).count()
 
+    def get_counts(self, cid, items):
+        """Gets the number of items for every value in this category at once.
+
+        Related fields are counted with one grouped query, instead of one
+        count query per value. The first item is expected to be the 'All' item.
+        """
+        field = self.get_facet_field(cid)
+        if self.query or field is None:
+            return [self.get_count(cid, item) for item in items]
+
+        qset = self.get_queryset(**{cid: None}).order_by()
+        groups = dict(qset.values_list(cid).annotate(count=Count('pk')))
+        if field.many_to_many or field.one_to_many:
+            total = qset.count()
+        else:
+            total = sum(groups.values())
+        return [total if isinstance(item, AllCategory) else groups.get(item.pk, 0)
+                for item in items]
+
+    def get_facet_field(self, cid):
+        """Returns the related model field for this category, if it has one"""
+        if not hasattr(self.model, cid):
+            return None
+        try:
+            field = self.model._meta.get_field(cid) # pylint: disable=protected-access
+        except FieldDoesNotExist:
+            return None
+        return field if field.is_relation else None
+
     def get_value(self, cid, default=None):
         """Tries to find the category value from multiple sources"""
         return self.kwargs.get(cid, self.request.GET.get(cid, default))
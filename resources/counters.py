@@ -0,0 +1,136 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Resource view and download counters.
+
+Each hit is appended to a spool file instead of writing to the resource's
+row. The spool is added up and flushed to the database with one update per
+resource, either by the flush_counters command or by the first hit after
+RESOURCE_COUNTER_WINDOW seconds have passed since the last flush.
+"""
+
+import os
+import time
+import fcntl
+import logging
+from glob import glob, escape as glob_escape
+from uuid import uuid4
+from collections import defaultdict, Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Resource
+
+COUNTERS = ('viewed', 'downed', 'fullview')
+
+def _flushed_marker():
+    return settings.RESOURCE_COUNTER_SPOOL + '.flushed'
+
+def record(resource, counter):
+    """Count one hit against the resource, e.g. record(item, 'downed')"""
+    if counter not in COUNTERS:
+        raise KeyError("Unknown resource counter: %s" % counter)
+    if not settings.RESOURCE_COUNTER_WINDOW:
+        return Resource.objects.filter(pk=resource.pk).update(**{counter: F(counter) + 1})
+
+    spool = settings.RESOURCE_COUNTER_SPOOL
+    line = "%d %s\n" % (resource.pk, counter)
+    while True:
+        with open(spool, 'a') as fhl:
+            fcntl.flock(fhl, fcntl.LOCK_SH)
+            # The spool may have been taken away for flushing since we opened it
+            try:
+                if os.fstat(fhl.fileno()).st_ino != os.stat(spool).st_ino:
+                    continue
+            except FileNotFoundError:
+                continue
+            fhl.write(line)
+            break
+
+    try:
+        age = time.time() - os.path.getmtime(_flushed_marker())
+    except OSError:
+        age = None
+    if age is None or age > settings.RESOURCE_COUNTER_WINDOW:
+        try:
+            flush()
+        except Exception: # pylint: disable=broad-except
+            # The hit is spooled and the next flush will add it
+            logging.exception("Couldn't flush the resource counters")
+    return 1
+
+def take_spool():
+    """
+    Move the current spool aside under a unique name, returns the taken spool
+    and every other taken spool still waiting to be added, oldest first.
+    """
+    spool = settings.RESOURCE_COUNTER_SPOOL
+    taken = "%s.%s" % (spool, uuid4().hex)
+    try:
+        os.rename(spool, taken)
+    except FileNotFoundError:
+        taken = None
+    # Spools left behind by a flush that failed are added again next time
+    waiting = glob(glob_escape(spool) + '.' + '[0-9a-f]' * 32)
+    return (taken, sorted(waiting, key=os.path.getmtime))
+
+def read_spool(fhl):
+    """Return the counts in an open spool, by resource id"""
+    counts = defaultdict(Counter)
+    for line in fhl:
+        try:
+            (pk, counter) = line.split()
+            if counter in COUNTERS:
+                counts[int(pk)][counter] += 1
+        except ValueError:
+            continue
+    return counts
+
+def flush():
+    """Add the spooled counts to the resources, returns the number updated"""
+    with open(_flushed_marker(), 'a'):
+        os.utime(_flushed_marker(), None)
+    updated = set()
+    (taken, waiting) = take_spool()
+    for path in waiting:
+        try:
+            fhl = open(path, 'r')
+        except FileNotFoundError:
+            continue
+        with fhl:
+            try:
+                # Wait for anyone still writing to our spool before we read it,
+                # but leave any spool another flush is already adding up.
+                fcntl.flock(fhl, fcntl.LOCK_EX if path == taken else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            if not os.path.exists(path):
+                continue
+            counts = read_spool(fhl)
+            with transaction.atomic():
+                for (pk, counters) in counts.items():
+                    Resource.objects.filter(pk=pk).update(**dict(
+                        (counter, F(counter) + count) for (counter, count) in counters.items()))
+            # Only forget the hits once they are saved
+            os.unlink(path)
+            updated.update(counts)
+    return len(updated)
@@ -0,0 +1,33 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Add the spooled resource view and download counts to the database
+"""
+
+from django.core.management.base import BaseCommand
+from resources.counters import flush
+
+class Command(BaseCommand):
+    help = "Run every few minutes to save the resource view and download counters"
+
+    def handle(self, **options):
+        count = flush()
+        if options['verbosity'] > 1:
+            print("Updated counters for {} resources".format(count))
@@ -0,0 +1,40 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Recount resource likes from the votes (in case they get out of sync)
+"""
+
+from django.core.management.base import BaseCommand
+from resources.models import Resource, Gallery
+
+class Command(BaseCommand):
+    help = "Run periodically to sync up the liked fields with the votes"
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--gallery', '-g', default=[], action='append',
+            dest='galleries', help='Only recount items in this gallery (slug).')
+
+    def handle(self, galleries=(), **_):
+        if galleries:
+            for gallery in Gallery.objects.filter(slug__in=galleries):
+                gallery.items.all().refresh_votes()
+        else:
+            Resource.objects.all().refresh_votes()
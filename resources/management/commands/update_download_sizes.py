@@ -0,0 +1,43 @@
+#
+# Copyright 2020, Martin Owens <doctormo@gmail.com>
+#
+# This file is part of the software inkscape-web, consisting of custom
+# code for the Inkscape project's django-based website.
+#
+# inkscape-web is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# inkscape-web is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Store the size of every download file (in case they get out of sync and init)
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+from resources.models import Resource, DiskUsage
+
+class Command(BaseCommand):
+    help = "Run once to fill in download sizes, then disk usage is recounted"
+
+    def handle(self, **_):
+        qset = Resource.objects.values_list('pk', 'download', 'download_size')
+        for (pk, download, old_size) in qset.iterator():
+            size = 0
+            if download:
+                path = Resource.download.field.storage.path(download)
+                if os.path.isfile(path):
+                    size = os.path.getsize(path)
+            if size != old_size:
+                Resource.objects.filter(pk=pk).update(download_size=size)
+        # Every stored disk usage is counted again when next needed
+        DiskUsage.objects.all().delete()
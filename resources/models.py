@@ -22,26 +22,29 @@ Models for resource system, provides license, categories and resource downloads.
 """
 
 __all__ = ('License', 'Category', 'Resource', 'ResourceMirror',
-           'Gallery', 'Vote', 'Quota', 'GalleryPlugin', 'CategoryPlugin',
-           'Tag', 'TagCategory')
+           'Gallery', 'Vote', 'Quota', 'DiskUsage', 'GalleryPlugin',
+           'CategoryPlugin', 'Tag', 'TagCategory')
 
 import os
+import hashlib
 from uuid import uuid4
 
 from django.db.models import *
+from django.db.models.functions import Coalesce, Greatest
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import Group
 from django.core.urlresolvers import reverse
 from django.core.validators import MaxLengthValidator
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.conf import settings
 
 from person.models import Team
 from inkscape.fields import ResizedImageField
 
 from .storage import resource_storage
-from .slugify import set_slug
+from .slugify import set_slug, save_with_slug
 from .utils import (
     cached, upto, static, syntaxer, get_aspect,
     hash_verify, gpg_verify, sha1,
@@ -54,6 +57,9 @@ from cms.utils.permissions import get_current_user as get_user
 
 null = dict(null=True, blank=True)
 
+CACHE = caches['default']
+URL_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
 OWNS = (
     (None, _('No permission')),
     (True, _('I own the work')),
@@ -234,6 +240,25 @@ class ResourceQuerySet(QuerySet):
         """Returns the latest four items"""
         return self[:4]
 
+    def listing(self):
+        """
+        Returns these items ready for showing in a gallery listing, the user,
+        license and category are joined in and the galleries and tags are
+        fetched for the whole page at once instead of for each item.
+        """
+        return self.select_related('user', 'license', 'category')\
+                   .prefetch_related('galleries', 'tags')
+
+    def add_likes(self, count):
+        """Atomically add (or take away) likes without saving each resource"""
+        return self.update(liked=Greatest(F('liked') + count, 0))
+
+    def refresh_votes(self):
+        """Recount the stored likes from the votes for all these resources"""
+        votes = Vote.objects.filter(resource=OuterRef('pk')).order_by()\
+            .values('resource').annotate(count=Count('pk')).values('count')
+        return self.update(liked=Coalesce(Subquery(votes, output_field=IntegerField()), 0))
+
 class ResourceManager(Manager):
     def get_queryset(self):
         qs = ResourceQuerySet(self.model, using=self._db)
@@ -272,10 +297,10 @@ class ResourceManager(Manager):
         return self.get_queryset().filter(category=Category.objects.get(pk=1))
 
     def disk_usage(self):
-        # This could be done better by storing the file sizes
-        return sum(resource.download.size
-            for resource in Resource.objects.filter(pk__in=self.get_queryset())
-            if resource.download and os.path.exists(resource.download.path))
+        """Returns the total size of the downloads, stored for each user"""
+        if isinstance(getattr(self, 'instance', None), get_user_model()):
+            return DiskUsage.objects.used_by(user=self.instance)
+        return self.get_queryset().aggregate(Sum('download_size'))['download_size__sum'] or 0
 
     def latest(self, column=None):
         if column:
@@ -296,6 +321,10 @@ class GroupGalleryManager(Manager):
     def parent(self):
         return self.instance
 
+    def disk_usage(self):
+        """Returns the total size of the downloads in this group's galleries"""
+        return DiskUsage.objects.used_by(group=self.instance)
+
 Group.resources = property(lambda self: GroupGalleryManager(self))
 
 
@@ -303,6 +332,8 @@ class Resource(Model):
     """This is a resource with an uploaded file"""
     owner_field = 'user'
     is_resource = True
+    # Kept with F() updates, so saving a resource never writes them
+    COUNTED = ('liked', 'viewed', 'downed', 'fullview')
 
     ENDORSE_NONE = 0
     ENDORSE_HASH = 1
@@ -350,6 +381,7 @@ class Resource(Model):
     # ======== ITEMS FROM RESOURCEFILE =========== #
     download   = FileField(_('Consumable File'), storage=resource_storage,
             **upto('file', blank=True))
+    download_size = PositiveIntegerField(_('File Size'), default=0)
 
     license    = ForeignKey(License, verbose_name=_("License"), on_delete=SET_NULL, **null)
     owner      = BooleanField(_('Permission'), choices=OWNS, default=True)
@@ -413,6 +445,9 @@ class Resource(Model):
         return len(self.desc) > 1000 or '[[...]]' in self.desc
 
     def save(self, **kwargs):
+        old_size = self.download_size
+        if hasattr(self, '_urls'):
+            delattr(self, '_urls')
 
         if self.download and not self.download._committed:
             # There is a download file and it has been changed
@@ -423,6 +458,7 @@ class Resource(Model):
 
             self.verified = False
             self.edited = now()
+            self.download_size = self.download.size
             if hasattr(self, '_mime'):
                 delattr(self, '_mime')
 
@@ -448,8 +484,18 @@ class Resource(Model):
             self.created = now()
             signal = True
 
+        if not self.download:
+            self.download_size = 0
+
+        if self.pk is not None and not self._state.adding and 'update_fields' not in kwargs:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.COUNTED]
+
         set_slug(self)
-        ret = super(Resource, self).save(**kwargs)
+        ret = save_with_slug(self, super(Resource, self).save, lambda: set_slug(self), **kwargs)
+
+        if self.download_size != old_size:
+            DiskUsage.objects.adjust(self, self.download_size - old_size)
 
         if signal:
             from .alert import post_publish
@@ -507,9 +553,8 @@ class Resource(Model):
 
         if commit:
             # Clear fastly cache
-            from inkscape.fastly_cache import FastlyCache
-            cache = FastlyCache()
-            cache.purge(old_url)
+            from inkscape.models import FastlyPurge
+            FastlyPurge.objects.queue(urls=[old_url])
 
         return new_path
 
@@ -551,27 +596,58 @@ class Resource(Model):
             return self.ENDORSE_SIGN
         return self.verified and self.ENDORSE_HASH or self.ENDORSE_NONE
 
+    def _file_urls(self):
+        """
+        Returns the thumbnail, rendering and icon urls, these are cached
+        under the file names and edit time, so changing any file moves to
+        a new cache key and listings don't need to look at the disk.
+        """
+        if not hasattr(self, '_urls'):
+            key = None
+            if self.pk:
+                key = hashlib.md5("|".join(str(part) for part in (
+                    self.download.name, self.thumbnail.name, self.rendering.name,
+                    self.download_size, self.media_type, self.link, self.edited,
+                )).encode('utf8')).hexdigest()
+                key = "resource-urls:{:d}:{:s}".format(self.pk, key)
+            self._urls = key and CACHE.get(key)
+            if not self._urls:
+                self._urls = self._find_urls()
+                if key:
+                    CACHE.set(key, self._urls, URL_CACHE_TIMEOUT)
+        return self._urls
+
+    def _find_urls(self):
+        """Look on the disk for the thumbnail and rendering urls (slow)"""
+        thumbnail = self.thumbnail and os.path.exists(self.thumbnail.path)
+        rendering = self.rendering and os.path.exists(self.rendering.path)
+        is_image = self.download and self.mime().is_image()
+        icon = self.icon_url()
+        urls = {'icon': icon, 'thumbnail': icon, 'rendering': icon}
+
+        if rendering:
+            urls['rendering'] = self.rendering.url
+        elif is_image:
+            urls['rendering'] = self.download.url
+        elif thumbnail:
+            urls['rendering'] = self.thumbnail.url
+
+        if thumbnail:
+            urls['thumbnail'] = self.thumbnail.url
+        elif rendering:
+            urls['thumbnail'] = self.rendering.url
+        elif is_image and os.path.exists(self.download.path) \
+              and (self.download_size or self.download.size) < settings.MAX_PREVIEW_SIZE:
+            urls['thumbnail'] = self.download.url
+        return urls
+
     def rendering_url(self):
-        if self.rendering and os.path.exists(self.rendering.path):
-            return self.rendering.url
-        if self.download and self.mime().is_image():
-            return self.download.url
-        if self.thumbnail and os.path.exists(self.thumbnail.path):
-            return self.thumbnail.url
-        return self.icon_url()
+        return self._file_urls()['rendering']
 
     def thumbnail_url(self):
         """Returns a 190px thumbnail either from the thumbnail,
            the image itself or the mimetype icon"""
-        if self.thumbnail and os.path.exists(self.thumbnail.path):
-            return self.thumbnail.url
-        if self.rendering and os.path.exists(self.rendering.path):
-            return self.rendering.url
-        if self.download and self.mime().is_image() \
-              and os.path.exists(self.download.path) \
-              and self.download.size < settings.MAX_PREVIEW_SIZE:
-                return self.download.url
-        return self.icon_url()
+        return self._file_urls()['thumbnail']
 
     def icon_url(self):
         if not self.download:
@@ -884,7 +960,8 @@ class Gallery(Model):
 
     def save(self, *args, **kwargs):
         set_slug(self)
-        super(Gallery, self).save(*args, **kwargs)
+        save_with_slug(self, lambda **kw: super(Gallery, self).save(*args, **kw),
+                       lambda: set_slug(self), **kwargs)
 
     def get_absolute_url(self):
         if self.category:
@@ -924,10 +1001,8 @@ class Gallery(Model):
     def refresh_all(self):
         """Calculate final vote counts now it's over"""
         if self.is_counting or self.is_finished:
-            for item in self.items.filter(liked=-1):
-                # XXX Could calculate vote scoring here if we do multi-voting
-                item.liked = item.votes.count()
-                item.save()
+            # XXX Could calculate vote scoring here if we do multi-voting
+            self.items.all().refresh_votes()
 
     @property
     def value(self):
@@ -960,7 +1035,17 @@ class Gallery(Model):
         return self.items.count()
 
 
-class VoteManager(Manager):
+class VoteQuerySet(QuerySet):
+    def retract(self):
+        """Delete these votes and take them away from their resource's likes"""
+        counts = list(self.order_by().values_list('resource_id')\
+                          .annotate(count=Count('pk')))
+        self.delete()
+        for (resource_id, count) in counts:
+            Resource.objects.filter(pk=resource_id).add_likes(-count)
+        return sum(count for (_, count) in counts)
+
+class VoteManager(Manager.from_queryset(VoteQuerySet)):
     def items(self):
         """Turns a Vote selection into a Resource selection, translating the filters"""
         return Resource.objects.filter(published=True,\
@@ -971,9 +1056,16 @@ class VoteManager(Manager):
         if 'resource' in self.core_filters:
             resource = self.core_filters['resource']
             resource.liked = self.count()
-            resource.save()
+            Resource.objects.filter(pk=resource.pk).update(liked=resource.liked)
             return resource
 
+    def cast(self, voter):
+        """Add a vote by this voter for the resource, counting it once"""
+        (vote, created) = self.get_or_create(voter_id=voter.pk)
+        if created:
+            Resource.objects.filter(pk=vote.resource_id).add_likes(1)
+        return vote
+
 class Vote(Model):
     """Vote for a resource in some way"""
     resource = ForeignKey(Resource, related_name='votes')
@@ -990,6 +1082,52 @@ class Quota(Model):
     def __str__(self):
         return str(self.group)
 
+
+class DiskUsageManager(Manager):
+    def used_by(self, user=None, group=None):
+        """Returns the stored usage, counting it up the first time it's needed"""
+        kw = {'user': user} if group is None else {'group': group}
+        try:
+            return self.get(**kw).used
+        except DiskUsage.DoesNotExist:
+            (obj, _) = self.get_or_create(defaults={'used': DiskUsage.count(**kw)}, **kw)
+            return obj.used
+
+    def adjust(self, resource, delta):
+        """Atomically add delta bytes to the resource's user and group counts"""
+        groups = Group.objects.filter(galleries__items=resource.pk)
+        # Each row is updated once, however many of its galleries hold the resource
+        self.filter(Q(user_id=resource.user_id) | Q(group__in=groups))\
+            .update(used=F('used') + delta)
+
+    def reset(self, galleries):
+        """Forget the usage for the groups owning these galleries, they will
+        be counted again on the next read"""
+        self.filter(group__galleries__in=galleries).delete()
+
+
+class DiskUsage(Model):
+    """How much disk space each user or group is using (bytes)"""
+    user = OneToOneField(settings.AUTH_USER_MODEL, related_name='disk_usage', **null)
+    group = OneToOneField(Group, related_name='disk_usage', **null)
+    used = BigIntegerField(default=0)
+
+    objects = DiskUsageManager()
+
+    def __str__(self):
+        return str(self.group or self.user)
+
+    @staticmethod
+    def count(user=None, group=None):
+        """Add up the download sizes for this user or group from scratch,
+        a resource in more than one of the group's galleries is counted once."""
+        if group is not None:
+            qset = Resource.objects.filter(
+                pk__in=Resource.objects.filter(galleries__group=group).values('pk'))
+        else:
+            qset = Resource.objects.filter(user=user)
+        return qset.aggregate(Sum('download_size'))['download_size__sum'] or 0
+
 # ------------- CMS ------------ #
 
 from cms.models import CMSPlugin
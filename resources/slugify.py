@@ -18,42 +18,76 @@
 # along with inkscape-web.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+"""
+Allocate unique slugs, numbered suffixes are added to slugs already in use.
+"""
+
+import re
+
 from django.utils.text import slugify
+from django.db import IntegrityError, transaction
 from django.db.models import Q
+from django.db.models.functions import Length
+
+# How many times to try saving when another save takes the same slug
+SLUG_RETRIES = 5
 
-def unique_slug(model, proposed, field='slug'):
-    """Return a unique slug that doesn't exist already"""
-    qset = Q(**{field: proposed}) | Q(**{field+'__startswith': proposed+'+'})
-    existing = model.objects.filter(qset).values_list(field, flat=True)
+def next_slug(obj, proposed, field='slug', sep='+'):
+    """
+    Return the proposed slug, or the proposed slug with the next numbered
+    suffix if it's already in use. The highest suffix is found in one query.
+    """
+    model = type(obj)
+    max_length = obj._meta.get_field(field).max_length
+    if max_length and len(proposed) > max_length - 5:
+        proposed = proposed[:max_length - 5]
 
-    for increment in [u'%s+%d' % (proposed, x) for x in range(len(existing))]:
-        if increment not in existing:
-            return increment
-    return proposed
+    pattern = r'^%s%s[0-9]+$' % (re.escape(proposed), re.escape(sep))
+    qset = model._default_manager.filter(
+        Q(**{field: proposed}) |
+        Q(**{field + '__startswith': proposed + sep, field + '__regex': pattern}))
+    if obj.pk is not None:
+        qset = qset.exclude(pk=obj.pk)
+
+    last = qset.order_by(Length(field).desc(), '-' + field)\
+               .values_list(field, flat=True).first()
+    if last is None:
+        return proposed
+    if last == proposed:
+        return "%s%s0" % (proposed, sep)
+    index = int(last.rsplit(sep, 1)[-1]) + 1
+    if index > 9999:
+        # Longer suffixes wouldn't fit in the space kept for them above
+        raise ValueError("Too many slugs with the same name!")
+    return "%s%s%d" % (proposed, sep, index)
 
 
 def set_slug(obj, field='slug', source='name'):
     """Sets a slug attribute smartly"""
-    is_unique = obj._meta.get_field(field).unique
-
     original = (getattr(obj, field, '') or '').rsplit('+', 1)[0]
     proposed = slugify(str(getattr(obj, source)))
 
     if not original or proposed != original:
-        if is_unique:
-            proposed = get_unique_slug(obj, field, proposed)
-        setattr(obj, field, unique_slug(type(obj), proposed, field=field))
+        setattr(obj, field, next_slug(obj, proposed, field=field))
 
     return getattr(obj, field)
 
-def get_unique_slug(obj, field, slug):
-    """Test the database and keep mutating the slug until it's unique"""
-    original = slug
-    index = 1
-    # Test if this object already exists
-    while type(obj).objects.filter(**{field: slug}):
-        slug = "{}+{}".format(original, index)
-        index += 1
-        if index > 9999:
-            raise ValueError("Too many slugs with the same name!")
-    return slug
+
+def save_with_slug(obj, save, allocate, field='slug', **kwargs):
+    """
+    Call save(**kwargs), if another save took the same slug at the same
+    time, the slug is cleared and allocate() is called to pick another.
+    """
+    for attempt in range(SLUG_RETRIES):
+        try:
+            with transaction.atomic():
+                return save(**kwargs)
+        except IntegrityError:
+            slug = getattr(obj, field)
+            taken = type(obj)._default_manager.filter(**{field: slug})
+            if obj.pk is not None:
+                taken = taken.exclude(pk=obj.pk)
+            if attempt + 1 == SLUG_RETRIES or not taken.exists():
+                raise
+            setattr(obj, field, None)
+            allocate()
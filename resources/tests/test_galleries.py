@@ -92,6 +92,40 @@ class GalleryUserTests(BaseCase):
                 self.assertIn(item, response.context['object_list'])
                 self.assertContains(response, item.name)
 
+    def test_category_counts(self):
+        """The sidebar counts are the same as counting each item separately"""
+        for kwargs in ({}, {'category': 'ui-mockup'}, {'username': self.user.username}):
+            response = self.assertGet('resources', status=200, **kwargs)
+            view = response.context['view']
+            self.assertGreater(len(response.context['categories']), 1)
+            for cat in response.context['categories']:
+                for item in cat:
+                    self.assertEqual(item.count, view.get_count(cat.cid, item),
+                                     "Count for %s in %s is not correct" % (item, cat.cid))
+
+    def test_listing_queries(self):
+        """Gallery pages use the same number of queries however many items"""
+        gallery = Gallery.objects.create(name="Listing", user=self.user)
+        base = Resource.objects.filter(published=True, license__isnull=False)[0]
+        Resource.objects.bulk_create([
+            Resource(name="Listed %d" % num, slug="listed-%d" % num, user=self.user,
+                     published=True, created=now(),
+                     license=base.license, category=base.category)
+            for num in range(200)])
+        gallery.items.set(Resource.objects.filter(name__startswith="Listed "))
+
+        for size in (20, 200):
+            with self.assertNumQueries(3):
+                items = Resource.objects.filter(name__startswith="Listed ").listing()[:size]
+                for item in items:
+                    item.get_absolute_url()
+                    item.summary_string()
+                    str(item.license)
+                    str(item.category)
+                    self.assertEqual(item.gallery, gallery)
+                    list(item.tags.all())
+                self.assertEqual(len(items), size)
+
     def test_sort_global_gallery(self):
         "test if ordering for global galleries works as expected"
         resources = Resource.objects.filter(published=True)
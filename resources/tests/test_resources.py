@@ -25,10 +25,21 @@ Test Resource Items and Lists
 __all__ = ('ResourceTests', 'ResourceAnonTests')
 
 import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
 
-from resources.models import Resource, Quota, Gallery
+from resources.models import Resource, Quota, Gallery, DiskUsage, Vote
 from resources.forms import ResourceForm, ResourceEditPasteForm, ResourcePasteForm
 from resources.video_url import video_detect
+from resources import counters
+
+from inkscape.models import FastlyPurge
+from inkscape.fastly_cache import StubFastlyCache
+
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import DatabaseError
 
 from person.models import User
 
@@ -37,7 +48,7 @@ from .base import BaseCase
 class ResourceTests(BaseCase):
     """Test non-request functions and methods"""
     def test_slug(self):
-        """Unique slug creation"""
+        """Unique slug creation, numbered after the highest suffix"""
         data = {
           'name': 'Test Resource Title',
           'user': User.objects.get(pk=1),
@@ -50,7 +61,26 @@ class ResourceTests(BaseCase):
         self.assertEqual(now.slug, 'test-resource-title+1')
         two.delete()
         now = Resource.objects.create(**data)
-        self.assertEqual(now.slug, 'test-resource-title+0')
+        self.assertEqual(now.slug, 'test-resource-title+2')
+        Resource.objects.filter(pk=now.pk).update(slug='test-resource-title+10')
+        now = Resource.objects.create(**data)
+        self.assertEqual(now.slug, 'test-resource-title+11')
+        Resource.objects.filter(pk=now.pk).update(slug='test-resource-title+9999')
+        with self.assertRaises(ValueError):
+            Resource.objects.create(**data)
+
+    def test_slug_length(self):
+        """Long slugs are shortened to leave room for the numbered suffix"""
+        data = {
+          'name': 'a' * 100,
+          'user': User.objects.get(pk=1),
+        }
+        max_length = Resource._meta.get_field('slug').max_length
+        one = Resource.objects.create(**data)
+        two = Resource.objects.create(**data)
+        self.assertEqual(two.slug, one.slug + '+0')
+        Resource.objects.filter(pk=two.pk).update(slug=one.slug + '+9998')
+        self.assertLessEqual(len(Resource.objects.create(**data).slug), max_length)
 
     def test_file_deletion(self):
         """Check that removal of a Resource removes the corresponding Resource and vice versa"""
@@ -68,6 +98,70 @@ class ResourceTests(BaseCase):
         with self.assertRaises(Resource.DoesNotExist):
             Resource.objects.get(pk=resource.pk)
 
+    def test_spooled_counters(self):
+        """Downloads and views are only added to the resource when flushed"""
+        resource = Resource.objects.all()[0]
+        spool = os.path.join(tempfile.mkdtemp(), 'counters.spool')
+        with self.settings(RESOURCE_COUNTER_WINDOW=300, RESOURCE_COUNTER_SPOOL=spool):
+            counters.flush()
+            counters.record(resource, 'downed')
+            counters.record(resource, 'downed')
+            counters.record(resource, 'viewed')
+            self.assertEqual(Resource.objects.get(pk=resource.pk).downed, resource.downed)
+            self.assertEqual(counters.flush(), 1)
+        updated = Resource.objects.get(pk=resource.pk)
+        self.assertEqual(updated.downed, resource.downed + 2)
+        self.assertEqual(updated.viewed, resource.viewed + 1)
+        self.assertEqual(updated.fullview, resource.fullview)
+
+    def test_spooled_counters_failed(self):
+        """Hits are kept in the spool until a flush has saved them"""
+        resource = Resource.objects.all()[0]
+        spool = os.path.join(tempfile.mkdtemp(), 'counters.spool')
+        with self.settings(RESOURCE_COUNTER_WINDOW=300, RESOURCE_COUNTER_SPOOL=spool):
+            counters.flush()
+            counters.record(resource, 'downed')
+            with patch.object(Resource.objects, 'filter', side_effect=DatabaseError):
+                with self.assertRaises(DatabaseError):
+                    counters.flush()
+                # The request which flushes carries on regardless
+                os.unlink(spool + '.flushed')
+                with self.assertLogs(level='ERROR'):
+                    self.assertEqual(counters.record(resource, 'downed'), 1)
+            self.assertEqual(Resource.objects.get(pk=resource.pk).downed, resource.downed)
+            self.assertEqual(counters.flush(), 1)
+            self.assertEqual(counters.flush(), 0)
+        self.assertEqual(Resource.objects.get(pk=resource.pk).downed, resource.downed + 2)
+
+    def test_purge_queue(self):
+        """Deleted files are queued once and sent to fastly together"""
+        resource = Resource.objects.filter(download__contains='file5.svg')[0]
+        url = resource.download.url
+        FastlyPurge.objects.queue(urls=[url], keys=['cache:Resource'])
+        resource.delete()
+        self.assertEqual(FastlyPurge.objects.filter(target=url).count(), 1)
+        self.assertEqual(FastlyPurge.objects.send(window=60), 0)
+
+        queued = FastlyPurge.objects.count()
+        cache = StubFastlyCache()
+        del cache.purged[:]
+        self.assertEqual(FastlyPurge.objects.send(cache=cache), queued)
+        self.assertEqual(len(cache.purged), queued)
+        self.assertIn(('url', url), cache.purged)
+        self.assertIn(('key', 'cache:Resource'), cache.purged)
+        self.assertFalse(FastlyPurge.objects.exists())
+
+    def test_purge_queue_failed(self):
+        """Purges which fail stay in the queue for next time"""
+        FastlyPurge.objects.queue(urls=['/media/bad.svg', '/media/good.svg'],
+                                  keys=['cache:Resource'])
+        cache = StubFastlyCache()
+        with patch.object(cache, 'purge', lambda url: 'good' in url):
+            with patch.object(cache, 'purge_keys', lambda keys: []):
+                self.assertEqual(FastlyPurge.objects.send(cache=cache), 1)
+        self.assertEqual(set(FastlyPurge.objects.values_list('target', flat=True)),
+                         {'/media/bad.svg', 'cache:Resource'})
+
     def test_media_size(self):
         """Make sure file sizes are reported"""
         svg = Resource.objects.get(download__contains='file5.svg')
@@ -86,6 +180,92 @@ class ResourceTests(BaseCase):
         unknown = Resource.objects.get(media_type__contains='/man').mime()
         self.assertEquals(unknown.icon(), '/static/mime/unknown.svg')
 
+    def test_cached_file_urls(self):
+        """Thumbnail and rendering urls don't look at the disk twice"""
+        resource = Resource.objects.get(download__contains='file5.svg')
+        thumbnail = resource.thumbnail_url()
+        rendering = resource.rendering_url()
+        with patch('os.path.exists') as exists:
+            resource = Resource.objects.get(pk=resource.pk)
+            self.assertEqual(resource.thumbnail_url(), thumbnail)
+            self.assertEqual(resource.rendering_url(), rendering)
+            self.assertFalse(exists.called)
+
+
+class DiskUsageTests(BaseCase):
+    """Stored disk usage for users and groups"""
+    def setUp(self):
+        super(DiskUsageTests, self).setUp()
+        self.user = User.objects.get(pk=2)
+        self.group = Group.objects.get(pk=2)
+        self.resource = Resource.objects.create(name='Sized', user=self.user)
+        Resource.objects.filter(pk=self.resource.pk).update(download_size=1000)
+        self.resource.refresh_from_db()
+
+    def assertUsage(self, group_used):
+        """The stored group usage matches a count from scratch"""
+        self.assertEqual(self.group.resources.disk_usage(), group_used)
+        self.assertEqual(DiskUsage.count(group=self.group), group_used)
+
+    def test_group_counted_once(self):
+        """A resource in two of the group's galleries is counted once"""
+        used = self.group.resources.disk_usage()
+        Gallery.objects.get(pk=3).items.add(self.resource)
+        self.assertUsage(used + 1000)
+        Gallery.objects.get(pk=6).items.add(self.resource)
+        self.assertUsage(used + 1000)
+
+    def test_adjust(self):
+        """Changed sizes are added to the user and the group once"""
+        Gallery.objects.get(pk=3).items.add(self.resource)
+        Gallery.objects.get(pk=6).items.add(self.resource)
+        group_used = self.group.resources.disk_usage()
+        user_used = self.user.resources.disk_usage()
+        DiskUsage.objects.adjust(self.resource, 24)
+        Resource.objects.filter(pk=self.resource.pk).update(download_size=1024)
+        self.assertUsage(group_used + 24)
+        self.assertEqual(self.user.resources.disk_usage(), user_used + 24)
+
+    def test_removed(self):
+        """Removing the resource from the group's galleries is counted"""
+        used = self.group.resources.disk_usage()
+        gallery = Gallery.objects.get(pk=3)
+        gallery.items.add(self.resource)
+        self.assertUsage(used + 1000)
+        gallery.items.remove(self.resource)
+        self.assertUsage(used)
+        self.resource.galleries.add(gallery)
+        self.resource.galleries.clear()
+        self.assertUsage(used)
+
+    def test_deleted(self):
+        """Deleting the resource or the gallery is counted"""
+        used = self.group.resources.disk_usage()
+        Gallery.objects.get(pk=3).items.add(self.resource)
+        self.assertUsage(used + 1000)
+        self.resource.delete()
+        self.assertUsage(used)
+
+        other = Resource.objects.create(name='Other', user=self.user)
+        Resource.objects.filter(pk=other.pk).update(download_size=500)
+        gallery = Gallery.objects.create(user=self.user, group=self.group, name='Extra')
+        gallery.items.add(other)
+        self.assertUsage(used + 500)
+        gallery.delete()
+        self.assertUsage(used)
+
+    def test_moved_gallery(self):
+        """A gallery moved to another group changes both groups"""
+        other = Group.objects.get(pk=1)
+        used = (self.group.resources.disk_usage(), other.resources.disk_usage())
+        gallery = Gallery.objects.get(pk=3)
+        gallery.items.add(self.resource)
+        self.assertUsage(used[0] + 1000)
+        gallery.group = other
+        gallery.save()
+        self.assertUsage(used[0])
+        self.assertEqual(other.resources.disk_usage(), used[1] + 1000)
+
 
 class ResourceViewTests(BaseCase):
     credentials = dict(username='tester', password='123456')
@@ -301,6 +481,19 @@ class UploadViewTests(BaseCase):
         response = self.assertPost('resource.upload', data=self.data, status=200)
         self.assertEqual(Resource.objects.count(), num + 1)
 
+    def test_disk_usage(self):
+        """Uploading files adds to the user's stored disk usage"""
+        used = self.user.resources.disk_usage()
+        size = os.path.getsize(self.download.name)
+
+        response = self.assertPost('resource.upload', data=self.data, status=200)
+        resource = response.context_data['object']
+        self.assertEqual(resource.download_size, size)
+        self.assertEqual(self.user.resources.disk_usage(), used + size)
+
+        resource.delete()
+        self.assertEqual(self.user.resources.disk_usage(), used)
+
     def test_submit_long_filename(self):
         """Submit an item with an extra large filename"""
         for x in range(92, 97):
@@ -595,6 +788,70 @@ class ResourceVoteTests(BaseCase):
         self.assertEqual(Resource.objects.get(pk=resource.pk).liked, num_likes)
 
 
+class VoteCountTests(BaseCase):
+    """The stored likes are kept with F() updates and can be recounted"""
+    def setUp(self):
+        super(VoteCountTests, self).setUp()
+        self.resource = Resource.objects.create(name='Liked', user=User.objects.get(pk=1))
+        self.voters = list(User.objects.exclude(pk=1))
+
+    def liked(self, resource=None):
+        """The stored likes in the database"""
+        return Resource.objects.get(pk=(resource or self.resource).pk).liked
+
+    def test_never_negative(self):
+        """Taking away more likes than there are stops at zero"""
+        qset = Resource.objects.filter(pk=self.resource.pk)
+        qset.add_likes(1)
+        qset.add_likes(-3)
+        self.assertEqual(self.liked(), 0)
+        qset.add_likes(2)
+        self.assertEqual(self.liked(), 2)
+
+    def test_stale_copies(self):
+        """Votes cast through stale copies of the resource are all counted"""
+        copies = [Resource.objects.get(pk=self.resource.pk) for _ in self.voters]
+        for (copy, voter) in zip(copies, self.voters):
+            with self.assertNumQueries(5):
+                # Look for the vote, create it in a savepoint and add it, the likes aren't read
+                copy.votes.cast(voter)
+            copy.votes.cast(voter)
+        self.assertEqual(self.liked(), len(self.voters))
+        copies[0].save()
+        self.assertEqual(self.liked(), len(self.voters))
+
+    def test_retract(self):
+        """Retracted votes are taken away, once per vote"""
+        for voter in self.voters:
+            self.resource.votes.cast(voter)
+        self.assertEqual(Vote.objects.filter(voter=self.voters[0]).retract(), 1)
+        self.assertEqual(Vote.objects.filter(voter=self.voters[0]).retract(), 0)
+        self.assertEqual(self.liked(), len(self.voters) - 1)
+
+    def test_refresh_votes(self):
+        """Likes are recounted from the votes, with no votes being zero"""
+        other = Resource.objects.create(name='Unliked', user=User.objects.get(pk=1))
+        for voter in self.voters:
+            Vote.objects.create(resource=self.resource, voter=voter)
+        Resource.objects.filter(pk__in=[self.resource.pk, other.pk]).update(liked=40)
+        with self.assertNumQueries(1):
+            Resource.objects.filter(pk__in=[self.resource.pk, other.pk]).refresh_votes()
+        self.assertEqual(self.liked(), len(self.voters))
+        self.assertEqual(self.liked(other), 0)
+
+    def test_refresh_command(self):
+        """The command recounts all, or just the items in a gallery"""
+        gallery = Gallery.objects.get(pk=1)
+        gallery.items.add(self.resource)
+        Vote.objects.create(resource=self.resource, voter=self.voters[0])
+        Resource.objects.filter(pk=self.resource.pk).update(liked=40)
+        call_command('refresh_votes', galleries=[gallery.slug], stdout=StringIO())
+        self.assertEqual(self.liked(), 1)
+        Resource.objects.filter(pk=self.resource.pk).update(liked=40)
+        call_command('refresh_votes', stdout=StringIO())
+        self.assertEqual(self.liked(), 1)
+
+
 class ResourceAnonTests(BaseCase):
     """Tests for AnonymousUser"""
     
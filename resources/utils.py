@@ -136,6 +136,10 @@ mimetypes.add_type('application/x-msi', 'msi')
 mimetypes.add_type('application/x-7z-compressed', '7z')
 mimetypes.add_type('application/x-gimp-palette', '.gpl')
 
+# Static files don't change while the process is running, so the icon found
+# for each mime type is remembered here instead of searching every time.
+MIME_ICONS = {}
+
 class MimeType(object):
     """Translate mime type to icons and do other useful conversions"""
     type_tr = {
@@ -204,6 +208,13 @@ class MimeType(object):
 
     def icon(self, subdir=""):
         """Returns the icon for use in showing mimetypes"""
+        key = (str(self), subdir)
+        if key not in MIME_ICONS:
+            MIME_ICONS[key] = self.find_icon(subdir)
+        return MIME_ICONS[key]
+
+    def find_icon(self, subdir=""):
+        """Look through the static files for the best icon (slow, see icon)"""
         for ft_icon in [self.subtype(), self.type(), self.minor, self.major, 'unknown']:
             filename = os.path.join(MIME_DIR, subdir, ft_icon+'.svg')
             if finders.find(filename):
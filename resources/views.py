@@ -38,6 +38,7 @@ from django.db.models import Q
 
 from person.models import User, Team
 
+from . import counters
 from .utils import RemoteError
 from .video_url import parse_any_url
 from .category_views import CategoryListView
@@ -380,17 +381,12 @@ class VoteResource(SingleObjectMixin, OwnerCreateMixin, RedirectView):
         msg = self.msg['done']
         if gallery and gallery.contest_submit and like:
             # Delete existing contest votes.
-            for vote in self.contest_vote(item):
-                resource = vote.resource
-                vote.delete()
-                resource.votes.refresh()
+            if self.contest_vote(item).retract():
                 msg = self.msg['prev']
         if like:
-            item.votes.get_or_create(voter_id=self.request.user.pk)
+            item.votes.cast(self.request.user)
         else:
-            item.votes.filter(voter_id=self.request.user.pk).delete()
-        # Update the Resource item's vote count (for easier lookup)
-        item.votes.refresh()
+            item.votes.filter(voter_id=self.request.user.pk).retract()
         messages.info(self.request, msg)
 
     def contest_vote(self, item):
@@ -430,15 +426,13 @@ class DownloadResource(ViewResource):
         if func is None:
             if item.mime().is_text():
                 return super(DownloadResource, self).get(request, *args, **kwargs)
-            item.fullview += 1
-            item.save(update_fields=('fullview',))
+            counters.record(item, 'fullview')
             return redirect(item.download.url)
 
         # Otherwise the user intends to download the file and we record it as
         # such before passing the download path to nginx for delivery using a
         # content despatch to force the browser into saving-as.
-        item.downed += 1
-        item.save(update_fields=('downed',))
+        counters.record(item, 'downed')
 
         if func not in ['download', item.filename()]:
             messages.warning(request, _('Can not find file \'%s\', please retry download.') % func)
@@ -502,6 +496,11 @@ class ResourceList(CategoryListView):
             return ['resources/resourcegallery_specific.html']
         return ['resources/resourcegallery_general.html']
 
+    def paginate_queryset(self, queryset, page_size):
+        if hasattr(queryset, 'listing'):
+            queryset = queryset.listing()
+        return super().paginate_queryset(queryset, page_size)
+
     def extra_filters(self):
         if not self.is_user and not self.in_team:
             return dict(published=True)